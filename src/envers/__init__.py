@@ -3,19 +3,67 @@
 
 from __future__ import annotations
 
-from importlib import metadata as importlib_metadata
+from typing import Any
+
+from envers.errors import (
+    DataLockNotFoundError,
+    EnversError,
+    InvalidDataLockError,
+    InvalidOptionError,
+    InvalidPasswordError,
+    InvalidSpecError,
+    PasswordRequiredError,
+    ProfileNotFoundError,
+    ReleaseNotFoundError,
+    TemplateError,
+)
+
+# functions of the library API (see envers.api), imported on first access
+# so the CLI does not import cryptography at startup
+_API_FUNCTIONS = ("load", "load_environ", "load_files", "load_releases")
 
 
 def get_version() -> str:
     """Return the program version."""
+    # importlib.metadata is slow to import, so it is only imported when the
+    # version is requested
+    from importlib import metadata as importlib_metadata
+
     try:
         return importlib_metadata.version(__name__)
     except importlib_metadata.PackageNotFoundError:  # pragma: no cover
         return "0.4.1"  # semantic-release
 
 
-version = get_version()
+def __getattr__(name: str) -> Any:
+    """Return the version and the API functions on the first access."""
+    if name in ("version", "__version__"):
+        globals()["version"] = globals()["__version__"] = get_version()
+        return globals()[name]
+    if name in _API_FUNCTIONS:
+        from envers import api
+
+        globals()[name] = getattr(api, name)
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-__version__ = version
 __author__ = "Ivan Ogasawara"
 __email__ = "ivan.ogasawara@gmail.com"
+
+__all__ = [
+    "DataLockNotFoundError",
+    "EnversError",
+    "InvalidDataLockError",
+    "InvalidOptionError",
+    "InvalidPasswordError",
+    "InvalidSpecError",
+    "PasswordRequiredError",
+    "ProfileNotFoundError",
+    "ReleaseNotFoundError",
+    "TemplateError",
+    "load",
+    "load_environ",
+    "load_files",
+    "load_releases",
+]
@@ -0,0 +1,229 @@
+"""
+Session agent that keeps derived keys in memory.
+
+The agent works like `ssh-agent`: it runs in the background, listening on
+a Unix socket only accessible by the current user, and serves the keys
+derived during the session, so the following envers commands can skip the
+password prompt and the key derivation. The clients only use the agent
+when the environment variable `ENVERS_AGENT_SOCK` is set.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+from envers.files import private_socket
+
+if TYPE_CHECKING:
+    # only for annotations, the agent does not need cryptography to run
+    from envers.crypt import LockHeader
+
+AGENT_SOCKET_ENV = "ENVERS_AGENT_SOCK"
+AGENT_DEFAULT_TTL = 3600
+# timeout (in seconds) for the client requests
+AGENT_TIMEOUT = 2.0
+AGENT_MAX_MESSAGE_SIZE = 65536
+
+
+def get_key_id(header: LockHeader) -> str:
+    """Return the identifier of the key used by the given header."""
+    kdf_fields = ",".join(
+        f"{name}={value}" for name, value in header.kdf.to_fields().items()
+    )
+    return hashlib.sha256(header.salt + kdf_fields.encode("utf-8")).hexdigest()
+
+
+def get_default_socket_path() -> Path:
+    """Return the default path for the agent socket."""
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return Path(runtime_dir) / f"envers-{os.getuid()}" / "agent.sock"
+
+
+def get_socket_path() -> Optional[Path]:
+    """Return the socket path of the running agent, if it is configured."""
+    socket_path = os.getenv(AGENT_SOCKET_ENV, "")
+    return Path(socket_path) if socket_path else None
+
+
+class KeyStore:
+    """Thread-safe in-memory store of keys with expiration time."""
+
+    def __init__(self, ttl: int = AGENT_DEFAULT_TTL) -> None:
+        self.ttl = ttl
+        self._keys: dict[str, tuple[bytearray, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key_id: str, key: bytes, ttl: Optional[int] = None) -> None:
+        """Store a key for the given time to live (in seconds)."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._discard(key_id)
+            self._keys[key_id] = (bytearray(key), expires_at)
+
+    def get(self, key_id: str) -> Optional[bytes]:
+        """Return the key for the given id, if it is not expired."""
+        with self._lock:
+            if key_id not in self._keys:
+                return None
+            key, expires_at = self._keys[key_id]
+            if expires_at <= time.monotonic():
+                self._discard(key_id)
+                return None
+            return bytes(key)
+
+    def expire(self) -> None:
+        """Wipe and remove all the expired keys."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                key_id
+                for key_id, (_, expires_at) in self._keys.items()
+                if expires_at <= now
+            ]
+            for key_id in expired:
+                self._discard(key_id)
+
+    def clear(self) -> None:
+        """Wipe and remove all the keys."""
+        with self._lock:
+            for key_id in list(self._keys):
+                self._discard(key_id)
+
+    def __len__(self) -> int:
+        """Return the number of keys in the store."""
+        return len(self._keys)
+
+    def _discard(self, key_id: str) -> None:
+        entry = self._keys.pop(key_id, None)
+        if entry is not None:
+            key = entry[0]
+            key[:] = bytes(len(key))
+
+
+class _AgentRequestHandler(socketserver.StreamRequestHandler):
+    """Handle one JSON request per connection."""
+
+    server: AgentServer
+
+    def handle(self) -> None:
+        line = self.rfile.readline(AGENT_MAX_MESSAGE_SIZE)
+        try:
+            request = json.loads(line)
+            response = self.server.dispatch(request)
+        except (ValueError, KeyError, TypeError):
+            response = {"ok": False, "error": "invalid request"}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+        if self.server.stopping:
+            # shutdown blocks until serve_forever returns, so it cannot be
+            # called from the request thread directly
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server that serves the keys of a KeyStore."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, ttl: int = AGENT_DEFAULT_TTL):
+        self.socket_path = Path(socket_path)
+        self.store = KeyStore(ttl)
+        self.stopping = False
+
+        with private_socket(self.socket_path):
+            super().__init__(str(self.socket_path), _AgentRequestHandler)
+
+    def dispatch(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Execute the given request and return the response."""
+        op = request["op"]
+        if op == "get":
+            key = self.store.get(str(request["id"]))
+            if key is None:
+                return {"ok": False, "error": "key not found"}
+            return {"ok": True, "key": key.decode("utf-8")}
+        if op == "add":
+            ttl = request.get("ttl")
+            self.store.add(
+                str(request["id"]),
+                str(request["key"]).encode("utf-8"),
+                None if ttl is None else int(ttl),
+            )
+            return {"ok": True}
+        if op == "clear":
+            self.store.clear()
+            return {"ok": True}
+        if op == "stop":
+            self.stopping = True
+            return {"ok": True}
+        return {"ok": False, "error": f"unknown operation: {op}"}
+
+    def service_actions(self) -> None:
+        """Drop the expired keys between requests."""
+        self.store.expire()
+
+    def server_close(self) -> None:
+        """Close the server, wiping the keys and removing the socket."""
+        super().server_close()
+        self.store.clear()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+
+def request(
+    message: dict[str, Any], socket_path: Optional[Path] = None
+) -> Optional[dict[str, Any]]:
+    """
+    Send a request to the agent.
+
+    Returns None when the agent is not configured or not reachable.
+    """
+    socket_path = socket_path or get_socket_path()
+    if socket_path is None:
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(AGENT_TIMEOUT)
+            client.connect(str(socket_path))
+            client.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            with client.makefile("rb") as response:
+                data = response.readline(AGENT_MAX_MESSAGE_SIZE)
+    except OSError:
+        return None
+
+    try:
+        return dict(json.loads(data))
+    except ValueError:
+        return None
+
+
+def get_key(header: LockHeader) -> Optional[bytes]:
+    """Return the key for the given header from the agent, if available."""
+    response = request({"op": "get", "id": get_key_id(header)})
+    if not response or not response.get("ok"):
+        return None
+    return str(response["key"]).encode("utf-8")
+
+
+def add_key(header: LockHeader, key: bytes, ttl: Optional[int] = None) -> bool:
+    """Add the key for the given header to the agent, if available."""
+    message: dict[str, Any] = {
+        "op": "add",
+        "id": get_key_id(header),
+        "key": key.decode("utf-8"),
+    }
+    if ttl is not None:
+        message["ttl"] = ttl
+    response = request(message)
+    return bool(response and response.get("ok"))
@@ -0,0 +1,313 @@
+"""
+Library API to load the profiles from Python code.
+
+The functions here read the variables straight from the data lock files,
+without writing the environment files, so services can load their
+configuration at startup without running the envers CLI. They never
+prompt or exit the process: the failures raise the exceptions defined in
+envers.errors.
+"""
+
+from __future__ import annotations
+
+import os
+
+from pathlib import Path
+from typing import Any, Iterable, MutableMapping, Optional, Union
+
+from cryptography.fernet import InvalidToken
+
+from envers import agent, crypt, lockfile, templates
+from envers.errors import (
+    DataLockNotFoundError,
+    InvalidDataLockError,
+    InvalidPasswordError,
+    PasswordRequiredError,
+    ProfileNotFoundError,
+    ReleaseNotFoundError,
+)
+from envers.timings import span
+from envers.values import get_profile_vars
+
+
+def _get_key(
+    profile: str, header: crypt.LockHeader, password: Optional[str]
+) -> tuple[bytes, bool]:
+    """
+    Return the key of a data lock without prompting.
+
+    Without a password, the key is requested to the session agent and then
+    derived from the password in `ENVERS_PASSWORD_<PROFILE>` or
+    `ENVERS_PASSWORD`. Returns the key, and if it was derived from a
+    password: it is added to the agent (see `_add_key`) once verified.
+    """
+    if password is None:
+        key = agent.get_key(header)
+        if key is not None:
+            return key, False
+        password = crypt.get_profile_passwords([profile]).get(profile)
+        if password is None:
+            raise PasswordRequiredError(
+                f"No password was given for profile '{profile}'."
+            )
+
+    return crypt.create_fernet_key(password, header.salt, header.kdf), True
+
+
+def _add_key(header: crypt.LockHeader, key: bytes, derived: bool) -> None:
+    """Add a verified key to the agent, if it was derived from a password."""
+    if derived:
+        agent.add_key(header, key)
+
+
+def _format_env_value(value: Any) -> str:
+    """Return the value as it is read back from an environment file."""
+    return "" if value is None else str(value)
+
+
+def _read_data_lock(profile: str, root: Union[str, Path]) -> lockfile.DataLock:
+    """Read the data lock file of a profile, without decrypting it."""
+    data_file = Path(root) / ".envers" / "data" / f"{profile}.lock"
+
+    try:
+        raw_data = data_file.read_text()
+    except FileNotFoundError:
+        raise DataLockNotFoundError(
+            f"Data lock file for profile '{profile}' not found."
+        )
+
+    try:
+        return lockfile.DataLock.loads(raw_data)
+    except Exception as e:
+        raise InvalidDataLockError(
+            f"The data lock file for profile '{profile}' is not valid."
+        ) from e
+
+
+def _get_profile_files(
+    release: dict[str, Any], profile: str
+) -> Optional[dict[str, dict[str, str]]]:
+    """
+    Return the variables of each file of the profile in a release.
+
+    The references to other variables are resolved (see envers.templates),
+    so it raises TemplateError when they are not valid.
+    """
+    profile_data = release.get("data", {}).get(profile)
+    if profile_data is None:
+        return None
+
+    with span("render"):
+        files = templates.render_files(get_profile_vars(profile_data))
+        return {
+            file_path: {
+                name: _format_env_value(value)
+                for name, value in variables.items()
+            }
+            for file_path, variables in files.items()
+        }
+
+
+def load_files(
+    profile: str,
+    spec: str,
+    password: Optional[str] = None,
+    root: Union[str, Path] = ".",
+) -> dict[str, dict[str, str]]:
+    """
+    Return the variables of each environment file of a profile.
+
+    Parameters
+    ----------
+    profile : str
+        The name of the profile to load.
+    spec : str
+        The version of the spec to use.
+    password : Optional[str]
+        The password of the profile. Defaults to the key in the session
+        agent, or to the password in `ENVERS_PASSWORD_<PROFILE>` or
+        `ENVERS_PASSWORD`.
+    root : Union[str, Path]
+        The directory with the `.envers` folder. Defaults to the current
+        directory.
+
+    Returns
+    -------
+    dict[str, dict[str, str]]
+        The variables (as strings) by file path, as defined by the spec.
+
+    Raises
+    ------
+    EnversError
+        One of its subclasses, when the profile cannot be loaded.
+    """
+    data_lock = _read_data_lock(profile, root)
+    key, derived = _get_key(profile, data_lock.header, password)
+
+    try:
+        release = data_lock.get_release(spec, key)
+    except InvalidToken:
+        raise InvalidPasswordError(
+            f"The given password for profile '{profile}' is not correct."
+        )
+    except Exception as e:
+        raise InvalidDataLockError(
+            f"The data lock file for profile '{profile}' is not valid."
+        ) from e
+    _add_key(data_lock.header, key, derived)
+
+    if not release:
+        raise ReleaseNotFoundError(
+            f"Version {spec} not found in the data lock file of profile "
+            f"'{profile}'."
+        )
+
+    profile_files = _get_profile_files(release, profile)
+    if profile_files is None:
+        raise ProfileNotFoundError(
+            f"Profile '{profile}' not found in version {spec}."
+        )
+    return profile_files
+
+
+def get_profile_key(
+    profile: str,
+    password: Optional[str] = None,
+    root: Union[str, Path] = ".",
+) -> bytes:
+    """
+    Return the key of the data lock file of a profile.
+
+    The parameters are the same of `load_files`. The key can be kept
+    instead of the password to read the data lock file again, as long as
+    it is not rekeyed. Raises InvalidPasswordError when the password is
+    not correct.
+    """
+    data_lock = _read_data_lock(profile, root)
+    key, derived = _get_key(profile, data_lock.header, password)
+    try:
+        data_lock.verify(key)
+    except InvalidToken:
+        raise InvalidPasswordError(
+            f"The given password for profile '{profile}' is not correct."
+        )
+    _add_key(data_lock.header, key, derived)
+    return key
+
+
+def load_releases(
+    profile: str,
+    password: Optional[str] = None,
+    root: Union[str, Path] = ".",
+    key: Optional[bytes] = None,
+) -> dict[str, dict[str, dict[str, str]]]:
+    """
+    Return the variables of each file of a profile, for all the releases.
+
+    The parameters are the same of `load_files`, and the `key` of the data
+    lock (see `get_profile_key`) can be given instead of the password. The
+    releases that do not define the profile are not returned.
+
+    Returns
+    -------
+    dict[str, dict[str, dict[str, str]]]
+        The variables (as strings) by file path, by spec version.
+    """
+    data_lock = _read_data_lock(profile, root)
+    derived = False
+    if key is None:
+        key, derived = _get_key(profile, data_lock.header, password)
+
+    try:
+        data = data_lock.to_dict(key)
+    except InvalidToken:
+        raise InvalidPasswordError(
+            f"The given password for profile '{profile}' is not correct."
+        )
+    except Exception as e:
+        raise InvalidDataLockError(
+            f"The data lock file for profile '{profile}' is not valid."
+        ) from e
+    _add_key(data_lock.header, key, derived)
+
+    releases = {}
+    for spec, release in data["releases"].items():
+        profile_files = _get_profile_files(release, profile)
+        if profile_files is not None:
+            releases[spec] = profile_files
+    return releases
+
+
+def load(
+    profile: str,
+    spec: str,
+    password: Optional[str] = None,
+    root: Union[str, Path] = ".",
+    files: Optional[Iterable[str]] = None,
+    environ: Optional[MutableMapping[str, str]] = None,
+    override: bool = True,
+) -> dict[str, str]:
+    """
+    Return the variables of a profile, optionally setting them in `environ`.
+
+    Parameters
+    ----------
+    profile : str
+        The name of the profile to load.
+    spec : str
+        The version of the spec to use.
+    password : Optional[str]
+        The password of the profile (see `load_files`).
+    root : Union[str, Path]
+        The directory with the `.envers` folder. Defaults to the current
+        directory.
+    files : Optional[Iterable[str]]
+        The environment files (as defined by the spec) to load, in order of
+        precedence from the lowest. Defaults to all the files, in the spec
+        order.
+    environ : Optional[MutableMapping[str, str]]
+        The mapping where the variables are set, e.g. `os.environ`. By
+        default, the variables are only returned.
+    override : bool
+        If the variables already in `environ` are replaced.
+
+    Returns
+    -------
+    dict[str, str]
+        The variables of the selected files.
+
+    Raises
+    ------
+    EnversError
+        One of its subclasses, when the profile cannot be loaded.
+    """
+    profile_files = load_files(profile, spec, password, root)
+
+    variables: dict[str, str] = {}
+    for file_path in profile_files if files is None else files:
+        if file_path not in profile_files:
+            raise ProfileNotFoundError(
+                f"File {file_path} not found in profile '{profile}' of "
+                f"version {spec}."
+            )
+        variables.update(profile_files[file_path])
+
+    if environ is not None:
+        for name, value in variables.items():
+            if override or name not in environ:
+                environ[name] = value
+    return variables
+
+
+def load_environ(
+    profile: str,
+    spec: str,
+    password: Optional[str] = None,
+    root: Union[str, Path] = ".",
+    files: Optional[Iterable[str]] = None,
+    override: bool = True,
+) -> dict[str, str]:
+    """Load the variables of a profile into `os.environ` (see `load`)."""
+    return load(
+        profile, spec, password, root, files, os.environ, override=override
+    )
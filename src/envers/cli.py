@@ -2,17 +2,24 @@
 
 from __future__ import annotations
 
+import sys
+
 from pathlib import Path
+from typing import Any, List, Optional
 
 import typer
 
 from typer import Context, Option
 from typing_extensions import Annotated
 
-from envers import __version__
-from envers.core import Envers
+# only the lightweight modules are imported here, the commands import the
+# rest (cryptography, yaml, dotenv, ...) when they run, so `--help` and
+# `--version` start fast
+from envers import agent, timings
 
 app = typer.Typer()
+agent_app = typer.Typer(help="Manage the envers session agent.")
+app.add_typer(agent_app, name="agent")
 
 
 @app.callback(invoke_without_command=True)
@@ -25,9 +32,25 @@ def main(
         is_flag=True,
         help="Show the version and exit.",
     ),
+    show_timings: bool = Option(
+        False,
+        "--timings",
+        help=(
+            "Print the time spent in each phase (key derivation, "
+            "decryption, parsing, ...) to stderr."
+        ),
+    ),
 ) -> None:
-    """Process envers for specific flags, otherwise show the help menu."""
+    """
+    Process envers for specific flags, otherwise show the help menu.
+
+    With ENVERS_PROFILE=<path>, the command writes a JSON line per timed
+    phase to the path when it ends with .json or .jsonl, and a cProfile
+    dump otherwise.
+    """
     if version:
+        from envers import __version__
+
         typer.echo(f"Version: {__version__}")
         raise typer.Exit()
 
@@ -35,6 +58,11 @@ def main(
         typer.echo(ctx.get_help())
         raise typer.Exit(0)
 
+    # the timings are reported when the command finishes
+    ctx.with_resource(
+        timings.run(show_timings, lambda line: typer.echo(line, err=True))
+    )
+
 
 @app.command()
 def init(path: str = ".") -> None:
@@ -55,6 +83,8 @@ def init(path: str = ".") -> None:
     None
 
     """
+    from envers.core import Envers
+
     envers = Envers()
     envers.init(Path(path))
 
@@ -67,44 +97,137 @@ def deploy(
     spec: Annotated[
         str, typer.Option(help="The version of the spec to use.")
     ] = "",
+    seed_from: Annotated[
+        str,
+        typer.Option(
+            help="Copy the values of the new variables from this version."
+        ),
+    ] = "",
 ) -> None:
-    """Deploy a specific version from the spec file."""
+    """
+    Deploy a specific version from the spec file.
+
+    Deploying a version again keeps the values already set, only the
+    variables added to or removed from the spec are changed.
+    """
+    from envers.core import Envers
+
     envers = Envers()
-    envers.deploy(profile, spec)
+    envers.deploy(profile, spec, seed_from=seed_from)
 
 
 @app.command()
-def draft(version: str, from_spec: str = "", from_env: str = "") -> None:
+def draft(
+    version: str,
+    from_spec: str = "",
+    from_env: Annotated[
+        Optional[List[str]],
+        typer.Option(
+            help=(
+                "A .env file or glob pattern (e.g. 'services/**/.env') to "
+                "import, it can be given several times."
+            ),
+            show_default=False,
+        ),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            min=0,
+            help=(
+                "The maximum number of .env files read at the same time "
+                "(0 chooses it automatically)."
+            ),
+        ),
+    ] = 0,
+) -> None:
     """Create a new version draft in the spec file."""
+    from envers.core import Envers
+
     envers = Envers()
-    envers.draft(version, from_spec, from_env)
+    envers.draft(version, from_spec, from_env or [], jobs)
 
 
 @app.command()
 def profile_set(
+    assignments: Annotated[
+        Optional[List[str]],
+        typer.Argument(
+            help="Values to set, as NAME=value.", show_default=False
+        ),
+    ] = None,
     profile: Annotated[
         str, typer.Option(help="The name of the profile to set values for.")
     ] = "",
     spec: Annotated[
         str, typer.Option(help="The version of the spec to use.")
     ] = "",
+    from_file: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "Read the values from a dotenv, JSON or YAML file "
+                "(- for stdin)."
+            ),
+        ),
+    ] = "",
+    value_format: Annotated[
+        str,
+        typer.Option(
+            "--format",
+            help=(
+                "The format of --from-file (dotenv, json or yaml). Defaults "
+                "to the file extension, or dotenv."
+            ),
+        ),
+    ] = "",
+    file: Annotated[
+        str,
+        typer.Option(help="Set the given variables only in this file."),
+    ] = "",
+    strict: Annotated[
+        bool,
+        typer.Option(help="Fail on variables not defined by the spec."),
+    ] = False,
 ) -> None:
     """
     Set the profile values for a given spec version.
 
-    Parameters
-    ----------
-    profile : str
-        The name of the profile to set values for.
-    spec : str
-        The version of the spec to use.
+    Without values, each value is prompted. The values can be given as
+    NAME=value arguments or read from a file (or stdin) with --from-file;
+    they are validated against the spec and written at once.
 
-    Returns
-    -------
-    None
+    When the values are read from stdin, the password is read from
+    ENVERS_PASSWORD_<PROFILE> or ENVERS_PASSWORD (or the session agent).
     """
+    from envers import crypt, values
+    from envers.core import Envers, raise_error
+
+    new_values: Optional[dict[str, Any]] = None
+    try:
+        if from_file:
+            value_format = value_format or values.detect_format(from_file)
+            if from_file == "-":
+                content = sys.stdin.read()
+            else:
+                content = Path(from_file).read_text()
+            new_values = values.parse_values(content, value_format)
+        if assignments:
+            new_values = {
+                **(new_values or {}),
+                **values.parse_assignments(assignments),
+            }
+    except (OSError, ValueError) as e:
+        raise_error(f"The values could not be read: {e}")
+
+    password = None
+    if new_values is not None:
+        password = crypt.get_profile_passwords([profile]).get(profile)
+
     envers = Envers()
-    envers.profile_set(profile, spec)
+    envers.profile_set(profile, spec, password, new_values, file, strict)
 
 
 @app.command()
@@ -115,10 +238,401 @@ def profile_load(
     spec: Annotated[
         str, typer.Option(help="The version of the spec to use.")
     ] = "",
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            min=0,
+            help=(
+                "The maximum number of files written at the same time "
+                "(0 chooses it automatically)."
+            ),
+        ),
+    ] = 0,
 ) -> None:
     """Load a specific environment profile to files."""
+    from envers.core import Envers
+
+    envers = Envers()
+    envers.profile_load(profile, spec, jobs=jobs)
+
+
+@app.command()
+def load_all(
+    profiles: Annotated[
+        str,
+        typer.Option(help="The names of the profiles, separated by commas."),
+    ] = "",
+    spec: Annotated[
+        str, typer.Option(help="The version of the spec to use.")
+    ] = "",
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            min=0,
+            help=(
+                "The maximum number of worker processes "
+                "(0 chooses it automatically)."
+            ),
+        ),
+    ] = 0,
+    password_fd: Annotated[
+        int,
+        typer.Option(
+            help=(
+                "A file descriptor with one <profile>=<password> line per "
+                "profile (e.g. 3 with `3< passwords.txt`)."
+            ),
+        ),
+    ] = -1,
+    output_dir: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "The directory for the files of each profile, where "
+                "{profile} is replaced by the profile name."
+            ),
+        ),
+    ] = "",
+) -> None:
+    """
+    Load several environment profiles to files in one run.
+
+    The passwords not given by --password-fd are read from the environment
+    variables ENVERS_PASSWORD_<PROFILE> or ENVERS_PASSWORD, then from the
+    session agent, and otherwise they are prompted.
+    """
+    from envers import crypt
+    from envers.core import Envers, raise_error
+
+    profile_names = [name.strip() for name in profiles.split(",")]
+    profile_names = [name for name in profile_names if name]
+    if not profile_names:
+        raise_error("At least one profile should be given.")
+
+    try:
+        passwords = crypt.get_profile_passwords(
+            profile_names, password_fd if password_fd >= 0 else None
+        )
+    except (OSError, ValueError) as e:
+        raise_error(f"The passwords could not be read: {e}")
+
+    envers = Envers()
+    envers.load_all(profile_names, spec, passwords, jobs, output_dir)
+
+
+@app.command()
+def diff(
+    old: Annotated[
+        str,
+        typer.Argument(
+            help="The target compared, as <spec> or <profile>@<spec>."
+        ),
+    ],
+    new: Annotated[
+        str,
+        typer.Argument(help="The target to compare it with."),
+    ],
+    password_fd: Annotated[
+        int,
+        typer.Option(
+            help=(
+                "A file descriptor with one <profile>=<password> line per "
+                "profile (e.g. 3 with `3< passwords.txt`)."
+            ),
+        ),
+    ] = -1,
+) -> None:
+    """
+    Show the differences between two releases or two profiles.
+
+    `envers diff 1.4 1.5` compares the variables defined by the releases,
+    and `envers diff prod@1.5 staging@1.5` compares the values of the
+    profiles too. The values are compared by their hash and never shown.
+    """
+    from envers import crypt, diffs
+    from envers.core import Envers, raise_error
+
+    try:
+        profiles = [diffs.parse_target(target)[1] for target in (old, new)]
+        passwords = crypt.get_profile_passwords(
+            [profile for profile in profiles if profile],
+            password_fd if password_fd >= 0 else None,
+        )
+    except (OSError, ValueError) as e:
+        raise_error(str(e))
+
+    envers = Envers()
+    envers.diff(old, new, passwords)
+
+
+@app.command()
+def gc(
+    profile: Annotated[
+        str, typer.Option(help="The name of the profile to clean up.")
+    ] = "",
+) -> None:
+    """Remove the values no longer used by any release of a profile."""
+    from envers.core import Envers
+
+    envers = Envers()
+    envers.gc(profile)
+
+
+@app.command()
+def rekey(
+    profile: Annotated[
+        str, typer.Option(help="The name of the profile to rekey.")
+    ] = "",
+    kdf: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "The key derivation function for the new encryption "
+                "(pbkdf2-sha256 or scrypt)."
+            )
+        ),
+    ] = "",
+    cost: Annotated[
+        int,
+        typer.Option(
+            help="The KDF cost (PBKDF2 iterations or scrypt N).",
+        ),
+    ] = 0,
+    change_password: Annotated[
+        bool, typer.Option(help="Ask for a new password for the profile.")
+    ] = False,
+) -> None:
+    """Re-encrypt a profile data lock file with the current format."""
+    from envers import crypt
+    from envers.core import Envers, raise_error
+
+    try:
+        kdf_params = crypt.get_kdf_params(kdf or None, cost or None)
+    except ValueError as e:
+        raise_error(str(e))
+
+    password = crypt.get_password()
+    new_password = None
+
+    if change_password:
+        new_password = crypt.get_password("Enter the new password")
+        new_password_confirmation = crypt.get_password(
+            "Confirm the new password"
+        )
+        if new_password != new_password_confirmation:
+            raise_error(
+                "The password and confirmation do not match. Please try again."
+            )
+
     envers = Envers()
-    envers.profile_load(profile, spec)
+    envers.rekey(profile, password, new_password, kdf_params)
+
+
+def _load_store(profile_names: list[str], password_fd: int) -> Any:
+    """Return a ConfigStore with the given profiles, or exit on errors."""
+    from envers import crypt, server
+    from envers.core import raise_error
+    from envers.errors import EnversError, PasswordRequiredError
+
+    try:
+        passwords = crypt.get_profile_passwords(
+            profile_names, password_fd if password_fd >= 0 else None
+        )
+    except (OSError, ValueError) as e:
+        raise_error(f"The passwords could not be read: {e}")
+
+    store = server.ConfigStore()
+    for profile in profile_names:
+        try:
+            try:
+                store.add(profile, passwords.get(profile))
+            except PasswordRequiredError:
+                store.add(
+                    profile,
+                    crypt.get_password(
+                        f"Enter the password for profile '{profile}'"
+                    ),
+                )
+        except EnversError as e:
+            store.clear()
+            raise_error(str(e))
+    return store
+
+
+def _create_server(
+    store: Any,
+    socket_path: str,
+    host: str,
+    port: Optional[int],
+    interval: float,
+) -> tuple[Any, str]:
+    """Return the server (on the Unix socket or TCP port) and its address."""
+    import os
+    import secrets
+
+    from envers import server
+
+    if port is None:
+        path = Path(socket_path) if socket_path else None
+        path = path or server.get_default_socket_path()
+        return server.UnixConfigServer(store, path, interval), str(path)
+
+    if not server.is_loopback(host):
+        typer.echo(
+            f"Warning: {host} is reachable from other machines, the "
+            "decrypted profiles are only protected by the token.",
+            err=True,
+        )
+    token = os.getenv(server.SERVE_TOKEN_ENV, "") or secrets.token_urlsafe(32)
+    config_server = server.ConfigServer(store, token, host, port, interval)
+    if not os.getenv(server.SERVE_TOKEN_ENV):
+        typer.echo(f"Token: {token}")
+    return config_server, f"http://{host}:{config_server.server_address[1]}"
+
+
+@app.command()
+def serve(
+    profiles: Annotated[
+        str,
+        typer.Option(help="The names of the profiles, separated by commas."),
+    ] = "",
+    socket_path: Annotated[
+        str,
+        typer.Option(
+            "--socket",
+            help=(
+                "The Unix socket to listen on. Defaults to serve.sock in "
+                "the user runtime directory."
+            ),
+        ),
+    ] = "",
+    host: Annotated[
+        str,
+        typer.Option(help="The address to listen on, with --port."),
+    ] = "127.0.0.1",
+    port: Annotated[
+        Optional[int],
+        typer.Option(
+            help=(
+                "Listen on this TCP port instead of a Unix socket. The "
+                "requests need the header `Authorization: Bearer <token>`, "
+                "with the token in ENVERS_SERVE_TOKEN (or a new one, "
+                "printed at startup)."
+            ),
+        ),
+    ] = None,
+    interval: Annotated[
+        float,
+        typer.Option(
+            help="How often (in seconds) the data lock files are checked."
+        ),
+    ] = 1.0,
+    password_fd: Annotated[
+        int,
+        typer.Option(
+            help=(
+                "A file descriptor with one <profile>=<password> line per "
+                "profile (e.g. 3 with `3< passwords.txt`)."
+            ),
+        ),
+    ] = -1,
+) -> None:
+    """
+    Serve the files of the given profiles from memory, read-only.
+
+    The files are available at GET /<spec>/<profile>/<file>, and all the
+    files of a profile, as JSON, at GET /<spec>/<profile>. The profiles are
+    decrypted again when their data lock file changes.
+    """
+    from envers.core import raise_error
+
+    profile_names = [name.strip() for name in profiles.split(",")]
+    profile_names = [name for name in profile_names if name]
+    if not profile_names:
+        raise_error("At least one profile should be given.")
+    if socket_path and port is not None:
+        raise_error("Use either --socket or --port.")
+
+    store = _load_store(profile_names, password_fd)
+    try:
+        config_server, address = _create_server(
+            store, socket_path, host, port, interval
+        )
+    except OSError as e:
+        store.clear()
+        raise_error(f"The server could not be started: {e}")
+
+    typer.echo(f"Serving {', '.join(profile_names)} on {address}")
+
+    with config_server:
+        try:
+            config_server.serve_forever(poll_interval=min(interval, 0.5))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            store.clear()
+
+
+@agent_app.command("start")
+def agent_start(
+    socket_path: Annotated[
+        str,
+        typer.Option("--socket", help="The path of the socket to listen on."),
+    ] = "",
+    ttl: Annotated[
+        int,
+        typer.Option(help="How long (in seconds) the keys are kept."),
+    ] = agent.AGENT_DEFAULT_TTL,
+) -> None:
+    """
+    Start the session agent in the foreground.
+
+    The agent keeps the derived keys in memory, so the following envers
+    commands can skip the password prompt. Export the printed variable
+    to enable it for the commands of the current shell.
+    """
+    from envers.core import raise_error
+
+    path = (
+        Path(socket_path) if socket_path else agent.get_default_socket_path()
+    )
+
+    try:
+        server = agent.AgentServer(path, ttl)
+    except OSError as e:
+        raise_error(f"The agent could not be started: {e}")
+
+    typer.echo(
+        f"{agent.AGENT_SOCKET_ENV}={path}; export {agent.AGENT_SOCKET_ENV};"
+    )
+
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+@agent_app.command("clear")
+def agent_clear() -> None:
+    """Remove all the keys from the session agent."""
+    from envers.core import raise_error
+
+    if not agent.request({"op": "clear"}):
+        raise_error("The agent is not running.")
+
+
+@agent_app.command("stop")
+def agent_stop() -> None:
+    """Stop the session agent."""
+    from envers.core import raise_error
+
+    if not agent.request({"op": "stop"}):
+        raise_error("The agent is not running.")
 
 
 @app.command()
@@ -2,20 +2,39 @@
 
 from __future__ import annotations
 
-import copy
-import io
+import itertools
 import os
+import shutil
 
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterable, Optional, Sequence, Union
 
 import typer
-import yaml  # type: ignore
 
 from cryptography.fernet import InvalidToken
-from dotenv import dotenv_values
 
-from envers import crypt
+from envers import agent, crypt, diffs, envfile, lockfile, templates
+from envers.errors import (
+    ConflictError,
+    InvalidOptionError,
+    InvalidSpecError,
+    TemplateError,
+)
+from envers.files import atomic_write, file_lock
+from envers.specs import SpecFile
+from envers.templates import escape_template_tag as escape_template_tag
+from envers.templates import unescape_template_tag as unescape_template_tag
+from envers.timings import span
+from envers.values import (
+    SpecValidators,
+    Validator,
+    compile_spec,
+    get_profile_vars,
+    validate_files,
+    validate_profiles,
+)
 
 
 def raise_error(message: str, exit_code: int = 1) -> None:
@@ -31,6 +50,12 @@ def merge_dicts(
     """
     Merge two dictionaries recursively.
 
+    The values from `dict_rhs` take precedence, and nested dictionaries
+    present in both sides are merged as well. The merge is copy-on-write:
+    only the dictionaries in the changed paths are copied, the untouched
+    subtrees are shared with the inputs, and the inputs are not modified.
+    It is iterative, so deeply nested dictionaries are safe.
+
     Parameters
     ----------
     dict_lhs : dict
@@ -43,19 +68,20 @@ def merge_dicts(
     dict
         The merged dictionary.
     """
-    dict_lhs = copy.deepcopy(dict_lhs)
-
-    for key in dict_rhs:
-        if key in dict_lhs:
-            if isinstance(dict_lhs[key], dict) and isinstance(
-                dict_rhs[key], dict
-            ):
-                merge_dicts(dict_lhs[key], dict_rhs[key])
+    merged = dict(dict_lhs)
+    pending = [(merged, dict_rhs)]
+
+    while pending:
+        target, source = pending.pop()
+        for key, value in source.items():
+            current = target.get(key)
+            if isinstance(current, dict) and isinstance(value, dict):
+                # copy only the nested dictionary that is going to change
+                target[key] = dict(current)
+                pending.append((target[key], value))
             else:
-                dict_lhs[key] = dict_rhs[key]
-        else:
-            dict_lhs[key] = dict_rhs[key]
-    return dict_lhs
+                target[key] = value
+    return merged
 
 
 # constants
@@ -63,50 +89,508 @@ ENVERS_SPEC_FILENAME = "specs.yaml"
 # ENVERS_DATA_FILENAME = "data.lock"
 
 
-def escape_template_tag(v: str) -> str:
-    """Escape template tags for template rendering."""
-    return v.replace("{{", r"\{\{").replace("}}", r"\}\}")
+def _decrypt_release(
+    raw_data: str, spec: str, password: Optional[str], key: Optional[bytes]
+) -> tuple[Optional[dict[str, Any]], Optional[bytes], str]:
+    """
+    Derive the key of a data lock and decrypt one of its releases.
+
+    It runs in the worker processes of `Envers.load_all`, so it returns
+    the error message instead of raising it.
+    """
+    try:
+        data_lock = lockfile.DataLock.loads(raw_data)
+        if key is None:
+            key = crypt.create_fernet_key(
+                str(password), data_lock.header.salt, data_lock.header.kdf
+            )
+        return data_lock.get_release(spec, key), key, ""
+    except InvalidToken:
+        return None, None, "the given password is not correct"
+    except Exception:
+        return None, None, "the data.lock is not valid"
+
+
+@dataclass
+class _LoadTask:
+    """A profile to be decrypted by `Envers.load_all`."""
+
+    profile: str
+    raw_data: str
+    header: crypt.LockHeader
+    password: Optional[str]
+    key: Optional[bytes]
+
+
+def _decrypt_releases(
+    tasks: list[_LoadTask], spec: str, jobs: int
+) -> list[tuple[Optional[dict[str, Any]], Optional[bytes], str]]:
+    """Decrypt the release of each task, in a process pool if several."""
+    arguments = (
+        [task.raw_data for task in tasks],
+        [spec] * len(tasks),
+        [task.password for task in tasks],
+        [task.key for task in tasks],
+    )
+    if jobs == 1 or len(tasks) <= 1:
+        return list(map(_decrypt_release, *arguments))
+
+    with ProcessPoolExecutor(
+        max_workers=min(jobs or os.cpu_count() or 1, len(tasks))
+    ) as executor:
+        return list(executor.map(_decrypt_release, *arguments))
+
+
+def check_output_dir(output_dir: str) -> None:
+    """
+    Check the template of the output directory of `load-all`.
+
+    Raises InvalidOptionError when it has other fields than `{profile}`,
+    or when its braces are not balanced (a literal brace is `{{` or `}}`).
+    """
+    try:
+        output_dir.format(profile="profile")
+    except (KeyError, IndexError, ValueError, AttributeError) as e:
+        raise InvalidOptionError(
+            f"The output directory `{output_dir}` is not valid ({e}), use "
+            "`{profile}` for the name of the profile and `{{` or `}}` for "
+            "literal braces."
+        ) from e
+
+
+def _add_profile_files(
+    files: dict[str, dict[str, Any]],
+    owners: dict[str, str],
+    profile: str,
+    profile_files: dict[str, dict[str, Any]],
+    output_dir: str,
+) -> list[str]:
+    """
+    Add the files of a profile to the files to be written.
+
+    Returns the errors of the files also written by another profile.
+    """
+    errors = []
+    for file_path, variables in profile_files.items():
+        if output_dir:
+            file_path = str(
+                Path(output_dir.format(profile=profile)) / file_path
+            )
+        if file_path in owners:
+            errors.append(
+                f"{profile}: {file_path} is also written by profile "
+                f"'{owners[file_path]}', use a different output "
+                "directory for each profile (e.g. '{profile}')"
+            )
+            continue
+        owners[file_path] = profile
+        files[file_path] = variables
+    return errors
+
+
+@dataclass
+class ReleaseDiff:
+    """Changes of the profile data made by a deploy."""
+
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    kept: int = 0
+    seeded: int = 0
+
+    def echo(self, spec: str) -> None:
+        """Print the summary of the changes."""
+        typer.echo(
+            f"Version {spec} deployed: {len(self.added)} added "
+            f"({self.seeded} seeded), {len(self.removed)} removed, "
+            f"{self.kept} kept."
+        )
+        for name in self.added:
+            typer.echo(f"  + {name}")
+        for name in self.removed:
+            typer.echo(f"  - {name}")
+
+
+def build_release_data(
+    spec_data: dict[str, Any],
+    current_data: dict[str, Any],
+    seed_data: Optional[dict[str, Any]] = None,
+) -> tuple[dict[str, Any], ReleaseDiff]:
+    """
+    Return the data of each profile for the given release spec.
+
+    The values in `current_data` (the data already deployed for the
+    release) are kept for the variables still in the spec. The new
+    variables take the value from `seed_data` (the data of another
+    release) when it has the same profile, file and variable, and their
+    default value otherwise.
+
+    Returns
+    -------
+    tuple[dict[str, Any], ReleaseDiff]
+        The data by profile, and the changes in `profile:file:variable`
+        form (all the variables of a first deploy, or of a new profile, are
+        added).
+    """
+    seed_data = seed_data or {}
+    spec_files = spec_data.get("spec", {}).get("files", {})
+    diff = ReleaseDiff()
+    release_data: dict[str, Any] = {}
+
+    for profile_name in spec_data.get("profiles", []):
+        current_files = current_data.get(profile_name, {}).get("files", {})
+        seed_files = seed_data.get(profile_name, {}).get("files", {})
+
+        profile_data: dict[str, dict[str, Any]] = {"files": {}}
+        for file_path, file_info in spec_files.items():
+            current_vars = current_files.get(file_path, {}).get("vars", {})
+            seed_vars = seed_files.get(file_path, {}).get("vars", {})
+
+            file_vars = {}
+            for var_name, var_info in file_info.get("vars", {}).items():
+                if var_name in current_vars:
+                    file_vars[var_name] = current_vars[var_name]
+                    diff.kept += 1
+                    continue
+
+                if var_name in seed_vars:
+                    file_vars[var_name] = seed_vars[var_name]
+                    diff.seeded += 1
+                else:
+                    file_vars[var_name] = var_info.get("default", "")
+                diff.added.append(f"{profile_name}:{file_path}:{var_name}")
+
+            profile_data["files"][file_path] = {
+                "type": file_info.get("type", "dotenv"),
+                "vars": file_vars,
+            }
+
+            diff.removed += [
+                f"{profile_name}:{file_path}:{var_name}"
+                for var_name in current_vars
+                if var_name not in file_vars
+            ]
+
+        diff.removed += [
+            f"{profile_name}:{file_path}:{var_name}"
+            for file_path, file_data in current_files.items()
+            if file_path not in spec_files
+            for var_name in file_data.get("vars", {})
+        ]
+        release_data[profile_name] = profile_data
+
+    return release_data, diff
+
+
+def get_spec_files(release: dict[str, Any]) -> dict[str, Any]:
+    """Return the files of the spec of a release (or of a deployed one)."""
+    return (release.get("spec") or {}).get("files") or {}
+
+
+def create_data_lock() -> lockfile.DataLock:
+    """Create an empty data lock, with the configured parameters."""
+    try:
+        data_lock = lockfile.DataLock.create()
+    except ValueError as e:
+        # e.g. an invalid ENVERS_KDF or ENVERS_KDF_COST
+        raise_error(str(e))
+    return data_lock
 
 
-def unescape_template_tag(v: str) -> str:
-    """Unescape template tags for template rendering."""
-    return v.replace(r"\{\{", "{{").replace(r"\}\}", "}}")
+def get_validators(release: dict[str, Any]) -> SpecValidators:
+    """Return the validators of the spec of a release (or a deployed one)."""
+    try:
+        validators = compile_spec(get_spec_files(release))
+    except InvalidSpecError as e:
+        raise_error(str(e))
+    return validators
+
+
+def get_profile_files(release: dict[str, Any], profile: str) -> dict[str, Any]:
+    """Return the files of a profile of a deployed release, as stored."""
+    return (release.get("data", {}).get(profile) or {}).get("files") or {}
+
+
+def render_profile_files(
+    profile_data: dict[str, Any],
+) -> dict[str, dict[str, Any]]:
+    """
+    Return the variables of each file of a profile, ready to be written.
+
+    The references to other variables (`{{ VAR }}` or `{{ file:VAR }}`)
+    are resolved, see envers.templates.
+    """
+    with span("render"):
+        return templates.render_files(get_profile_vars(profile_data))
+
+
+def import_env_files(
+    spec_files: dict[str, Any],
+    from_env: Union[str, Sequence[str]],
+    jobs: int = 0,
+) -> None:
+    """
+    Add the .env files (paths or glob patterns) to the files of a spec.
+
+    The files are read concurrently (by at most `jobs` threads), and the
+    value of each variable is its default.
+    """
+    patterns = [from_env] if isinstance(from_env, str) else from_env
+    try:
+        env_paths = envfile.expand_paths(patterns)
+        env_files = envfile.read_files(env_paths, jobs)
+    except (OSError, InvalidOptionError) as e:
+        raise_error(str(e))
+
+    # populate the variables of all the files in one pass
+    with span("build"):
+        for env_path, env_vars in zip(env_paths, env_files):
+            spec_files[env_path] = {
+                "docs": "",
+                "type": "dotenv",
+                "vars": {
+                    var: {"docs": "", "type": "string", "default": value}
+                    for var, value in env_vars.items()
+                },
+            }
+
+
+def get_assignments(
+    data_files: dict[str, Any], values: dict[str, Any], file_path: str = ""
+) -> tuple[list[tuple[str, str, Any]], list[str]]:
+    """
+    Return where each given value is set in the files of a profile.
+
+    Returns
+    -------
+    tuple[list[tuple[str, str, Any]], list[str]]
+        The (file path, variable name, value) of each assignment, and the
+        names that do not match any variable of the files.
+    """
+    assignments = []
+    unknown = []
+    for name, value in values.items():
+        if isinstance(value, dict) and name in data_files:
+            assignments += [
+                (name, var_name, var_value)
+                for var_name, var_value in value.items()
+            ]
+            continue
+
+        targets = [
+            path
+            for path, file_data in data_files.items()
+            if (not file_path or path == file_path)
+            and name in file_data.get("vars", {})
+        ]
+        if not targets:
+            unknown.append(name)
+        assignments += [(path, name, value) for path in targets]
+    return assignments, unknown
+
+
+def prompt_value(
+    name: str, default: Any, validator: Optional[Validator] = None
+) -> Any:
+    """Prompt the value of a variable until it is valid."""
+    while True:
+        value = typer.prompt(f"Enter value for `{name}`", default=default)
+        error = validator(value) if validator else None
+        if not error:
+            return value
+        typer.echo(f"The value is not valid: {error}.", err=True)
 
 
 class Envers:
     """EnversBase defined the base structure for the Envers classes."""
 
+    def __init__(self) -> None:
+        # data lock (with its header and still encrypted segments) and key
+        # of each data file read by this instance, reused for the next write
+        # so a read-modify-write cycle derives the key once and re-encrypts
+        # only the releases that were changed
+        self._locks: dict[str, lockfile.DataLock] = {}
+        self._keys: dict[str, bytes] = {}
+
+    def _get_key(
+        self,
+        header: crypt.LockHeader,
+        password: Optional[str] = None,
+        profile: str = "",
+    ) -> tuple[bytes, bool]:
+        """
+        Return the key for the given header.
+
+        Without a password, the key is requested to the session agent
+        (if it is running) before prompting the password (of the given
+        profile).
+
+        Returns
+        -------
+        tuple[bytes, bool]
+            The key, and if it was derived from a password. The derived
+            keys should be added to the agent once they are verified, so
+            the following commands can skip the prompt (and a wrong
+            password is not kept).
+        """
+        if password is None:
+            key = agent.get_key(header)
+            if key is not None:
+                return key, False
+            password = crypt.get_password(
+                f"Enter the password for profile '{profile}'"
+                if profile
+                else ""
+            )
+
+        return crypt.create_fernet_key(password, header.salt, header.kdf), True
+
     def _read_data_file(
-        self, profile: str, password: str = ""
+        self,
+        profile: str,
+        password: Optional[str] = None,
+        releases: Optional[Iterable[str]] = None,
     ) -> dict[str, Any]:
+        """
+        Read the data lock file of the given profile.
+
+        Only the given releases are decrypted (all of them by default).
+        """
         data_file = Path(".envers") / "data" / f"{profile}.lock"
 
-        with open(data_file, "r") as file:
-            try:
-                raw_data = file.read()
-                if not raw_data:
-                    return {}
-                data_content = crypt.decrypt_data(raw_data, password)
-                data_lock = yaml.safe_load(io.StringIO(data_content)) or {}
-            except InvalidToken:
-                raise_error("The given password is not correct. Try it again.")
-            except Exception:
-                raise_error(
-                    "The data.lock is not valid. Please remove it to proceed."
-                )
+        try:
+            raw_data = data_file.read_text()
+            data_lock = lockfile.DataLock.loads(raw_data) if raw_data else None
+        except Exception:
+            raise_error(
+                "The data.lock is not valid. Please remove it to proceed."
+            )
+        if data_lock is None:
+            return {}
+
+        # the password is prompted outside of the error handling, so an
+        # aborted prompt is not reported as an invalid file
+        key, derived = self._get_key(data_lock.header, password, profile)
+        try:
+            data = data_lock.to_dict(key, releases)
+        except InvalidToken:
+            raise_error("The given password is not correct. Try it again.")
+        except Exception:
+            raise_error(
+                "The data.lock is not valid. Please remove it to proceed."
+            )
 
-        return data_lock
+        if derived:
+            agent.add_key(data_lock.header, key)
+        self._locks[profile] = data_lock
+        self._keys[profile] = key
+        return data
 
     def _write_data_file(
-        self, profile: str, data: dict[str, Any], password: str = ""
+        self,
+        profile: str,
+        data: dict[str, Any],
+        password: Optional[str] = None,
     ) -> None:
+        """
+        Write the data lock file of the given profile.
+
+        Only the releases in the given data are encrypted again, the
+        segments of the other releases are kept as they are.
+
+        The file is replaced atomically while holding the lock of the
+        `.envers` directory, and only if no other process wrote it since
+        it was read (its generation did not change), otherwise the write
+        fails with a conflict error instead of losing the other update.
+        """
         data_file = Path(".envers") / "data" / f"{profile}.lock"
 
         os.makedirs(data_file.parent, exist_ok=True)
 
-        with open(data_file, "w") as file:
-            data_content = yaml.dump(data, sort_keys=False)
-            file.write(crypt.encrypt_data(data_content, password))
+        data_lock = self._locks.get(profile)
+        # the generation read by this instance, None if the file was not
+        # read (so it should not exist)
+        expected_generation = (
+            None if data_lock is None else data_lock.generation
+        )
+        if data_lock is None:
+            data_lock = create_data_lock()
+
+        key = self._keys.get(profile) if password is None else None
+        derived = False
+        if key is None:
+            key, derived = self._get_key(data_lock.header, password, profile)
+
+        data_lock.meta = {
+            name: value for name, value in data.items() if name != "releases"
+        }
+        for release_name, release in data.get("releases", {}).items():
+            data_lock.set_release(release_name, release)
+
+        try:
+            with file_lock(data_file.parent.parent):
+                current_generation = self._get_generation(data_file)
+                if current_generation != expected_generation:
+                    raise ConflictError(
+                        f"The data lock file for profile '{profile}' was "
+                        "changed by another process. Please run the command "
+                        "again."
+                    )
+
+                data_lock.generation = (current_generation or 0) + 1
+                atomic_write(data_file, data_lock.dumps(key).encode("utf-8"))
+        except ConflictError as e:
+            raise_error(str(e))
+
+        # the key is only added to the agent once the file is written with it
+        if derived:
+            agent.add_key(data_lock.header, key)
+        self._locks[profile] = data_lock
+        self._keys[profile] = key
+
+    def _get_generation(self, data_file: Path) -> Optional[int]:
+        """Return the generation of a data lock file, None if it is empty."""
+        try:
+            raw_data = data_file.read_text()
+        except FileNotFoundError:
+            return None
+        if not raw_data:
+            return None
+
+        try:
+            return lockfile.DataLock.read_generation(raw_data)
+        except Exception:
+            raise ConflictError(
+                f"The data lock file {data_file} is not valid. Please remove "
+                "it to proceed."
+            )
+
+    def _report_written_files(
+        self, results: list[envfile.WriteResult]
+    ) -> None:
+        """Print the outcome of each written file and raise the errors."""
+        for result in results:
+            if result.error:
+                status = "failed"
+            elif result.created:
+                status = f"created, {result.size} bytes written"
+            elif result.size:
+                status = f"{result.size} bytes written"
+            else:
+                status = "unchanged"
+            typer.echo(
+                f"  {result.path}: {status} ({result.elapsed * 1000:.1f} ms)"
+            )
+
+        errors = [
+            f"{result.path}: {result.error}"
+            for result in results
+            if result.error
+        ]
+        if errors:
+            raise_error(
+                "The following environment files could not be written:\n"
+                + "\n".join(errors)
+            )
 
     def init(self, path: Path) -> None:
         """
@@ -140,7 +624,11 @@ class Envers:
             file.write("version: '0.1'\nreleases:\n")
 
     def draft(
-        self, version: str, from_spec: str = "", from_env: str = ""
+        self,
+        version: str,
+        from_spec: str = "",
+        from_env: Union[str, Sequence[str]] = "",
+        jobs: int = 0,
     ) -> None:
         """
         Create a new draft version in the spec file.
@@ -151,32 +639,33 @@ class Envers:
             The version number for the new draft.
         from_spec : str, optional
             The version number from which to copy the spec.
-        from_env : str, optional
-            The .env file from which to load environment variables.
+        from_env : Union[str, Sequence[str]], optional
+            The .env files (paths or glob patterns) from which to load
+            environment variables. The files are read concurrently and
+            the specs file is written once.
+        jobs : int
+            The maximum number of .env files read at the same time.
+            Defaults to the number chosen by the thread pool.
 
         Returns
         -------
         None
         """
-        spec_file = Path(".envers") / ENVERS_SPEC_FILENAME
+        spec_file = SpecFile(Path(".envers") / ENVERS_SPEC_FILENAME)
 
         if not spec_file.exists():
             raise_error("Spec file not found. Please initialize envers first.")
 
-        with open(spec_file, "r") as file:
-            specs = yaml.safe_load(file) or {}
+        specs = spec_file.load()
+        specs["releases"] = specs.get("releases") or {}
 
-        if not specs.get("releases", {}):
-            specs["releases"] = {}
-
-        if specs.get("releases", {}).get("version", ""):
+        if specs["releases"].get(version, {}):
             # warning
             typer.echo(
                 f"The given version {version} is already defined in the "
                 "specs.yaml file."
             )
-
-        if not specs["releases"].get(version, {}):
+        else:
             specs["releases"][version] = {
                 "docs": "",
                 "status": "draft",
@@ -190,42 +679,39 @@ class Envers:
                     f"Source version {from_spec} not found in specs.yaml."
                 )
 
-            specs["releases"][version] = merge_dicts(
-                specs["releases"][from_spec],
-                specs["releases"][version],
-            )
+            with span("build"):
+                specs["releases"][version] = merge_dicts(
+                    specs["releases"][from_spec],
+                    specs["releases"][version],
+                )
 
         elif from_env:
-            env_path = Path(from_env)
-            if not env_path.exists():
-                raise_error(f".env file {from_env} not found.")
-
-            # Read .env file and populate variables
-            env_vars = dotenv_values(env_path)
-            file_spec = {
-                "docs": "",
-                "type": "dotenv",
-                "vars": {
-                    var: {
-                        "docs": "",
-                        "type": "string",
-                        "default": value,
-                    }
-                    for var, value in env_vars.items()
-                },
-            }
-            spec_files = specs["releases"][version]["spec"]["files"]
-            spec_files[from_env] = file_spec
+            import_env_files(
+                specs["releases"][version]["spec"]["files"], from_env, jobs
+            )
 
-        with open(spec_file, "w") as file:
-            yaml.dump(specs, file, sort_keys=False)
+        try:
+            spec_file.save(specs)
+        except ConflictError as e:
+            raise_error(str(e))
 
     def deploy(
-        self, profile: str, spec: str, password: Optional[str] = None
+        self,
+        profile: str,
+        spec: str,
+        password: Optional[str] = None,
+        seed_from: str = "",
     ) -> None:
         """
         Deploy a specific version, updating the .envers/data.lock file.
 
+        Deploying a version again is incremental: the values already set
+        for the variables still defined by the spec are kept, the new
+        variables get their default value (or the value from the release
+        `seed_from`, when it has the same variable) and the removed ones
+        are dropped. A summary of the changes is printed, with the values
+        of all the profiles that are not valid for the spec.
+
         Parameters
         ----------
         profile : str
@@ -234,89 +720,129 @@ class Envers:
             The version number to be deployed.
         password : Optional[str]
             The password to be used for that profile.
+        seed_from : str
+            A deployed version to copy the values of the new variables from.
 
         Returns
         -------
         None
         """
-        specs_file = Path(".envers") / ENVERS_SPEC_FILENAME
-        data_file = Path(".envers") / "data" / f"{profile}.lock"
+        specs_file = SpecFile(Path(".envers") / ENVERS_SPEC_FILENAME)
 
         if not specs_file.exists():
             raise_error("Spec file not found. Please initialize envers first.")
 
-        with open(specs_file, "r") as file:
-            specs = yaml.safe_load(file) or {}
+        # only the deployed release is parsed, using the release index
+        spec_data = specs_file.load_release(spec) or {}
 
-        if not specs.get("releases", {}).get(spec, ""):
+        if not spec_data:
             raise_error(f"Version {spec} not found in specs.yaml.")
 
-        spec_data = copy.deepcopy(specs["releases"][spec])
-
         # all data in the data.lock file are deployed
         del spec_data["status"]
+        # a spec that cannot be validated is not deployed
+        get_validators(spec_data)
+
+        # only the deployed release (and the seed one) are decrypted, the
+        # other releases are not changed
+        data_lock, password = self._read_deploy_data(
+            profile,
+            [spec, seed_from] if seed_from else [spec],
+            specs_file.get_meta("version"),
+            password,
+        )
+        current_release = data_lock["releases"].get(spec, {})
+        seed_release = data_lock["releases"].get(seed_from, {})
 
-        if data_file.exists():
-            if password is None:
-                password = crypt.get_password()
-
-            data_lock = self._read_data_file(profile, password)
+        if seed_from and not seed_release:
+            raise_error(f"Version {seed_from} not found in data.lock.")
 
-            if not data_lock:
-                typer.echo("data.lock is not valid. Creating a new file.")
-                data_lock = {
-                    "version": spec_data["version"],
-                    "releases": {},
-                }
-            data_lock["releases"][spec] = {"spec": spec_data, "data": {}}
+        if current_release.get("spec") == spec_data:
+            # the release was deployed with the same spec, nothing to do
+            typer.echo(f"Version {spec} is up to date.")
         else:
-            data_lock = {
-                "version": specs["version"],
-                "releases": {spec: {"spec": spec_data, "data": {}}},
+            with span("build"):
+                release_data, diff = build_release_data(
+                    spec_data,
+                    current_release.get("data", {}),
+                    seed_release.get("data", {}),
+                )
+            # only the deployed release is encrypted again, not the seed one
+            data_lock["releases"] = {
+                spec: {"spec": spec_data, "data": release_data}
             }
-
-            if password is None:
-                new_password = crypt.get_password()
-                new_password_confirmation = crypt.get_password(
-                    "Confirm your password"
+            self._write_data_file(profile, data_lock, password)
+            diff.echo(spec)
+
+            # the new variables may still need to be set, so the values
+            # are only reported
+            errors = validate_profiles(get_spec_files(spec_data), release_data)
+            if errors:
+                typer.echo(
+                    "The following values are not valid yet:\n"
+                    + "\n".join(errors)
                 )
 
-                if new_password != new_password_confirmation:
-                    raise_error(
-                        "The password and confirmation do not match. "
-                        "Please try again."
-                    )
+        try:
+            specs_file.set_status(spec, "deployed")
+        except ConflictError as e:
+            raise_error(str(e))
+
+    def _read_deploy_data(
+        self,
+        profile: str,
+        releases: list[str],
+        version: str,
+        password: Optional[str] = None,
+    ) -> tuple[dict[str, Any], Optional[str]]:
+        """
+        Read the given releases of the data lock file to deploy a release.
 
-                password = new_password
-
-        # Populate data with default values
-        for profile_name in spec_data.get("profiles", []):
-            profile_data: dict["str", dict[str, Any]] = {"files": {}}
-            for file_path, file_info in (
-                spec_data.get("spec", {}).get("files", {}).items()
-            ):
-                file_data = {
-                    "type": file_info.get("type", "dotenv"),
-                    "vars": {},
-                }
-                for var_name, var_info in file_info.get("vars", {}).items():
-                    default_value = var_info.get("default", "")
-                    file_data["vars"][var_name] = default_value
-                profile_data["files"][file_path] = file_data
-            data_lock["releases"][spec]["data"][profile_name] = profile_data
+        When the data lock file does not exist yet, a new password is
+        prompted (if not given) and confirmed.
 
-        self._write_data_file(profile, data_lock, password)
+        Returns
+        -------
+        tuple[dict[str, Any], Optional[str]]
+            The data lock content, and the password to write it.
+        """
+        data_file = Path(".envers") / "data" / f"{profile}.lock"
+        empty_data: dict[str, Any] = {"version": version, "releases": {}}
 
-        with open(specs_file, "w") as file:
-            specs["releases"][spec]["status"] = "deployed"
-            yaml.dump(specs, file, sort_keys=False)
+        if data_file.exists():
+            data_lock = self._read_data_file(profile, password, releases)
+            if not data_lock:
+                typer.echo("data.lock is not valid. Creating a new file.")
+                data_lock = empty_data
+            return data_lock, password
+
+        if password is None:
+            password = crypt.get_password()
+            if password != crypt.get_password("Confirm your password"):
+                raise_error(
+                    "The password and confirmation do not match. "
+                    "Please try again."
+                )
+        return empty_data, password
 
     def profile_set(
-        self, profile: str, spec: str, password: Optional[str] = None
+        self,
+        profile: str,
+        spec: str,
+        password: Optional[str] = None,
+        values: Optional[dict[str, Any]] = None,
+        file_path: str = "",
+        strict: bool = False,
     ) -> None:
         """
         Set the profile values for a given spec version.
 
+        Without values, each value is prompted. Otherwise, all the given
+        values are validated against the spec and applied in one pass, and
+        the data lock file is written once (only if something changed).
+        The values of the other variables of the profile are checked too,
+        and the ones that are not valid are reported without failing.
+
         Parameters
         ----------
         profile : str
@@ -325,6 +851,14 @@ class Envers:
             The version of the spec to use.
         password : Optional[str]
             The password to be used for that profile.
+        values : Optional[dict[str, Any]]
+            The values to set, by variable name, or by file path and then by
+            variable name. A variable name sets the variable in every file
+            of the profile that defines it.
+        file_path : str
+            Set the variables given by name only in this file.
+        strict : bool
+            Fail when a value does not match any variable of the profile.
 
         Returns
         -------
@@ -337,10 +871,7 @@ class Envers:
                 "Data lock file not found. Please deploy a version first."
             )
 
-        if password is None:
-            password = crypt.get_password()
-
-        data_lock = self._read_data_file(profile, password)
+        data_lock = self._read_data_file(profile, password, releases=[spec])
 
         if not data_lock.get("releases", {}).get(spec, ""):
             raise_error(f"Version {spec} not found in data.lock.")
@@ -354,8 +885,50 @@ class Envers:
                 f"and profile '{profile}'"
             )
 
-        # Iterate over files and variables
-        size = os.get_terminal_size()
+        if file_path and file_path not in profile_data["files"]:
+            raise_error(
+                f"File {file_path} not found in version '{spec}' and "
+                f"profile '{profile}'."
+            )
+
+        validators = get_validators(release_data.get("spec") or {})
+
+        if values is None:
+            self._prompt_values(profile, profile_data, validators)
+        elif not self._apply_values(
+            profile_data,
+            validators,
+            values,
+            file_path,
+            strict,
+        ):
+            return
+        else:
+            errors = validate_files(validators, get_profile_vars(profile_data))
+            if errors:
+                typer.echo(
+                    "The following values are not valid yet:\n"
+                    + "\n".join(errors)
+                )
+
+        # Update data.lock file
+        data_lock["releases"][spec]["data"][profile] = profile_data
+        self._write_data_file(profile, data_lock, password)
+
+    def _prompt_values(
+        self,
+        profile: str,
+        profile_data: dict[str, Any],
+        validators: SpecValidators,
+    ) -> None:
+        """
+        Prompt the value of each variable of the profile.
+
+        Each value is validated as it is entered, and prompted again until
+        it is valid.
+        """
+        # the fallback size is used when the output is not a terminal
+        size = shutil.get_terminal_size()
 
         profile_title = f" Profile: {profile} ".center(size.columns, "=")
         typer.echo(f"\n{profile_title}\n")
@@ -363,24 +936,79 @@ class Envers:
         for file_path, file_info in profile_data.get("files", {}).items():
             file_title = f">>> File: {file_path} "
             typer.echo(f"{file_title}\n")
+            file_validators = validators.get(file_path, {})
             for var_name, var_info in file_info.get("vars", {}).items():
-                current_value = var_info
-                new_value = typer.prompt(
-                    f"Enter value for `{var_name}`",
-                    default=current_value,
+                new_value = prompt_value(
+                    var_name, var_info, file_validators.get(var_name)
                 )
                 profile_data["files"][file_path]["vars"][var_name] = new_value
 
             # update the size for each iteration
-            size = os.get_terminal_size()
+            size = shutil.get_terminal_size()
             typer.echo(f"\n{size.columns * '-'}\n")
 
-        # Update data.lock file
-        data_lock["releases"][spec]["data"][profile] = profile_data
-        self._write_data_file(profile, data_lock, password)
+    def _apply_values(
+        self,
+        profile_data: dict[str, Any],
+        validators: SpecValidators,
+        values: dict[str, Any],
+        file_path: str = "",
+        strict: bool = False,
+    ) -> bool:
+        """
+        Validate and set the given values in the profile data.
+
+        Nothing is changed when a value is not valid. Returns if any value
+        was changed.
+        """
+        data_files = profile_data["files"]
+        assignments, unknown = get_assignments(data_files, values, file_path)
+
+        errors = []
+        changes = []
+        unchanged = 0
+        for path, name, value in assignments:
+            file_vars = data_files[path].setdefault("vars", {})
+            if name not in file_vars:
+                unknown.append(f"{path}:{name}")
+                continue
+
+            validator = validators.get(path, {}).get(name)
+            error = validator(value) if validator else None
+            if error:
+                errors.append(f"{path}: {name}: {error}")
+            elif file_vars[name] == value:
+                unchanged += 1
+            else:
+                changes.append((file_vars, name, value))
+
+        if errors:
+            raise_error(
+                "The following values are not valid:\n" + "\n".join(errors)
+            )
+        if strict and unknown:
+            raise_error(
+                "The following variables are not defined by the spec: "
+                + ", ".join(unknown)
+            )
+
+        for file_vars, name, value in changes:
+            file_vars[name] = value
+
+        typer.echo(
+            f"{len(changes)} changed, {unchanged} unchanged, "
+            f"{len(unknown)} unknown."
+        )
+        if unknown:
+            typer.echo(f"Unknown variables: {', '.join(unknown)}")
+        return bool(changes)
 
     def profile_load(
-        self, profile: str, spec: str, password: Optional[str] = None
+        self,
+        profile: str,
+        spec: str,
+        password: Optional[str] = None,
+        jobs: int = 0,
     ) -> None:
         """
         Load a specific environment profile to files.
@@ -396,11 +1024,19 @@ class Envers:
             The version of the spec to use.
         password : Optional[str]
             The password to be used for that profile.
+        jobs : int
+            The maximum number of files written at the same time. Defaults
+            to the number chosen by the thread pool.
 
         Returns
         -------
         None
         """
+        try:
+            envfile.check_jobs(jobs)
+        except InvalidOptionError as e:
+            raise_error(str(e))
+
         data_file = Path(".envers") / "data" / f"{profile}.lock"
 
         if not data_file.exists():
@@ -408,10 +1044,7 @@ class Envers:
                 "Data lock file not found. Please deploy a version first."
             )
 
-        if password is None:
-            password = crypt.get_password()
-
-        data_lock = self._read_data_file(profile, password)
+        data_lock = self._read_data_file(profile, password, releases=[spec])
 
         if not data_lock.get("releases", {}).get(spec, ""):
             raise_error(f"Version {spec} not found in data.lock.")
@@ -419,17 +1052,402 @@ class Envers:
         release_data = data_lock["releases"][spec]
         profile_data = release_data.get("data", {}).get(profile, {"files": {}})
 
-        # Iterate over files and variables
-        for file_path, file_info in profile_data.get("files", {}).items():
-            file_content = ""
-            for var_name, var_value in file_info.get("vars", {}).items():
-                file_content += f"{var_name}={var_value}\n"
+        try:
+            files = render_profile_files(profile_data)
+        except TemplateError as e:
+            raise_error(str(e))
+
+        # the rendered values are checked, so the references are resolved
+        errors = validate_files(
+            get_validators(release_data.get("spec") or {}),
+            files,
+        )
+        if errors:
+            raise_error(
+                "The following values are not valid:\n" + "\n".join(errors)
+            )
+
+        # Create or update the files, the unchanged ones are not touched
+        results = envfile.write_files(files, jobs)
 
-            # Create or update the file
-            with open(file_path, "w") as file:
-                file.write(file_content)
+        self._report_written_files(results)
 
         typer.echo(
             f"Environment files for profile '{profile}' and spec version "
-            f"'{spec}' have been created/updated."
+            f"'{spec}' have been created/updated "
+            f"({sum(result.size for result in results)} bytes written)."
+        )
+
+    def load_all(
+        self,
+        profiles: list[str],
+        spec: str,
+        passwords: Optional[dict[str, str]] = None,
+        jobs: int = 0,
+        output_dir: str = "",
+    ) -> None:
+        """
+        Load several environment profiles to files in one run.
+
+        The keys of the data lock files are derived (and the release is
+        decrypted) in parallel with a process pool, since the key
+        derivation is CPU-bound, and all the files are written afterwards.
+
+        Parameters
+        ----------
+        profiles : list[str]
+            The names of the profiles to load.
+        spec : str
+            The version of the spec to use.
+        passwords : Optional[dict[str, str]]
+            The password of each profile. The keys of the profiles without
+            a password are requested to the session agent, and otherwise
+            their passwords are prompted.
+        jobs : int
+            The maximum number of worker processes (and of files written at
+            the same time). Defaults to the number of processors.
+        output_dir : str
+            The directory where the files of each profile are written,
+            where `{profile}` is replaced by the name of the profile.
+            Defaults to the paths defined by the spec.
+
+        Returns
+        -------
+        None
+        """
+        try:
+            envfile.check_jobs(jobs)
+            check_output_dir(output_dir)
+        except InvalidOptionError as e:
+            raise_error(str(e))
+
+        tasks = self._get_load_tasks(profiles, passwords or {})
+        decrypted = _decrypt_releases(tasks, spec, jobs)
+
+        errors: list[str] = []
+        files: dict[str, dict[str, Any]] = {}
+        owners: dict[str, str] = {}
+        for task, result in zip(tasks, decrypted):
+            profile_files = self._get_loaded_files(task, result, spec, errors)
+            if profile_files is not None:
+                errors += _add_profile_files(
+                    files, owners, task.profile, profile_files, output_dir
+                )
+
+        if errors:
+            raise_error(
+                "The following profiles could not be loaded:\n"
+                + "\n".join(errors)
+            )
+
+        results = envfile.write_files(files, jobs)
+        self._report_written_files(results)
+
+        typer.echo(
+            f"Environment files for profiles "
+            f"{', '.join(task.profile for task in tasks)} and spec "
+            f"version '{spec}' have been created/updated "
+            f"({sum(result.size for result in results)} bytes written)."
+        )
+
+    def _get_load_tasks(
+        self, profiles: list[str], passwords: dict[str, str]
+    ) -> list[_LoadTask]:
+        """
+        Read the data lock file and resolve the key of each profile.
+
+        The passwords are resolved up front, so the prompts are not
+        interleaved with the work of the processes.
+        """
+        tasks = []
+        for profile in dict.fromkeys(profiles):
+            data_file = Path(".envers") / "data" / f"{profile}.lock"
+            if not data_file.exists():
+                raise_error(
+                    f"Data lock file for profile '{profile}' not found. "
+                    "Please deploy a version first."
+                )
+
+            raw_data = data_file.read_text()
+            try:
+                header = lockfile.DataLock.loads(raw_data).header
+            except Exception:
+                raise_error(
+                    f"The data.lock of profile '{profile}' is not valid. "
+                    "Please remove it to proceed."
+                )
+
+            password = passwords.get(profile)
+            key = None
+            if password is None:
+                key = agent.get_key(header)
+                if key is None:
+                    password = crypt.get_password(
+                        f"Enter the password for profile '{profile}'"
+                    )
+            tasks.append(_LoadTask(profile, raw_data, header, password, key))
+        return tasks
+
+    def _get_loaded_files(
+        self,
+        task: _LoadTask,
+        result: tuple[Optional[dict[str, Any]], Optional[bytes], str],
+        spec: str,
+        errors: list[str],
+    ) -> Optional[dict[str, dict[str, Any]]]:
+        """
+        Return the rendered and validated files of a decrypted profile.
+
+        The problems are added to `errors`, and None is returned.
+        """
+        release, key, error = result
+        if error:
+            errors.append(f"{task.profile}: {error}")
+            return None
+        if task.password is not None and key is not None:
+            agent.add_key(task.header, key)
+        if not release:
+            errors.append(f"{task.profile}: version {spec} not found")
+            return None
+
+        try:
+            profile_files = render_profile_files(
+                release.get("data", {}).get(task.profile, {})
+            )
+        except TemplateError as e:
+            errors.append(f"{task.profile}: {e}")
+            return None
+
+        profile_errors = validate_files(
+            get_validators(release.get("spec") or {}),
+            profile_files,
+            f"{task.profile}: ",
+        )
+        if profile_errors:
+            errors += profile_errors
+            return None
+        return profile_files
+
+    def diff(
+        self,
+        old: str,
+        new: str,
+        passwords: Optional[dict[str, str]] = None,
+    ) -> int:
+        """
+        Print the differences between two releases or two profiles.
+
+        A target is a spec version (`1.4`), to compare the definitions of
+        the variables, or a profile and a spec version (`prod@1.4`), to
+        compare the values too. The values are compared by their hash and
+        never printed. The profile targets are compared with the spec they
+        were deployed with (stored in the data lock file), so specs.yaml is
+        only read for the spec targets.
+
+        Parameters
+        ----------
+        old : str
+            The target compared, as `<spec>` or `<profile>@<spec>`.
+        new : str
+            The target to compare it with, in the same form.
+        passwords : Optional[dict[str, str]]
+            The passwords by profile, the missing ones are prompted.
+
+        Returns
+        -------
+        int
+            The number of differences.
+        """
+        try:
+            targets = [diffs.parse_target(old), diffs.parse_target(new)]
+        except ValueError as e:
+            raise_error(str(e))
+
+        if bool(targets[0][1]) != bool(targets[1][1]):
+            raise_error(
+                "Both targets should have a profile (<profile>@<spec>), "
+                "or none of them."
+            )
+
+        changes: Iterable[diffs.Change]
+        if targets[0][1]:
+            # the deployed releases are compared with the spec they were
+            # deployed with, stored in the data lock files
+            old_release, new_release = self._read_diff_releases(
+                targets, passwords or {}
+            )
+            changes = itertools.chain(
+                diffs.diff_specs(
+                    get_spec_files(old_release), get_spec_files(new_release)
+                ),
+                diffs.diff_values(
+                    get_profile_files(old_release, targets[0][1]),
+                    get_profile_files(new_release, targets[1][1]),
+                ),
+            )
+        else:
+            old_files, new_files = self._load_spec_files(
+                [spec for spec, _ in targets]
+            )
+            changes = diffs.diff_specs(old_files, new_files)
+
+        # the changes are printed as they are found
+        count = 0
+        for change in changes:
+            typer.echo(str(change))
+            count += 1
+
+        typer.echo(
+            f"{count} difference(s) between {old} and {new}."
+            if count
+            else f"No differences between {old} and {new}."
         )
+        return count
+
+    def _load_spec_files(self, versions: list[str]) -> list[dict[str, Any]]:
+        """Return the files of the spec of each release, from specs.yaml."""
+        specs_file = SpecFile(Path(".envers") / ENVERS_SPEC_FILENAME)
+        if not specs_file.exists():
+            raise_error("Spec file not found. Please initialize envers first.")
+
+        spec_files = []
+        for version in versions:
+            spec_data = specs_file.load_release(version) or {}
+            if not spec_data:
+                raise_error(f"Version {version} not found in specs.yaml.")
+            spec_files.append(get_spec_files(spec_data))
+        return spec_files
+
+    def _read_diff_releases(
+        self, targets: list[tuple[str, str]], passwords: dict[str, str]
+    ) -> list[dict[str, Any]]:
+        """
+        Return the deployed release of each `(spec, profile)` target.
+
+        Each data lock file is decrypted once, for both targets.
+        """
+        releases_by_profile: dict[str, list[str]] = {}
+        for spec, profile in targets:
+            releases_by_profile.setdefault(profile, []).append(spec)
+
+        data_locks = {}
+        for profile, releases in releases_by_profile.items():
+            data_file = Path(".envers") / "data" / f"{profile}.lock"
+            if not data_file.exists():
+                raise_error(f"Data lock file of {profile} not found.")
+            data_locks[profile] = self._read_data_file(
+                profile, passwords.get(profile), releases
+            )
+
+        deployed = []
+        for spec, profile in targets:
+            release = data_locks[profile].get("releases", {}).get(spec)
+            if not release:
+                raise_error(
+                    f"Version {spec} not found in the data.lock of {profile}."
+                )
+            deployed.append(release)
+        return deployed
+
+    def gc(self, profile: str, password: Optional[str] = None) -> int:
+        """
+        Remove the values no longer used by any release of a profile.
+
+        The values of the data lock files are stored once and shared by the
+        releases, so the values replaced by newer ones are kept until they
+        are collected.
+
+        Parameters
+        ----------
+        profile : str
+            The profile of the data lock file.
+        password : Optional[str]
+            The password of the profile.
+
+        Returns
+        -------
+        int
+            The number of values removed.
+        """
+        data_file = Path(".envers") / "data" / f"{profile}.lock"
+
+        if not data_file.exists():
+            raise_error(
+                "Data lock file not found. Please deploy a version first."
+            )
+
+        # only the metadata is read, the releases are decrypted to find the
+        # values they use, and only the changed value batches are encrypted
+        # again
+        data_lock = self._read_data_file(profile, password, releases=())
+        try:
+            removed = self._locks[profile].collect_garbage(self._keys[profile])
+        except Exception:
+            raise_error(
+                "The data.lock is not valid. Please remove it to proceed."
+            )
+
+        if removed:
+            self._write_data_file(profile, data_lock)
+
+        typer.echo(
+            f"{removed} unused value(s) removed from the data lock file for "
+            f"profile '{profile}'."
+        )
+        return removed
+
+    def rekey(
+        self,
+        profile: str,
+        password: Optional[str] = None,
+        new_password: Optional[str] = None,
+        kdf_params: Optional[crypt.KDFParams] = None,
+    ) -> None:
+        """
+        Re-encrypt the data lock file of a profile.
+
+        Migrate the data lock file to the current format, using a new salt
+        and the given KDF parameters. It can also be used to change the
+        password of the profile.
+
+        Parameters
+        ----------
+        profile : str
+            The name of the profile to rekey.
+        password : Optional[str]
+            The current password of that profile.
+        new_password : Optional[str]
+            The new password for that profile. Defaults to the current one.
+        kdf_params : Optional[crypt.KDFParams]
+            The KDF parameters for the new encryption. Defaults to the ones
+            configured by `ENVERS_KDF` and `ENVERS_KDF_COST`.
+
+        Returns
+        -------
+        None
+        """
+        data_file = Path(".envers") / "data" / f"{profile}.lock"
+
+        if not data_file.exists():
+            raise_error(
+                "Data lock file not found. Please deploy a version first."
+            )
+
+        if password is None:
+            password = crypt.get_password()
+
+        data_lock = self._read_data_file(profile, password)
+
+        # replace the current data lock and key, so all the releases are
+        # encrypted again with a new salt and the new KDF parameters
+        new_lock = lockfile.DataLock.create(kdf_params)
+        new_lock.generation = self._locks[profile].generation
+        self._locks[profile] = new_lock
+        self._keys.pop(profile, None)
+
+        if new_password is None:
+            new_password = password
+
+        self._write_data_file(profile, data_lock, new_password)
+
+        typer.echo(f"The data lock file for profile '{profile}' was rekeyed.")
@@ -3,38 +3,299 @@
 from __future__ import annotations
 
 import base64
+import hashlib
+import hmac
 import os
+import re
 import sys
+import threading
 
-from typing import Optional, cast
-
-import typer
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple, cast
 
 from cryptography.fernet import Fernet
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+from envers.errors import InvalidOptionError
+from envers.timings import span
 
 SALT_LENGTH = 16
+HEX_SALT_LENGTH = SALT_LENGTH * 2
+
+# encrypted data written by envers starts with a self-describing header:
+#   $envers$<format version>$<field>=<value>,...$<fernet token>
+# data without this prefix uses the legacy layout: <salt hex><fernet token>
+HEADER_PREFIX = "$envers$"
+HEADER_SEPARATOR = "$"
+# version 1: the header is followed by a single Fernet token
+LOCK_FORMAT_VERSION = 1
+# version 2: the header is followed by an index and one Fernet token per
+# segment (see envers.lockfile)
+LOCK_FORMAT_SEGMENTED = 2
+LOCK_FORMAT_VERSIONS = (LOCK_FORMAT_VERSION, LOCK_FORMAT_SEGMENTED)
+
+KDF_PBKDF2 = "pbkdf2-sha256"
+KDF_SCRYPT = "scrypt"
+KDF_ALGORITHMS = (KDF_PBKDF2, KDF_SCRYPT)
+
+# default cost for each KDF, used when ENVERS_KDF_COST is not set
+KDF_DEFAULT_COST = {
+    KDF_PBKDF2: 100000,  # iterations
+    KDF_SCRYPT: 2**15,  # n, the CPU/memory cost
+}
+
+# maximum number of derived keys kept in memory by the key cache
+KEY_CACHE_SIZE = 32
+
+# password for the non-interactive commands, `ENVERS_PASSWORD_<PROFILE>`
+# sets the password of a single profile
+PASSWORD_ENV = "ENVERS_PASSWORD"
+
+
+@dataclass(frozen=True)
+class KDFParams:
+    """Parameters of the key derivation function."""
+
+    algorithm: str = KDF_PBKDF2
+    cost: int = KDF_DEFAULT_COST[KDF_PBKDF2]
+    # scrypt only
+    block_size: int = 8
+    parallelism: int = 1
+
+    def __post_init__(self) -> None:
+        """Validate the KDF parameters."""
+        if self.algorithm not in KDF_ALGORITHMS:
+            raise ValueError(f"Unsupported KDF: {self.algorithm}.")
+        if self.cost < 1:
+            raise ValueError("The KDF cost should be a positive number.")
+        if self.algorithm == KDF_SCRYPT and self.cost & (self.cost - 1):
+            raise ValueError("The scrypt cost should be a power of 2.")
+
+    def to_fields(self) -> dict[str, str]:
+        """Return the parameters as header fields."""
+        if self.algorithm == KDF_SCRYPT:
+            return {
+                "kdf": self.algorithm,
+                "n": str(self.cost),
+                "r": str(self.block_size),
+                "p": str(self.parallelism),
+            }
+        return {"kdf": self.algorithm, "i": str(self.cost)}
+
+    @classmethod
+    def from_fields(cls, fields: dict[str, str]) -> KDFParams:
+        """Create the parameters from the header fields."""
+        algorithm = fields.get("kdf", "")
+        if algorithm == KDF_SCRYPT:
+            return cls(
+                algorithm,
+                int(fields["n"]),
+                block_size=int(fields["r"]),
+                parallelism=int(fields["p"]),
+            )
+        if algorithm == KDF_PBKDF2:
+            return cls(algorithm, int(fields["i"]))
+        raise ValueError(f"Unsupported KDF: {algorithm}.")
+
+
+# parameters used by the files written before the header was introduced
+LEGACY_KDF = KDFParams()
+
+
+@dataclass(frozen=True)
+class LockHeader:
+    """Metadata stored in front of the encrypted data."""
+
+    kdf: KDFParams
+    salt: bytes
+    version: int = LOCK_FORMAT_VERSION
+    # how the decrypted payload is serialized (see envers.serialization),
+    # only recorded by the segmented format
+    encoding: str = "yaml"
+    compression: str = "none"
+
+    def dumps(self) -> str:
+        """Return the header in its text form."""
+        fields = {**self.kdf.to_fields(), "salt": self.salt.hex()}
+        if self.version >= LOCK_FORMAT_SEGMENTED:
+            fields.update(enc=self.encoding, z=self.compression)
+        params = ",".join(f"{name}={value}" for name, value in fields.items())
+        return (
+            f"{HEADER_PREFIX}{self.version}{HEADER_SEPARATOR}"
+            f"{params}{HEADER_SEPARATOR}"
+        )
+
 
+def get_kdf_params(
+    algorithm: Optional[str] = None, cost: Optional[int] = None
+) -> KDFParams:
+    """
+    Return the KDF parameters used for new encrypted data.
 
-def create_fernet_key(password: str, salt: bytes) -> bytes:
-    """Create a Fernet key."""
-    # Use PBKDF2HMAC to derive a Fernet-compatible key from the user password
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-        backend=default_backend(),
+    The values not given fall back to the environment variables
+    `ENVERS_KDF` and `ENVERS_KDF_COST`, so the cost can be tuned per
+    machine (e.g. CI runners versus laptops). The values of the variables
+    that are not valid raise InvalidOptionError.
+    """
+    if not algorithm:
+        algorithm = os.getenv("ENVERS_KDF") or KDF_PBKDF2
+        if algorithm not in KDF_ALGORITHMS:
+            raise InvalidOptionError(
+                f"The KDF `{algorithm}` set by ENVERS_KDF is not supported, "
+                f"use one of: {', '.join(KDF_ALGORITHMS)}."
+            )
+    elif algorithm not in KDF_ALGORITHMS:
+        raise ValueError(f"Unsupported KDF: {algorithm}.")
+
+    if cost is None:
+        cost = _get_env_cost(algorithm)
+
+    return KDFParams(algorithm, cost)
+
+
+def _get_env_cost(algorithm: str) -> int:
+    """Return the KDF cost set by `ENVERS_KDF_COST`, or the default one."""
+    env_cost = os.getenv("ENVERS_KDF_COST", "")
+    if not env_cost:
+        return KDF_DEFAULT_COST[algorithm]
+    try:
+        return KDFParams(algorithm, int(env_cost)).cost
+    except ValueError:
+        raise InvalidOptionError(
+            f"The KDF cost `{env_cost}` set by ENVERS_KDF_COST is not valid, "
+            "use a positive integer (a power of 2 for scrypt)."
+        )
+
+
+def parse_header(data: str) -> tuple[LockHeader, str]:
+    """
+    Split the encrypted data into its header and its payload.
+
+    For the format version 1, the payload is a single Fernet token.
+
+    Data written in the legacy layout (a bare salt followed by the token)
+    returns a header with version 0 and the legacy KDF parameters.
+    """
+    if not data.startswith(HEADER_PREFIX):
+        salt = bytes.fromhex(data[:HEX_SALT_LENGTH])
+        return (
+            LockHeader(LEGACY_KDF, salt, version=0),
+            data[HEX_SALT_LENGTH:],
+        )
+
+    try:
+        version, params, token = data[len(HEADER_PREFIX) :].split(
+            HEADER_SEPARATOR, 2
+        )
+        fields = dict(field.split("=", 1) for field in params.split(","))
+        salt = bytes.fromhex(fields["salt"])
+    except (KeyError, ValueError):
+        raise ValueError("The encrypted data header is not valid.")
+
+    if int(version) not in LOCK_FORMAT_VERSIONS:
+        raise ValueError(
+            f"Unsupported encrypted data format version: {version}."
+        )
+
+    header = LockHeader(
+        KDFParams.from_fields(fields),
+        salt,
+        int(version),
+        encoding=fields.get("enc", "yaml"),
+        compression=fields.get("z", "none"),
     )
-    return base64.urlsafe_b64encode(kdf.derive(password.encode("utf-8")))
+    return header, token
+
+
+# the cache is indexed by an HMAC of the password (never the password
+# itself), using a secret that only lives in this process
+_KEY_CACHE_SECRET = os.urandom(32)
+_key_cache: OrderedDict[Tuple[bytes, bytes, KDFParams], bytearray] = (
+    OrderedDict()
+)
+_key_cache_lock = threading.Lock()
+
+
+def _wipe(buffer: bytearray) -> None:
+    """Overwrite the given buffer with zeros."""
+    buffer[:] = bytes(len(buffer))
+
+
+def _derive_key(password: str, salt: bytes, kdf_params: KDFParams) -> bytes:
+    """Derive a Fernet-compatible key from the user password."""
+    kdf: PBKDF2HMAC | Scrypt
+    if kdf_params.algorithm == KDF_SCRYPT:
+        kdf = Scrypt(
+            salt=salt,
+            length=32,
+            n=kdf_params.cost,
+            r=kdf_params.block_size,
+            p=kdf_params.parallelism,
+            backend=default_backend(),
+        )
+    else:
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=kdf_params.cost,
+            backend=default_backend(),
+        )
+    with span("kdf"):
+        derived = kdf.derive(password.encode("utf-8"))
+    return base64.urlsafe_b64encode(derived)
+
+
+def create_fernet_key(
+    password: str, salt: bytes, kdf_params: KDFParams = LEGACY_KDF
+) -> bytes:
+    """
+    Create a Fernet key.
+
+    Derived keys are memoized per process, indexed by the password, the
+    salt and the KDF parameters, so the same key is never derived twice
+    during the same run.
+    """
+    password_digest = hmac.new(
+        _KEY_CACHE_SECRET, password.encode("utf-8"), hashlib.sha256
+    ).digest()
+    cache_id = (password_digest, salt, kdf_params)
+
+    with _key_cache_lock:
+        cached_key = _key_cache.get(cache_id)
+        if cached_key is not None:
+            _key_cache.move_to_end(cache_id)
+            return bytes(cached_key)
+
+    key = _derive_key(password, salt, kdf_params)
+
+    with _key_cache_lock:
+        _key_cache[cache_id] = bytearray(key)
+        while len(_key_cache) > KEY_CACHE_SIZE:
+            _, evicted_key = _key_cache.popitem(last=False)
+            _wipe(evicted_key)
+    return key
+
+
+def clear_key_cache() -> None:
+    """Wipe and remove all the derived keys kept in memory."""
+    with _key_cache_lock:
+        for key in _key_cache.values():
+            _wipe(key)
+        _key_cache.clear()
 
 
 def get_password(message: str = "") -> str:
     """Prompt a password."""
     if sys.stdin.isatty():
-        # Interactive mode: Use Typer's prompt
+        # Interactive mode: Use Typer's prompt (imported here, so the library
+        # API does not depend on typer)
+        import typer
+
         message = "Enter your password" if not message else message
         password = cast(str, typer.prompt(message, hide_input=True))
     else:
@@ -43,36 +304,136 @@ def get_password(message: str = "") -> str:
     return password
 
 
+def get_password_env_name(profile: str) -> str:
+    """Return the environment variable with the password of a profile."""
+    return f"{PASSWORD_ENV}_{re.sub(r'[^0-9A-Za-z]', '_', profile).upper()}"
+
+
+def read_passwords(fd: int) -> dict[str, str]:
+    """
+    Read the passwords of several profiles from a file descriptor.
+
+    Each line has the form `<profile>=<password>`. Empty lines and lines
+    starting with `#` are ignored. The file descriptor is not closed.
+    """
+    passwords = {}
+    with open(fd, "r", encoding="utf-8", closefd=False) as file:
+        for line in file:
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            profile, separator, password = line.partition("=")
+            if not separator or not profile.strip():
+                raise ValueError(
+                    "The password lines should have the form "
+                    "<profile>=<password>."
+                )
+            passwords[profile.strip()] = password
+    return passwords
+
+
+def get_profile_passwords(
+    profiles: list[str], fd: Optional[int] = None
+) -> dict[str, str]:
+    """
+    Return the passwords available for the given profiles.
+
+    The passwords are read from the file descriptor `fd` (see
+    `read_passwords`), then from the environment variable of each profile
+    (e.g. `ENVERS_PASSWORD_BASE`) and then from `ENVERS_PASSWORD`, in that
+    order. The profiles without any password are not returned.
+    """
+    fd_passwords = read_passwords(fd) if fd is not None else {}
+    default_password = os.getenv(PASSWORD_ENV)
+
+    passwords = {}
+    for profile in profiles:
+        password = fd_passwords.get(profile)
+        if password is None:
+            password = os.getenv(
+                get_password_env_name(profile), default_password
+            )
+        if password is not None:
+            passwords[profile] = password
+    return passwords
+
+
 def generate_salt() -> bytes:
     """Generate a salt in byte format."""
     return os.urandom(SALT_LENGTH)
 
 
-def encrypt_data(data: str, password: Optional[str] = None) -> str:
-    """Encrypt the given data."""
-    if password is None:
-        password = get_password()
+def get_salt(data: str) -> bytes:
+    """Return the salt used by the given encrypted data."""
+    header, _ = parse_header(data)
+    return header.salt
 
-    salt = generate_salt()
-    salt_hex = salt.hex()
-    key = create_fernet_key(password, salt)
+
+def encrypt_bytes(data: bytes, key: bytes) -> str:
+    """Encrypt the given bytes into a Fernet token."""
     cipher_suite = Fernet(key)
 
-    encrypted = cipher_suite.encrypt(data.encode("utf-8")).decode("utf-8")
-    return salt_hex + encrypted
+    with span("encrypt"):
+        return cipher_suite.encrypt(data).decode("utf-8")
 
 
-def decrypt_data(data: str, password: Optional[str] = None) -> str:
-    """Decrypt the given data."""
+def decrypt_bytes(token: str, key: bytes) -> bytes:
+    """Decrypt the given Fernet token into bytes."""
+    cipher_suite = Fernet(key)
+
+    with span("decrypt"):
+        return cipher_suite.decrypt(token.encode("utf-8"))
+
+
+def encrypt_token(data: str, key: bytes) -> str:
+    """Encrypt the given data into a Fernet token."""
+    return encrypt_bytes(data.encode("utf-8"), key)
+
+
+def encrypt_with_key(data: str, key: bytes, header: LockHeader) -> str:
+    """Encrypt the given data with an already derived key."""
+    return header.dumps() + encrypt_token(data, key)
+
+
+def decrypt_with_key(token: str, key: bytes) -> str:
+    """Decrypt the given Fernet token with an already derived key."""
+    return decrypt_bytes(token, key).decode("utf-8")
+
+
+def encrypt_data(
+    data: str,
+    password: Optional[str] = None,
+    salt: Optional[bytes] = None,
+    kdf_params: Optional[KDFParams] = None,
+) -> str:
+    """
+    Encrypt the given data.
+
+    When `salt` and `kdf_params` are given (e.g. the ones from the file
+    that was just read), they are reused instead of generating new ones,
+    so the derived key can be served from the key cache.
+    """
     if password is None:
         password = get_password()
 
-    HEX_SALT_LENGTH = SALT_LENGTH * 2
+    if salt is None:
+        salt = generate_salt()
+    if kdf_params is None:
+        kdf_params = get_kdf_params()
 
-    salt_hex, data_clean = data[:HEX_SALT_LENGTH], data[HEX_SALT_LENGTH:]
-    salt = bytes.fromhex(salt_hex)
+    header = LockHeader(kdf_params, salt)
+    key = create_fernet_key(password, salt, kdf_params)
+    return encrypt_with_key(data, key, header)
 
-    key = create_fernet_key(password, salt)
-    cipher_suite = Fernet(key)
 
-    return cipher_suite.decrypt(data_clean.encode("utf-8")).decode("utf-8")
+def decrypt_data(data: str, password: Optional[str] = None) -> str:
+    """Decrypt the given data, in the current or in the legacy layout."""
+    header, token = parse_header(data)
+    if header.version == LOCK_FORMAT_SEGMENTED:
+        raise ValueError("Segmented data should be read by envers.lockfile.")
+
+    if password is None:
+        password = get_password()
+
+    key = create_fernet_key(password, header.salt, header.kdf)
+    return decrypt_with_key(token, key)
@@ -0,0 +1,136 @@
+"""Comparison of the releases and of the profile values."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Iterator, Mapping
+
+from envers.serialization import hash_value
+
+# the attributes of a variable or file shown in full in the changes, the
+# other ones (e.g. `default`, `docs`) are only reported as changed
+_SHOWN_ATTRIBUTES = ("type",)
+
+
+@dataclass(frozen=True)
+class Change:
+    """A difference between two releases or profiles."""
+
+    kind: str  # "+" (added), "-" (removed) or "~" (changed)
+    path: str  # `file` or `file:VAR`
+    detail: str = ""
+
+    def __str__(self) -> str:
+        """Return the change as one line of the diff output."""
+        line = f"{self.kind} {self.path}"
+        return f"{line} ({self.detail})" if self.detail else line
+
+
+def parse_target(target: str) -> tuple[str, str]:
+    """
+    Parse a diff target, `<spec>` or `<profile>@<spec>`.
+
+    Returns
+    -------
+    tuple[str, str]
+        The spec version and the profile name (empty when not given).
+    """
+    profile, separator, spec = target.rpartition("@")
+    if not spec or (separator and not profile):
+        raise ValueError(
+            f"Invalid target `{target}`, expected <spec> or <profile>@<spec>."
+        )
+    return spec, profile
+
+
+def _diff_attributes(old: Mapping[str, Any], new: Mapping[str, Any]) -> str:
+    """Describe the attributes that differ, ignoring the nested `vars`."""
+    changes = []
+    for name in sorted({*old, *new} - {"vars"}):
+        old_value, new_value = old.get(name), new.get(name)
+        if old_value == new_value:
+            continue
+        if name in _SHOWN_ATTRIBUTES:
+            changes.append(f"{name}: {old_value} -> {new_value}")
+        else:
+            changes.append(f"{name} changed")
+    return ", ".join(changes)
+
+
+def _diff_keys(
+    old: Mapping[str, Any], new: Mapping[str, Any], prefix: str = ""
+) -> Iterator[tuple[str, str, Any, Any]]:
+    """
+    Yield `(kind, path, old, new)` for the keys of both mappings.
+
+    The keys in both mappings are yielded with the kind `=`, in the order
+    of `old`, then the keys only in `new`. Each key is looked up once, so
+    the comparison is linear in the number of keys.
+    """
+    for key, old_value in old.items():
+        if key in new:
+            yield "=", f"{prefix}{key}", old_value, new[key]
+        else:
+            yield "-", f"{prefix}{key}", old_value, None
+    for key, new_value in new.items():
+        if key not in old:
+            yield "+", f"{prefix}{key}", None, new_value
+
+
+def diff_specs(
+    old_files: Mapping[str, Any], new_files: Mapping[str, Any]
+) -> Iterator[Change]:
+    """
+    Yield the changes between the files (`spec.files`) of two releases.
+
+    Files and variables are matched by their path and name. The default
+    values are not shown, only reported as changed.
+    """
+    for kind, file_path, old_file, new_file in _diff_keys(
+        old_files, new_files
+    ):
+        if kind != "=":
+            yield Change(kind, file_path)
+            continue
+
+        detail = _diff_attributes(old_file, new_file)
+        if detail:
+            yield Change("~", file_path, detail)
+
+        for var_kind, var_path, old_var, new_var in _diff_keys(
+            old_file.get("vars") or {},
+            new_file.get("vars") or {},
+            f"{file_path}:",
+        ):
+            if var_kind != "=":
+                yield Change(var_kind, var_path)
+                continue
+            detail = _diff_attributes(old_var or {}, new_var or {})
+            if detail:
+                yield Change("~", var_path, detail)
+
+
+def diff_values(
+    old_files: Mapping[str, Any], new_files: Mapping[str, Any]
+) -> Iterator[Change]:
+    """
+    Yield the variables whose values differ between two profile data.
+
+    Only the variables in both data are compared (the added and removed
+    ones are reported by `diff_specs`). The values are compared by their
+    hash and never shown, as they are usually secrets.
+    """
+    for kind, file_path, old_file, new_file in _diff_keys(
+        old_files, new_files
+    ):
+        if kind != "=":
+            continue
+        for var_kind, var_path, old_value, new_value in _diff_keys(
+            old_file.get("vars") or {},
+            new_file.get("vars") or {},
+            f"{file_path}:",
+        ):
+            if var_kind == "=" and (
+                hash_value(old_value) != hash_value(new_value)
+            ):
+                yield Change("~", var_path, "value changed")
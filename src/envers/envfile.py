@@ -0,0 +1,251 @@
+"""Reader and writer for the environment files."""
+
+from __future__ import annotations
+
+import glob
+import hashlib
+import os
+import re
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Mapping, Optional, Sequence
+
+from dotenv import dotenv_values
+
+from envers.errors import InvalidOptionError
+from envers.files import atomic_open
+from envers.timings import span
+
+# values made only of these characters are written without quotes
+_PLAIN_VALUE = re.compile(r"[\w.,:/@%+=-]*")
+# in single quotes, only a quote and a backslash before a quote, another
+# backslash or the closing quote are escaped
+_SINGLE_QUOTE_ESCAPES = re.compile(r"'|\\(?=[\\']|\Z)")
+_DOUBLE_QUOTE_ESCAPES = {
+    "\\": "\\\\",
+    '"': '\\"',
+    "\n": "\\n",
+    "\r": "\\r",
+    "\t": "\\t",
+}
+_WRITE_BUFFER_SIZE = 64 * 1024
+_GLOB_CHARACTERS = re.compile(r"[*?[]")
+
+
+def format_value(value: Any) -> str:
+    """
+    Return the value quoted as needed for a dotenv file.
+
+    Simple values are written as they are. Values with other characters
+    are single-quoted, and values that cannot be single-quoted are
+    double-quoted with their special characters escaped. Values with a `$`
+    are always single-quoted, with their quotes (and the backslashes before
+    them) escaped: docker compose does not expand the single-quoted values,
+    but python-dotenv expands `${VAR}` whatever the quotes, so it reads the
+    value back only when loaded with `interpolate=False`.
+    """
+    if value is None:
+        return ""
+
+    text = str(value)
+
+    if _PLAIN_VALUE.fullmatch(text):
+        return text
+
+    if "$" in text or not any(char in text for char in "'\\\n\r"):
+        escaped = _SINGLE_QUOTE_ESCAPES.sub(r"\\\g<0>", text)
+        return f"'{escaped}'"
+
+    escaped = "".join(_DOUBLE_QUOTE_ESCAPES.get(char, char) for char in text)
+    return f'"{escaped}"'
+
+
+def iter_lines(variables: Mapping[str, Any]) -> Iterator[str]:
+    """Yield the lines of the dotenv file for the given variables."""
+    for name, value in variables.items():
+        yield f"{name}={format_value(value)}\n"
+
+
+def _hash_lines(lines: Iterable[str]) -> str:
+    content_hash = hashlib.sha256()
+    for line in lines:
+        content_hash.update(line.encode("utf-8"))
+    return content_hash.hexdigest()
+
+
+def _hash_file(path: Path) -> str:
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(_WRITE_BUFFER_SIZE), b""):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def write_dotenv(path: Path, variables: Mapping[str, Any]) -> int:
+    """
+    Write the variables to a dotenv file.
+
+    The lines are streamed to a temporary file that atomically replaces
+    the target. When the target already has the same content it is not
+    touched at all, so file watchers are not triggered.
+
+    Returns
+    -------
+    int
+        The number of bytes written, 0 when the file did not change.
+    """
+    path = Path(path)
+
+    if path.is_file() and _hash_file(path) == _hash_lines(
+        iter_lines(variables)
+    ):
+        return 0
+
+    os.makedirs(path.parent, exist_ok=True)
+
+    with atomic_open(
+        path, "w", encoding="utf-8", newline="", buffering=_WRITE_BUFFER_SIZE
+    ) as file:
+        file.writelines(iter_lines(variables))
+    return path.stat().st_size
+
+
+@dataclass
+class WriteResult:
+    """Outcome of writing one environment file."""
+
+    path: str
+    size: int = 0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+    # if the file did not exist before
+    created: bool = False
+
+
+def _write_file(path: str, variables: Mapping[str, Any]) -> WriteResult:
+    start = time.perf_counter()
+    # a new file is created even when it is empty
+    created = not os.path.lexists(path)
+    try:
+        # the lines are rendered while they are written
+        with span("write"):
+            size = write_dotenv(Path(path), variables)
+    except OSError as e:
+        return WriteResult(
+            path, elapsed=time.perf_counter() - start, error=str(e)
+        )
+    return WriteResult(
+        path, size, time.perf_counter() - start, created=created
+    )
+
+
+def check_jobs(jobs: int) -> None:
+    """Raise InvalidOptionError when the number of jobs is negative."""
+    if jobs < 0:
+        raise InvalidOptionError(
+            f"The number of jobs should be 0 (automatic) or more, not {jobs}."
+        )
+
+
+def write_files(
+    files: Mapping[str, Mapping[str, Any]], jobs: int = 0
+) -> list[WriteResult]:
+    """
+    Render and write the environment files concurrently.
+
+    Parameters
+    ----------
+    files : Mapping[str, Mapping[str, Any]]
+        The variables for each file path.
+    jobs : int
+        The maximum number of files written at the same time. When it is
+        0, the number of threads is chosen by the thread pool.
+
+    Returns
+    -------
+    list[WriteResult]
+        The result for each file, in the same order as the given files, so
+        the report (and the errors) do not depend on the scheduling.
+
+    Raises
+    ------
+    InvalidOptionError
+        When the number of jobs is negative.
+    """
+    check_jobs(jobs)
+    if jobs == 1 or len(files) <= 1:
+        return [
+            _write_file(path, variables) for path, variables in files.items()
+        ]
+
+    with ThreadPoolExecutor(max_workers=jobs or None) as executor:
+        return list(executor.map(_write_file, files.keys(), files.values()))
+
+
+def expand_paths(patterns: Iterable[str]) -> list[str]:
+    """
+    Return the files matched by the given paths or glob patterns.
+
+    Each file is returned once, in the order of the patterns (and sorted
+    for each pattern). `**` matches any number of directories.
+
+    Raises FileNotFoundError when a path does not exist or when a pattern
+    does not match any file.
+    """
+    paths: dict[str, None] = {}
+    for pattern in patterns:
+        if _GLOB_CHARACTERS.search(pattern):
+            matches = sorted(
+                path
+                for path in glob.glob(pattern, recursive=True)
+                if os.path.isfile(path)
+            )
+            if not matches:
+                raise FileNotFoundError(f"No .env file matches {pattern}.")
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            raise FileNotFoundError(f".env file {pattern} not found.")
+
+        paths.update(dict.fromkeys(matches))
+    return list(paths)
+
+
+def _read_file(path: str) -> dict[str, Optional[str]]:
+    with span("parse"):
+        return dict(dotenv_values(path, interpolate=False))
+
+
+def read_files(
+    paths: Sequence[str], jobs: int = 0
+) -> list[dict[str, Optional[str]]]:
+    """
+    Read the variables of the dotenv files concurrently.
+
+    Parameters
+    ----------
+    paths : Sequence[str]
+        The paths of the files.
+    jobs : int
+        The maximum number of files read at the same time. When it is 0,
+        the number of threads is chosen by the thread pool.
+
+    Returns
+    -------
+    list[dict[str, Optional[str]]]
+        The variables of each file, in the same order as the given paths.
+
+    Raises
+    ------
+    InvalidOptionError
+        When the number of jobs is negative.
+    """
+    check_jobs(jobs)
+    if jobs == 1 or len(paths) <= 1:
+        return [_read_file(path) for path in paths]
+
+    with ThreadPoolExecutor(max_workers=jobs or None) as executor:
+        return list(executor.map(_read_file, paths))
@@ -0,0 +1,47 @@
+"""Exceptions raised by the envers library API."""
+
+from __future__ import annotations
+
+
+class EnversError(Exception):
+    """Base class for the envers errors."""
+
+
+class DataLockNotFoundError(EnversError):
+    """The data lock file of the profile does not exist."""
+
+
+class InvalidDataLockError(EnversError):
+    """The data lock file cannot be read."""
+
+
+class PasswordRequiredError(EnversError):
+    """No password or key is available for the data lock file."""
+
+
+class InvalidPasswordError(EnversError):
+    """The password is not correct for the data lock file."""
+
+
+class ReleaseNotFoundError(EnversError):
+    """The spec version is not deployed in the data lock file."""
+
+
+class ProfileNotFoundError(EnversError):
+    """The profile (or a file of it) is not in the deployed spec version."""
+
+
+class ConflictError(EnversError):
+    """Another process changed (or is changing) the same envers files."""
+
+
+class TemplateError(EnversError):
+    """A value references an undefined variable, or the references loop."""
+
+
+class InvalidOptionError(EnversError, ValueError):
+    """An option is not valid, e.g. a path template or a number of jobs."""
+
+
+class InvalidSpecError(EnversError, ValueError):
+    """The definition of a variable in the spec is not valid."""
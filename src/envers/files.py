@@ -0,0 +1,147 @@
+"""Functions for writing files safely."""
+
+from __future__ import annotations
+
+import os
+import secrets
+import stat
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Iterator, Optional
+
+from envers.errors import ConflictError
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # advisory locks are not available (e.g. on Windows)
+    fcntl = None  # type: ignore[assignment]
+
+# how long (in seconds) to wait for a lock held by another process, it can
+# be changed with ENVERS_LOCK_TIMEOUT
+LOCK_DEFAULT_TIMEOUT = 10.0
+LOCK_POLL_INTERVAL = 0.05
+
+
+@contextmanager
+def atomic_open(
+    path: Path, mode: str = "w", **kwargs: Any
+) -> Iterator[IO[Any]]:
+    """
+    Open a temporary file that replaces the given path when it is closed.
+
+    Readers never see a partially written file: the content is written to a
+    temporary file in the same directory, which is renamed over the target
+    only if the block finishes without errors. The permissions of an
+    existing target are kept.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{secrets.token_hex(8)}.tmp")
+
+    # as open() does, the permissions of a new file follow the umask
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, mode, **kwargs) as file:
+            yield file
+        if path.exists():
+            os.chmod(tmp_path, stat.S_IMODE(path.stat().st_mode))
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink()
+        raise
+
+
+def atomic_write(path: Path, content: bytes) -> None:
+    """Write the content to a temporary file and rename it to the path."""
+    with atomic_open(path, "wb") as file:
+        file.write(content)
+
+
+def make_private_dir(directory: Path) -> None:
+    """
+    Create a directory only accessible by the current user.
+
+    It is used for the Unix sockets. Raises PermissionError when the
+    directory already exists but it is owned by another user or it is
+    accessible by other users.
+    """
+    directory = Path(directory)
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    dir_stat = directory.stat()
+    if dir_stat.st_uid != os.getuid() or stat.S_IMODE(dir_stat.st_mode) & (
+        stat.S_IRWXG | stat.S_IRWXO
+    ):
+        raise PermissionError(
+            f"The directory {directory} should be owned by the current "
+            "user with mode 0700."
+        )
+
+
+@contextmanager
+def private_socket(socket_path: Path) -> Iterator[None]:
+    """
+    Prepare a Unix socket only accessible by the current user.
+
+    The socket should be bound inside the context: its directory is created
+    with `make_private_dir`, a previous socket is removed, and the socket is
+    created with mode 0600.
+    """
+    socket_path = Path(socket_path)
+    make_private_dir(socket_path.parent)
+    if socket_path.exists():
+        socket_path.unlink()
+
+    old_umask = os.umask(0o177)
+    try:
+        yield
+    finally:
+        os.umask(old_umask)
+    os.chmod(socket_path, 0o600)
+
+
+def get_lock_timeout() -> float:
+    """Return the lock timeout, from ENVERS_LOCK_TIMEOUT if it is set."""
+    return float(os.getenv("ENVERS_LOCK_TIMEOUT", LOCK_DEFAULT_TIMEOUT))
+
+
+@contextmanager
+def file_lock(path: Path, timeout: Optional[float] = None) -> Iterator[None]:
+    """
+    Hold an exclusive advisory lock on the given file or directory.
+
+    The lock is only respected by the processes that use it too, and it is
+    released when the block finishes (or the process dies). Locking a
+    directory that is not replaced by the writes (e.g. `.envers`) keeps
+    the lock stable while the files inside are atomically replaced.
+
+    Raises ConflictError when the lock is not acquired within the timeout
+    (by default, `get_lock_timeout()`).
+    """
+    if fcntl is None:  # pragma: no cover
+        yield
+        return
+
+    timeout = get_lock_timeout() if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise ConflictError(
+                        f"{path} is locked by another envers process."
+                    )
+                time.sleep(LOCK_POLL_INTERVAL)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
@@ -0,0 +1,444 @@
+"""
+Segmented container for the profile data lock files.
+
+A data lock file stores each release in its own encrypted segment, so a
+command that needs a single release only decrypts that release, and a
+command that changes a single release only re-encrypts that release. The
+layout is::
+
+    $envers$2$<kdf and salt fields>$
+    <index>
+    <segment><segment>...
+
+The index is a JSON line (not encrypted) with the offset and the length of
+each release segment, relative to the end of the index line, the metadata
+of the lock (e.g. its version), a check value used to validate the key
+before decrypting or appending any segment and the generation of the file,
+incremented by each write, used to detect concurrent writers. The header
+records how the segments payload is encoded and compressed (see
+envers.serialization).
+
+The variable values are stored once, content-addressed: the releases
+listed by `refs` in the index store the hashes of their values instead of
+the values, and the values are stored in value batches (encrypted segments
+too, mapping the hash of each value to the value). Each write adds at most
+one batch, with the values not found in the batches of the other releases,
+and `refs` lists the batches of each release, so reading a release
+decrypts only its batches, whatever the size of the history (a write
+decrypts the batches of the other releases, to reuse their values).
+
+The batches only used by the previous version of the written releases are
+not reused: their values are moved to the new batch, and the batches no
+longer referenced by any release are dropped, so a replaced value does not
+outlive the write. A replaced value in a batch still used by another
+release is removed by `collect_garbage`.
+The releases written before the value batches keep their values until
+they are written again.
+"""
+
+from __future__ import annotations
+
+import base64
+import dataclasses
+import hashlib
+import hmac
+import json
+
+from typing import Any, Callable, Iterable, Optional
+
+from cryptography.fernet import InvalidToken
+
+from envers import crypt, serialization
+
+KEY_CHECK_MESSAGE = b"envers-key-check"
+# length of the value hashes (hex characters of a SHA-256 digest)
+VALUE_HASH_LENGTH = 24
+
+
+def map_values(
+    release: dict[str, Any], function: Callable[[Any], Any]
+) -> dict[str, Any]:
+    """
+    Return a copy of the release with the function applied to its values.
+
+    Only the dictionaries on the way to the variables
+    (`data.<profile>.files.<file>.vars`) are copied, anything else in the
+    release is kept as it is.
+    """
+    data = release.get("data")
+    if not isinstance(data, dict):
+        return dict(release)
+
+    new_data = {}
+    for profile, profile_data in data.items():
+        files = (
+            profile_data.get("files")
+            if isinstance(profile_data, dict)
+            else None
+        )
+        if not isinstance(files, dict):
+            new_data[profile] = profile_data
+            continue
+
+        new_files = {}
+        for file_path, file_data in files.items():
+            file_vars = (
+                file_data.get("vars") if isinstance(file_data, dict) else None
+            )
+            if not isinstance(file_vars, dict):
+                new_files[file_path] = file_data
+                continue
+            new_files[file_path] = {
+                **file_data,
+                "vars": {
+                    name: function(value) for name, value in file_vars.items()
+                },
+            }
+        new_data[profile] = {**profile_data, "files": new_files}
+    return {**release, "data": new_data}
+
+
+def get_key_check(key: bytes) -> str:
+    """Return the check value for the given key."""
+    return hmac.new(
+        base64.urlsafe_b64decode(key), KEY_CHECK_MESSAGE, hashlib.sha256
+    ).hexdigest()[:32]
+
+
+class DataLock:
+    """
+    Encrypted data of one profile, split into one segment per release.
+
+    The segments are kept encrypted and they are only decrypted on demand.
+    Data lock files in the previous single-token layouts are loaded too,
+    and they are converted to the segmented layout on the next write.
+    """
+
+    def __init__(self, header: crypt.LockHeader) -> None:
+        self.header = dataclasses.replace(
+            header, version=crypt.LOCK_FORMAT_SEGMENTED
+        )
+        self.meta: dict[str, Any] = {}
+        # number of writes of the file, 0 for the previous layouts
+        self.generation = 0
+        self._check = ""
+        # encrypted segments, by release name
+        self._segments: dict[str, str] = {}
+        # releases to be encrypted on the next dump, by release name
+        self._pending: dict[str, dict[str, Any]] = {}
+        # single token of the data lock files in the previous layouts
+        self._legacy_token = ""
+        # value batches of each release whose segment stores value hashes
+        # instead of values
+        self._refs: dict[str, list[str]] = {}
+        # encrypted value batches, and the batches once decrypted, by id
+        self._batches: dict[str, str] = {}
+        self._batch_values: dict[str, dict[str, Any]] = {}
+
+    @classmethod
+    def create(
+        cls,
+        kdf_params: Optional[crypt.KDFParams] = None,
+        encoding: Optional[str] = None,
+        compression: Optional[str] = None,
+    ) -> DataLock:
+        """
+        Create an empty data lock with a new salt.
+
+        The parameters not given use the configured defaults (see
+        `crypt.get_kdf_params` and `serialization.get_payload_format`).
+        """
+        encoding, compression = serialization.get_payload_format(
+            encoding, compression
+        )
+        header = crypt.LockHeader(
+            kdf_params or crypt.get_kdf_params(),
+            crypt.generate_salt(),
+            crypt.LOCK_FORMAT_SEGMENTED,
+            encoding=encoding,
+            compression=compression,
+        )
+        return cls(header)
+
+    @classmethod
+    def loads(cls, raw_data: str) -> DataLock:
+        """Load the data lock from its text form, without decrypting it."""
+        header, payload = crypt.parse_header(raw_data)
+        data_lock = cls(header)
+
+        if header.version != crypt.LOCK_FORMAT_SEGMENTED:
+            data_lock._legacy_token = payload
+            return data_lock
+
+        _, index_line, body = payload.split("\n", 2)
+        index = json.loads(index_line)
+
+        data_lock.meta = dict(index.get("meta", {}))
+        data_lock._check = str(index["check"])
+        data_lock.generation = int(index.get("generation", 0))
+        for name, (offset, length) in index.get("releases", {}).items():
+            data_lock._segments[name] = cls._get_segment(
+                body, offset, length, name
+            )
+        batches = index.get("values", {})
+        refs = index.get("refs", {})
+        if isinstance(batches, list):
+            # a single value table, used by all the releases in `refs`
+            batches = {"0": batches}
+            refs = {name: ["0"] for name in refs}
+        for batch_id, (offset, length) in batches.items():
+            data_lock._batches[batch_id] = cls._get_segment(
+                body, offset, length, f"the value batch {batch_id}"
+            )
+        data_lock._refs = {
+            name: list(batch_ids)
+            for name, batch_ids in refs.items()
+            if name in data_lock._segments
+        }
+        return data_lock
+
+    @staticmethod
+    def _get_segment(body: str, offset: int, length: int, name: str) -> str:
+        """Return a segment of the body, checking it is complete."""
+        segment = body[offset : offset + length]
+        if len(segment) != length:
+            raise ValueError(f"The segment for {name} is truncated.")
+        return segment
+
+    def dumps(self, key: bytes) -> str:
+        """Encrypt the pending releases and return the text form."""
+        self.verify(key)
+
+        if self._pending:
+            self._store_pending(key)
+
+        # the batches no longer used by any release are dropped
+        referenced = {
+            batch_id
+            for batch_ids in self._refs.values()
+            for batch_id in batch_ids
+        }
+        for batch_id in set(self._batches) - referenced:
+            del self._batches[batch_id]
+            self._batch_values.pop(batch_id, None)
+
+        releases_index: dict[str, list[int]] = {}
+        batches_index: dict[str, list[int]] = {}
+        offset = 0
+        for entries, segments in (
+            (releases_index, self._segments),
+            (batches_index, self._batches),
+        ):
+            for name, segment in segments.items():
+                entries[name] = [offset, len(segment)]
+                offset += len(segment)
+
+        index: dict[str, Any] = {
+            "meta": self.meta,
+            "check": get_key_check(key),
+            "generation": self.generation,
+            "releases": releases_index,
+        }
+        if batches_index:
+            index["values"] = batches_index
+        if self._refs:
+            index["refs"] = self._refs
+
+        return "".join(
+            [
+                self.header.dumps(),
+                "\n",
+                json.dumps(index, separators=(",", ":")),
+                "\n",
+                *self._segments.values(),
+                *self._batches.values(),
+            ]
+        )
+
+    def _store_pending(self, key: bytes) -> None:
+        """Encrypt the pending releases, and their new values in a batch."""
+        # the values of the batches used by the releases not written are
+        # reused, the batches only used by the written releases are replaced
+        shared = {
+            batch_id
+            for name, batch_ids in self._refs.items()
+            if name not in self._pending
+            for batch_id in batch_ids
+        }
+        known: dict[str, str] = {}
+        for batch_id in sorted(shared, key=int):
+            known.update(
+                dict.fromkeys(self._load_batch(batch_id, key), batch_id)
+            )
+
+        new_id = str(max(map(int, self._batches), default=-1) + 1)
+        new_values: dict[str, Any] = {}
+        for name, release in self._pending.items():
+            used: set[str] = set()
+
+            def store(value: Any) -> str:
+                value_hash = serialization.hash_value(value, VALUE_HASH_LENGTH)
+                batch_id = known.get(value_hash)
+                if batch_id is None:
+                    new_values[value_hash] = value
+                    batch_id = new_id
+                used.add(batch_id)
+                return value_hash
+
+            self._segments[name] = self._encrypt(
+                map_values(release, store), key
+            )
+            self._refs[name] = sorted(used, key=int)
+        self._pending.clear()
+
+        if new_values:
+            self._batches[new_id] = self._encrypt(new_values, key)
+            self._batch_values[new_id] = new_values
+
+    @staticmethod
+    def read_generation(raw_data: str) -> int:
+        """Return the generation of a data lock, without loading it all."""
+        header, payload = crypt.parse_header(raw_data)
+        if header.version != crypt.LOCK_FORMAT_SEGMENTED:
+            return 0
+        index_line = payload.split("\n", 2)[1]
+        return int(json.loads(index_line).get("generation", 0))
+
+    def verify(self, key: bytes) -> None:
+        """
+        Check the key is the one used by this data lock.
+
+        Raises InvalidToken when the key is not correct.
+        """
+        if self._legacy_token:
+            self._load_legacy(key)
+        elif self._check and not hmac.compare_digest(
+            self._check, get_key_check(key)
+        ):
+            raise InvalidToken
+
+    def releases(self) -> list[str]:
+        """Return the name of all the releases."""
+        return list({**self._segments, **self._pending})
+
+    def get_release(self, name: str, key: bytes) -> Optional[dict[str, Any]]:
+        """Decrypt and return the given release, if it exists."""
+        self.verify(key)
+
+        if name in self._pending:
+            return self._pending[name]
+        if name not in self._segments:
+            return None
+
+        release = dict(self._decrypt(self._segments[name], key) or {})
+        if name in self._refs:
+            # only the batches with the values of the release are decrypted
+            values: dict[str, Any] = {}
+            for batch_id in self._refs[name]:
+                values.update(self._load_batch(batch_id, key))
+            release = map_values(release, values.__getitem__)
+        return release
+
+    def set_release(self, name: str, release: dict[str, Any]) -> None:
+        """Set the release data, to be encrypted on the next dump."""
+        self._pending[name] = release
+
+    def to_dict(
+        self, key: bytes, releases: Optional[Iterable[str]] = None
+    ) -> dict[str, Any]:
+        """
+        Return the data lock as a dictionary.
+
+        Only the given releases are decrypted. By default, all the releases
+        are decrypted.
+        """
+        self.verify(key)
+
+        names = self.releases() if releases is None else releases
+        data: dict[str, Any] = {**self.meta, "releases": {}}
+        for name in names:
+            release = self.get_release(name, key)
+            if release is not None:
+                data["releases"][name] = release
+        return data
+
+    def collect_garbage(self, key: bytes) -> int:
+        """
+        Remove the values no longer referenced by any release.
+
+        The writes already drop the batches no longer used, this removes
+        the replaced values left in the batches still used by another
+        release. All the releases (and batches) are decrypted to find their
+        references, and the changed batches are encrypted again.
+
+        Returns
+        -------
+        int
+            The number of values removed.
+        """
+        self.verify(key)
+
+        referenced: dict[str, set[str]] = {}
+        for name, batch_ids in self._refs.items():
+            if name in self._pending:
+                continue
+            hashes: set[str] = set()
+            map_values(
+                self._decrypt(self._segments[name], key) or {}, hashes.add
+            )
+            for batch_id in batch_ids:
+                referenced.setdefault(batch_id, set()).update(hashes)
+
+        removed = 0
+        for batch_id in list(self._batches):
+            values = self._load_batch(batch_id, key)
+            kept = {
+                value_hash: value
+                for value_hash, value in values.items()
+                if value_hash in referenced.get(batch_id, ())
+            }
+            if len(kept) == len(values):
+                continue
+            removed += len(values) - len(kept)
+            if kept:
+                self._batch_values[batch_id] = kept
+                self._batches[batch_id] = self._encrypt(kept, key)
+                continue
+            del self._batches[batch_id]
+            self._batch_values.pop(batch_id, None)
+            for batch_ids in self._refs.values():
+                if batch_id in batch_ids:
+                    batch_ids.remove(batch_id)
+        return removed
+
+    def _load_batch(self, batch_id: str, key: bytes) -> dict[str, Any]:
+        """Decrypt a value batch, once."""
+        if batch_id not in self._batch_values:
+            self._batch_values[batch_id] = dict(
+                self._decrypt(self._batches[batch_id], key) or {}
+            )
+        return self._batch_values[batch_id]
+
+    def _encrypt(self, content: Any, key: bytes) -> str:
+        """Encode and encrypt the content of a segment."""
+        payload = serialization.encode_payload(
+            content, self.header.encoding, self.header.compression
+        )
+        return crypt.encrypt_bytes(payload, key)
+
+    def _decrypt(self, segment: str, key: bytes) -> Any:
+        """Decrypt and decode the content of a segment."""
+        payload = crypt.decrypt_bytes(segment, key)
+        return serialization.decode_payload(
+            payload, self.header.encoding, self.header.compression
+        )
+
+    def _load_legacy(self, key: bytes) -> None:
+        """Split the single token of the previous layouts into releases."""
+        data_content = crypt.decrypt_with_key(self._legacy_token, key)
+        data = serialization.load_yaml(data_content) or {}
+
+        self._legacy_token = ""
+        self._check = get_key_check(key)
+        self._pending.update(data.pop("releases", None) or {})
+        self.meta = data
@@ -0,0 +1,196 @@
+"""
+Functions for serialization.
+
+All the YAML parsing and emitting goes through this module, so it uses
+the libyaml (C) implementation when PyYAML was built with it, and the pure
+Python implementation otherwise. It also defines the payload formats used
+inside the encrypted data lock segments.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import os
+import zlib
+
+from typing import IO, Any, Optional, Type, Union
+
+import yaml  # type: ignore
+
+from envers.timings import span
+
+# PyYAML only provides the C classes when it was built with libyaml
+LIBYAML_AVAILABLE = bool(getattr(yaml, "__with_libyaml__", False))
+
+_FastSafeLoader: Type[Any] = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_FastSafeDumper: Type[Any] = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+class _NoAliasesMixin:
+    """Dump shared objects again, instead of emitting YAML aliases."""
+
+    def ignore_aliases(self, data: Any) -> bool:
+        """Ignore the aliases, the specs are meant to be edited by hand."""
+        return True
+
+
+class _SafeDumper(_NoAliasesMixin, yaml.SafeDumper):  # type: ignore[misc]
+    """Pure Python safe dumper without aliases."""
+
+
+class _FastDumper(_NoAliasesMixin, _FastSafeDumper):  # type: ignore[misc]
+    """Safe dumper without aliases, using libyaml when available."""
+
+
+def hash_value(value: Any, length: Optional[int] = None) -> str:
+    """
+    Return the SHA-256 digest (in hex) of the value, dumped as JSON.
+
+    The values are compared (or identified) by their digest, so they are
+    never shown. The digest is truncated to `length` characters if given.
+    """
+    content = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()[:length]
+
+
+def get_yaml_loader(accelerated: bool = True) -> Type[Any]:
+    """Return the YAML loader class, the libyaml one when available."""
+    return _FastSafeLoader if accelerated else yaml.SafeLoader
+
+
+def get_yaml_dumper(accelerated: bool = True) -> Type[Any]:
+    """Return the YAML dumper class, the libyaml one when available."""
+    return _FastDumper if accelerated else _SafeDumper
+
+
+def load_yaml(
+    stream: Union[str, bytes, IO[str]], accelerated: bool = True
+) -> Any:
+    """Parse the given YAML document."""
+    with span("parse"):
+        return yaml.load(stream, Loader=get_yaml_loader(accelerated))  # nosec
+
+
+def compose_yaml(stream: Union[str, IO[str]], accelerated: bool = True) -> Any:
+    """Return the representation tree (with the source positions)."""
+    with span("parse"):
+        return yaml.compose(stream, Loader=get_yaml_loader(accelerated))  # nosec
+
+
+def dumps_yaml(data: Any, accelerated: bool = True) -> str:
+    """Emit the given data as a YAML document, keeping the keys order."""
+    with span("dump"):
+        return str(
+            yaml.dump(
+                data, Dumper=get_yaml_dumper(accelerated), sort_keys=False
+            )
+        )
+
+
+def dump_yaml(data: Any, stream: IO[str], accelerated: bool = True) -> None:
+    """Write the given data as a YAML document, keeping the keys order."""
+    with span("dump"):
+        yaml.dump(
+            data, stream, Dumper=get_yaml_dumper(accelerated), sort_keys=False
+        )
+
+
+# encodings and compressions for the decrypted payload of the data lock
+# files, which is never read by humans
+PAYLOAD_ENCODINGS = ("yaml", "json", "msgpack")
+PAYLOAD_COMPRESSIONS = ("none", "zlib", "zstd")
+PAYLOAD_DEFAULT_ENCODING = "json"
+PAYLOAD_DEFAULT_COMPRESSION = "none"
+
+
+def _import_optional(module_name: str) -> Any:
+    """Import an optional dependency, raising a ValueError if missing."""
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise ValueError(
+            f"The package `{module_name}` is required for this payload "
+            "format, please install it."
+        )
+
+
+def get_payload_format(
+    encoding: Optional[str] = None, compression: Optional[str] = None
+) -> tuple[str, str]:
+    """
+    Return the encoding and the compression used for new payloads.
+
+    The values not given fall back to the environment variables
+    `ENVERS_LOCK_ENCODING` and `ENVERS_LOCK_COMPRESSION`.
+    """
+    encoding = encoding or os.getenv(
+        "ENVERS_LOCK_ENCODING", PAYLOAD_DEFAULT_ENCODING
+    )
+    compression = compression or os.getenv(
+        "ENVERS_LOCK_COMPRESSION", PAYLOAD_DEFAULT_COMPRESSION
+    )
+
+    if encoding not in PAYLOAD_ENCODINGS:
+        raise ValueError(f"Unsupported payload encoding: {encoding}.")
+    if compression not in PAYLOAD_COMPRESSIONS:
+        raise ValueError(f"Unsupported payload compression: {compression}.")
+    return encoding, compression
+
+
+def encode_payload(
+    data: Any, encoding: str = "yaml", compression: str = "none"
+) -> bytes:
+    """Serialize and compress the given data."""
+    with span("dump"):
+        if encoding == "yaml":
+            payload = dumps_yaml(data).encode("utf-8")
+        elif encoding == "json":
+            # values that JSON does not support (e.g. dates parsed from the
+            # specs) are stored as strings, as they would be rendered in the
+            # environment files anyway
+            payload = json.dumps(
+                data, separators=(",", ":"), ensure_ascii=False, default=str
+            ).encode("utf-8")
+        elif encoding == "msgpack":
+            msgpack = _import_optional("msgpack")
+            payload = msgpack.packb(data, default=str, use_bin_type=True)
+        else:
+            raise ValueError(f"Unsupported payload encoding: {encoding}.")
+
+        if compression == "zlib":
+            return zlib.compress(payload, 1)
+        if compression == "zstd":
+            zstandard = _import_optional("zstandard")
+            return bytes(zstandard.ZstdCompressor().compress(payload))
+        if compression != "none":
+            raise ValueError(
+                f"Unsupported payload compression: {compression}."
+            )
+        return payload
+
+
+def decode_payload(
+    payload: bytes, encoding: str = "yaml", compression: str = "none"
+) -> Any:
+    """Decompress and deserialize the given payload."""
+    with span("parse"):
+        if compression == "zlib":
+            payload = zlib.decompress(payload)
+        elif compression == "zstd":
+            zstandard = _import_optional("zstandard")
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        elif compression != "none":
+            raise ValueError(
+                f"Unsupported payload compression: {compression}."
+            )
+
+        if encoding == "yaml":
+            return load_yaml(payload.decode("utf-8"))
+        if encoding == "json":
+            return json.loads(payload)
+        if encoding == "msgpack":
+            msgpack = _import_optional("msgpack")
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        raise ValueError(f"Unsupported payload encoding: {encoding}.")
@@ -0,0 +1,369 @@
+"""
+Read-only server of the decrypted profiles, kept in memory.
+
+`envers serve` decrypts the data lock files of the given profiles once at
+startup and serves their environment files over HTTP, on a Unix socket only
+accessible by the current user (by default) or on a TCP port::
+
+    GET /<spec>/<profile>/<file path>   the file, in the dotenv format
+    GET /<spec>/<profile>               all the files of the profile, as JSON
+
+Add `?format=json` to get a single file as JSON. The data lock files are
+polled for changes, and a changed profile is decrypted again (with the key
+derived at startup, the passwords are not kept), so the server always serves
+the last deployed values.
+
+On a TCP port, any local user (or a web page, through DNS rebinding) could
+send requests, so the requests need the header `Authorization: Bearer
+<token>`, and a Host header that is not the bound address is rejected.
+"""
+
+from __future__ import annotations
+
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Optional, Tuple, Union
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from envers import agent, api, envfile
+from envers.errors import EnversError
+from envers.files import private_socket
+from envers.timings import span
+
+# interval (in seconds) between the checks of the data lock files
+SERVE_DEFAULT_INTERVAL = 1.0
+SERVE_DEFAULT_HOST = "127.0.0.1"
+SERVE_TOKEN_ENV = "ENVERS_SERVE_TOKEN"
+WILDCARD_HOSTS = ("", "0.0.0.0", "::")  # nosec B104
+
+StatKey = Tuple[int, int, int]
+
+logger = logging.getLogger(__name__)
+
+
+def _stat_key(path: Path) -> Optional[StatKey]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def get_default_socket_path() -> Path:
+    """Return the default path for the server socket."""
+    return agent.get_default_socket_path().parent / "serve.sock"
+
+
+def is_loopback(host: str) -> bool:
+    """Return if the address is only reachable from the local machine."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _wipe(key: bytearray) -> None:
+    key[:] = bytes(len(key))
+
+
+@dataclass
+class _ServedProfile:
+    """The rendered files of one profile, by spec version and file path."""
+
+    # the key of the data lock file, wiped when the store is cleared
+    key: bytearray
+    stat: Optional[StatKey] = None
+    # the stat of the data lock file that could not be decrypted, so it is
+    # only tried (and reported) once
+    failed_stat: Optional[StatKey] = None
+    # (dotenv, json) content of each file
+    files: dict[tuple[str, str], tuple[bytes, bytes]] = field(
+        default_factory=dict
+    )
+    # JSON content with all the files, by spec version
+    releases: dict[str, bytes] = field(default_factory=dict)
+
+
+class ConfigStore:
+    """Thread-safe in-memory store of the decrypted profiles."""
+
+    def __init__(self, root: Union[str, Path] = ".") -> None:
+        self.root = Path(root)
+        self._profiles: dict[str, _ServedProfile] = {}
+        self._lock = threading.Lock()
+
+    def add(self, profile: str, password: Optional[str] = None) -> None:
+        """
+        Decrypt the given profile and serve it.
+
+        Raises EnversError (one of its subclasses) when the profile cannot
+        be decrypted. Only the key derived from the password is kept in
+        memory, to decrypt the data lock file again when it changes (until
+        it is rekeyed).
+        """
+        served = _ServedProfile(
+            bytearray(api.get_profile_key(profile, password, self.root))
+        )
+        try:
+            self._load(profile, served)
+        except BaseException:
+            _wipe(served.key)
+            raise
+        with self._lock:
+            previous = self._profiles.get(profile)
+            self._profiles[profile] = served
+        if previous is not None and previous.key is not served.key:
+            _wipe(previous.key)
+
+    def clear(self) -> None:
+        """Stop serving all the profiles, wiping their keys."""
+        with self._lock:
+            for served in self._profiles.values():
+                _wipe(served.key)
+            self._profiles.clear()
+
+    def profiles(self) -> list[str]:
+        """Return the names of the served profiles."""
+        with self._lock:
+            return list(self._profiles)
+
+    def reload_changed(self) -> list[str]:
+        """
+        Decrypt again the profiles whose data lock file changed.
+
+        A profile that cannot be decrypted (e.g. after a rekey) keeps its
+        previous content, and the error is logged once: the file is only
+        tried again when it changes.
+
+        Returns
+        -------
+        list[str]
+            The profiles reloaded.
+        """
+        reloaded = []
+        for profile in self.profiles():
+            with self._lock:
+                current = self._profiles[profile]
+            if _stat_key(self._data_file(profile)) in (
+                current.stat,
+                current.failed_stat,
+            ):
+                continue
+
+            served = _ServedProfile(current.key)
+            try:
+                self._load(profile, served)
+            except EnversError as e:
+                logger.warning("Profile %s not reloaded: %s", profile, e)
+                with self._lock:
+                    current.failed_stat = served.stat
+                continue
+
+            with self._lock:
+                self._profiles[profile] = served
+            reloaded.append(profile)
+        return reloaded
+
+    def get_file(
+        self, spec: str, profile: str, file_path: str
+    ) -> Optional[tuple[bytes, bytes]]:
+        """Return the dotenv and the JSON content of a file, if it exists."""
+        with self._lock:
+            served = self._profiles.get(profile)
+            return served.files.get((spec, file_path)) if served else None
+
+    def get_release(self, spec: str, profile: str) -> Optional[bytes]:
+        """Return all the files of a profile as JSON, if it exists."""
+        with self._lock:
+            served = self._profiles.get(profile)
+            return served.releases.get(spec) if served else None
+
+    def _data_file(self, profile: str) -> Path:
+        return self.root / ".envers" / "data" / f"{profile}.lock"
+
+    def _load(self, profile: str, served: _ServedProfile) -> None:
+        """Decrypt the profile and render its files into `served`."""
+        # read the stat first, so a change during the decryption is seen by
+        # the next check
+        served.stat = _stat_key(self._data_file(profile))
+        releases = api.load_releases(
+            profile, root=self.root, key=bytes(served.key)
+        )
+
+        with span("render"):
+            for spec, files in releases.items():
+                for file_path, variables in files.items():
+                    served.files[(spec, file_path)] = (
+                        "".join(envfile.iter_lines(variables)).encode("utf-8"),
+                        json.dumps(variables).encode("utf-8"),
+                    )
+                served.releases[spec] = json.dumps(files).encode("utf-8")
+
+
+class _ConfigRequestHandler(BaseHTTPRequestHandler):
+    """Serve the files of the ConfigStore, read-only."""
+
+    server: Any
+
+    def do_GET(self) -> None:
+        """Return a file, or all the files of a profile."""
+        if not self._is_allowed():
+            return
+
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.split("/") if part]
+        as_json = parse_qs(url.query).get("format") == ["json"]
+        store: ConfigStore = self.server.store
+
+        if len(parts) == 2:
+            content = store.get_release(parts[0], parts[1])
+            self._send(content, "application/json")
+        elif len(parts) > 2:
+            rendered = store.get_file(parts[0], parts[1], "/".join(parts[2:]))
+            if rendered is None:
+                self._send(None, "")
+            elif as_json:
+                self._send(rendered[1], "application/json")
+            else:
+                self._send(rendered[0], "text/plain; charset=utf-8")
+        else:
+            self._send(None, "")
+
+    def _is_allowed(self) -> bool:
+        """Check the Host header and the token, sending the error if any."""
+        allowed_hosts = self.server.allowed_hosts
+        host = self.headers.get("Host", "").lower()
+        if allowed_hosts is not None and host not in allowed_hosts:
+            self.send_error(421, "Invalid Host header")
+            return False
+
+        token = self.server.token
+        if token is not None and not hmac.compare_digest(
+            self.headers.get("Authorization", "").encode("utf-8"),
+            f"Bearer {token}".encode("utf-8"),
+        ):
+            self.send_response(401, "Unauthorized")
+            self.send_header("WWW-Authenticate", "Bearer")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return False
+        return True
+
+    def _send(self, content: Optional[bytes], content_type: str) -> None:
+        if content is None:
+            self.send_error(404, "Not found")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def address_string(self) -> str:
+        """Return the client address (empty for Unix sockets)."""
+        return str(self.client_address[0]) if self.client_address else "-"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Log the requests only when ENVERS_SERVE_LOG=1."""
+        if os.getenv("ENVERS_SERVE_LOG") == "1":
+            super().log_message(format, *args)
+
+
+class _PollingMixin:
+    """Reload the changed profiles between requests."""
+
+    store: ConfigStore
+    interval: float
+    _last_check: float
+    # the bearer token and the values of the Host header accepted, None to
+    # accept any request (e.g. on a Unix socket only accessible by the user)
+    token: Optional[str] = None
+    allowed_hosts: Optional[frozenset[str]] = None
+
+    def service_actions(self) -> None:
+        """Check the data lock files at most once per interval."""
+        now = time.monotonic()
+        if now - self._last_check >= self.interval:
+            self._last_check = now
+            self.store.reload_changed()
+
+
+class ConfigServer(_PollingMixin, ThreadingHTTPServer):
+    """
+    HTTP server of a ConfigStore, on a TCP port.
+
+    The requests need the header `Authorization: Bearer <token>`. Unless
+    the server listens on all the interfaces, the Host header should be the
+    bound address (or `localhost` for a loopback address), with or without
+    the port, so a web page cannot reach it through DNS rebinding.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        store: ConfigStore,
+        token: str,
+        host: str = SERVE_DEFAULT_HOST,
+        port: int = 0,
+        interval: float = SERVE_DEFAULT_INTERVAL,
+    ) -> None:
+        if not token:
+            raise ValueError("A token is required to serve on a TCP port.")
+        self.store = store
+        self.token = token
+        self.interval = interval
+        self._last_check = time.monotonic()
+        super().__init__((host, port), _ConfigRequestHandler)
+        self.allowed_hosts = self._get_allowed_hosts(host)
+
+    def _get_allowed_hosts(self, host: str) -> Optional[frozenset[str]]:
+        if host in WILDCARD_HOSTS:
+            return None
+        port = self.server_address[1]
+        names = {host.lower(), str(self.server_address[0])}
+        if is_loopback(host):
+            names.add("localhost")
+        names = {f"[{name}]" if ":" in name else name for name in names}
+        return frozenset([*names, *(f"{name}:{port}" for name in names)])
+
+
+class UnixConfigServer(
+    _PollingMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    """HTTP server of a ConfigStore, on a Unix socket."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        store: ConfigStore,
+        socket_path: Path,
+        interval: float = SERVE_DEFAULT_INTERVAL,
+    ) -> None:
+        self.store = store
+        self.interval = interval
+        self._last_check = time.monotonic()
+        self.socket_path = Path(socket_path)
+
+        with private_socket(self.socket_path):
+            super().__init__(str(self.socket_path), _ConfigRequestHandler)
+
+    def server_close(self) -> None:
+        """Close the server, removing the socket."""
+        super().server_close()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
@@ -0,0 +1,337 @@
+"""
+Access to the specs file with a cache of its parsed content.
+
+Parsing a large `.envers/specs.yaml` dominates the time of the commands
+that only read it, so the parsed specs are cached under `.envers/cache/`
+in the marshal format, which is much faster to load than YAML. The cache is
+validated by the stat metadata of the specs file and by the hash of its
+content, and it is rebuilt transparently when the specs file changes.
+
+Commands that only need one release use the release index instead, which
+maps each release to its byte range in the specs file and its status, so
+they parse (or patch) only that release.
+
+The writes hold the lock of the `.envers` directory (see
+envers.files.file_lock), and `save` fails with a ConflictError when the
+specs file was changed by another process since it was loaded.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import marshal
+import os
+import time
+
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import yaml  # type: ignore
+
+from envers import serialization
+from envers.errors import ConflictError
+from envers.files import atomic_write, file_lock
+
+# bump it when the content of the cache files changes
+SPEC_CACHE_VERSION = 3
+SPEC_CACHE_DIRNAME = "cache"
+# files modified less than this (in ns) before the cache was written can
+# be changed again within the same mtime tick, so they are always hashed
+SPEC_CACHE_RACY_WINDOW = 2 * 10**9
+
+YAML_STR_TAG = "tag:yaml.org,2002:str"
+
+
+def is_cache_enabled() -> bool:
+    """Return if the cache is enabled (disable with ENVERS_SPEC_CACHE=0)."""
+    return os.getenv("ENVERS_SPEC_CACHE", "1") != "0"
+
+
+def _byte_offsets(text: str, positions: list[int]) -> dict[int, int]:
+    """Map the given character positions of the text to byte offsets."""
+    if text.isascii():
+        return {position: position for position in positions}
+
+    offsets = {}
+    char_position = byte_position = 0
+    for position in sorted(set(positions)):
+        byte_position += len(text[char_position:position].encode("utf-8"))
+        char_position = position
+        offsets[position] = byte_position
+    return offsets
+
+
+def _read_top_level(
+    root: Any, text: str, meta: dict[str, Any]
+) -> list[tuple[Any, Any]]:
+    """Store the top level scalars in `meta` and return the release nodes."""
+    release_nodes: list[tuple[Any, Any]] = []
+    for key_node, value_node in root.value:
+        if key_node.value == "releases":
+            if isinstance(value_node, yaml.MappingNode):
+                release_nodes = value_node.value
+        elif isinstance(value_node, yaml.ScalarNode):
+            start, end = value_node.start_mark.index, value_node.end_mark.index
+            meta[key_node.value] = serialization.load_yaml(text[start:end])
+    return release_nodes
+
+
+def _get_status_node(release_node: Any) -> Any:
+    """Return the node of the status value of a release, if any."""
+    status_node = None
+    if isinstance(release_node, yaml.MappingNode):
+        for key_node, value_node in release_node.value:
+            if key_node.value == "status" and isinstance(
+                value_node, yaml.ScalarNode
+            ):
+                status_node = value_node
+    return status_node
+
+
+def _get_range(node: Any, offsets: dict[int, int]) -> tuple[int, int]:
+    return offsets[node.start_mark.index], offsets[node.end_mark.index]
+
+
+def build_release_index(text: str) -> dict[str, Any]:
+    """
+    Build the release index of the given specs document.
+
+    The index has the top level scalars of the specs (e.g. its version) and,
+    for each release, the byte range of its definition and its status (and
+    the byte range of the status value).
+    """
+    root = serialization.compose_yaml(text)
+    index: dict[str, Any] = {"meta": {}, "releases": {}}
+
+    if not isinstance(root, yaml.MappingNode):
+        return index
+
+    # releases are looked up by their name as a string
+    releases = [
+        (key_node.value, value_node, _get_status_node(value_node))
+        for key_node, value_node in _read_top_level(root, text, index["meta"])
+        if key_node.tag == YAML_STR_TAG
+    ]
+
+    positions: list[int] = []
+    for _, value_node, status_node in releases:
+        for node in (value_node, status_node):
+            if node is not None:
+                positions += [node.start_mark.index, node.end_mark.index]
+
+    offsets = _byte_offsets(text, positions)
+    for name, value_node, status_node in releases:
+        index["releases"][name] = {
+            "range": _get_range(value_node, offsets),
+            "column": value_node.start_mark.column,
+            "status": None if status_node is None else status_node.value,
+            "status_range": None
+            if status_node is None
+            else _get_range(status_node, offsets),
+        }
+    return index
+
+
+class SpecFile:
+    """The specs file of an envers environment."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.cache_dir = self.path.parent / SPEC_CACHE_DIRNAME
+        # hash of the content parsed by each kind of cached payload
+        self._hashes: dict[str, str] = {}
+
+    def exists(self) -> bool:
+        """Return if the specs file exists."""
+        return self.path.exists()
+
+    def load(self) -> dict[str, Any]:
+        """Return the parsed specs, from the cache when it is valid."""
+        return dict(
+            self._load_cached(
+                "data",
+                lambda content: serialization.load_yaml(content) or {},
+            )
+        )
+
+    def save(self, specs: dict[str, Any]) -> None:
+        """
+        Write the specs file and refresh the cache with the same data.
+
+        Raises ConflictError when the specs file changed since it was
+        loaded by this instance.
+        """
+        with file_lock(self.path.parent):
+            loaded_hash = self._hashes.get("data")
+            if (
+                loaded_hash is not None
+                and self.path.exists()
+                and hashlib.sha256(self.path.read_bytes()).hexdigest()
+                != loaded_hash
+            ):
+                raise ConflictError(
+                    f"{self.path} was changed by another process. Please run "
+                    "the command again."
+                )
+            self._save(specs)
+
+    def _save(self, specs: dict[str, Any]) -> None:
+        content = serialization.dumps_yaml(specs).encode("utf-8")
+        atomic_write(self.path, content)
+        content_hash = hashlib.sha256(content).hexdigest()
+        self._hashes["data"] = content_hash
+        self._write_cache("data", specs, content_hash)
+
+    def release_index(self) -> dict[str, Any]:
+        """Return the release index, from the cache when it is valid."""
+        return dict(self._load_cached("index", build_release_index))
+
+    def get_meta(self, name: str, default: Any = None) -> Any:
+        """Return a top level value of the specs, e.g. its version."""
+        return self.release_index()["meta"].get(name, default)
+
+    def release_status(self, version: str) -> Optional[str]:
+        """Return the status of the given release, if it exists."""
+        entry = self.release_index()["releases"].get(version)
+        return entry["status"] if entry else None
+
+    def load_release(self, version: str) -> Optional[dict[str, Any]]:
+        """Parse and return only the given release, if it exists."""
+        entry = self.release_index()["releases"].get(version)
+        if not entry:
+            return None
+
+        start, end = entry["range"]
+        with open(self.path, "rb") as file:
+            file.seek(start)
+            fragment = file.read(end - start).decode("utf-8")
+
+        try:
+            # keep the first line aligned with the others, as in the document
+            release = serialization.load_yaml(" " * entry["column"] + fragment)
+        except yaml.composer.ComposerError:
+            # the release uses an alias of an anchor defined outside of it,
+            # so it can only be read with the whole document
+            release = (self.load().get("releases") or {}).get(version)
+        return release if isinstance(release, dict) else None
+
+    def set_status(self, version: str, status: str) -> None:
+        """
+        Change the status of the given release.
+
+        The status value is patched in place, without dumping the whole
+        document again, when the release already defines a status.
+        """
+        with file_lock(self.path.parent):
+            index = self.release_index()
+            entry = index["releases"].get(version)
+
+            if not entry or not entry["status_range"]:
+                specs = self.load()
+                specs["releases"][version]["status"] = status
+                self._save(specs)
+                return
+
+            content = self.path.read_bytes()
+            start, end = entry["status_range"]
+            new_value = status.encode("utf-8")
+            content = content[:start] + new_value + content[end:]
+            atomic_write(self.path, content)
+
+            # shift the ranges after the patched value, instead of rebuilding
+            # the index from scratch
+            delta = len(new_value) - (end - start)
+
+            def shift(byte_range: tuple[int, int]) -> tuple[int, int]:
+                return (
+                    byte_range[0] + delta
+                    if byte_range[0] >= end
+                    else byte_range[0],
+                    byte_range[1] + delta
+                    if byte_range[1] >= end
+                    else byte_range[1],
+                )
+
+            for release_entry in index["releases"].values():
+                release_entry["range"] = shift(release_entry["range"])
+                if release_entry["status_range"]:
+                    release_entry["status_range"] = shift(
+                        release_entry["status_range"]
+                    )
+            entry["status"] = status
+            entry["status_range"] = (start, start + len(new_value))
+
+            self._write_cache(
+                "index", index, hashlib.sha256(content).hexdigest()
+            )
+
+    def _cache_path(self, kind: str) -> Path:
+        return self.cache_dir / f"{self.path.name}.{kind}"
+
+    def _load_cached(self, kind: str, parse: Callable[[str], Any]) -> Any:
+        """Return the cached payload, or parse the specs and cache it."""
+        st = os.stat(self.path)
+        stat_key = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+        cache = self._read_cache(kind) if is_cache_enabled() else None
+
+        if cache and cache["stat"] == stat_key and cache["trusted"]:
+            self._hashes[kind] = cache["hash"]
+            return cache["payload"]
+
+        content = self.path.read_bytes()
+        content_hash = hashlib.sha256(content).hexdigest()
+
+        if cache and cache["hash"] == content_hash:
+            payload = cache["payload"]
+        else:
+            payload = parse(content.decode("utf-8"))
+
+        self._hashes[kind] = content_hash
+        self._write_cache(kind, payload, content_hash)
+        return payload
+
+    def _read_cache(self, kind: str) -> Optional[dict[str, Any]]:
+        try:
+            with open(self._cache_path(kind), "rb") as file:
+                # the cache is only written by envers, in a directory ignored
+                # by git, and marshal does not execute code while loading
+                cache = marshal.load(file)  # nosec B302
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if (
+            not isinstance(cache, dict)
+            or cache.get("version") != SPEC_CACHE_VERSION
+        ):
+            return None
+        return cache
+
+    def _write_cache(self, kind: str, payload: Any, content_hash: str) -> None:
+        if not is_cache_enabled():
+            return
+
+        st = os.stat(self.path)
+        cache = {
+            "version": SPEC_CACHE_VERSION,
+            "stat": (st.st_mtime_ns, st.st_size, st.st_ino),
+            "trusted": time.time_ns() - st.st_mtime_ns
+            > SPEC_CACHE_RACY_WINDOW,
+            "hash": content_hash,
+            "payload": payload,
+        }
+        try:
+            content = marshal.dumps(cache)
+        except ValueError:
+            # the specs have values not supported by marshal (e.g. dates)
+            return
+
+        try:
+            self.cache_dir.mkdir(exist_ok=True)
+            gitignore = self.cache_dir / ".gitignore"
+            if not gitignore.exists():
+                gitignore.write_text("*\n")
+            atomic_write(self._cache_path(kind), content)
+        except OSError:
+            # the cache is an optimization, a read-only checkout still works
+            return
@@ -0,0 +1,216 @@
+"""
+Interpolation of the variable values of a profile.
+
+A value can reference another variable of the same file with `{{ VAR }}`,
+or of another file of the same profile with `{{ path/.env:VAR }}`. The
+references are resolved when the files are rendered (the stored values
+keep the references), and the tags escaped with `escape_template_tag` are
+rendered as literal `{{ VAR }}`.
+
+The values are compiled once (and cached) into their literal parts and
+references, the references make a dependency graph that is evaluated in
+topological order, each variable once, so rendering is linear in the
+number of variables and references. Cycles and references to undefined
+variables raise TemplateError.
+"""
+
+from __future__ import annotations
+
+import functools
+import re
+
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+from envers.errors import TemplateError
+
+# a reference, with an optional file path before the last colon
+_REFERENCE = re.compile(
+    r"\{\{\s*(?:(?P<file>[^{}\s]+):)?(?P<name>[A-Za-z_][A-Za-z0-9_]*)\s*\}\}"
+)
+TEMPLATE_CACHE_SIZE = 4096
+
+# a variable, as (file path, variable name)
+Node = Tuple[str, str]
+# the parts of a compiled value: literal text or references, where the file
+# path of a reference is None for the same file
+Reference = Tuple[Optional[str], str]
+Template = Tuple[Union[str, Reference], ...]
+
+
+def escape_template_tag(v: str) -> str:
+    """Escape template tags for template rendering."""
+    return v.replace("{{", r"\{\{").replace("}}", r"\}\}")
+
+
+def unescape_template_tag(v: str) -> str:
+    """Unescape template tags for template rendering."""
+    return v.replace(r"\{\{", "{{").replace(r"\}\}", "}}")
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(text: str) -> Optional[Template]:
+    """
+    Split the value into its literal parts and its references.
+
+    Returns
+    -------
+    Optional[Template]
+        The parts of the value, None when it has no reference nor escaped
+        tag (so it is rendered as it is).
+    """
+    if "{{" not in text and r"\{\{" not in text:
+        return None
+
+    parts: List[Union[str, Reference]] = []
+    position = 0
+    for match in _REFERENCE.finditer(text):
+        if match.start() > position:
+            parts.append(unescape_template_tag(text[position : match.start()]))
+        parts.append((match.group("file"), match.group("name")))
+        position = match.end()
+    if position < len(text):
+        parts.append(unescape_template_tag(text[position:]))
+    return tuple(parts)
+
+
+def has_references(value: Any) -> bool:
+    """Return True when the value references other variables."""
+    template = compile_template(value) if isinstance(value, str) else None
+    return template is not None and any(
+        not isinstance(part, str) for part in template
+    )
+
+
+def _format(value: Any) -> str:
+    """Return the value as it is inserted in another value."""
+    return "" if value is None else str(value)
+
+
+def _build_graph(
+    files: Mapping[str, Mapping[str, Any]],
+) -> Dict[Node, Tuple[Template, List[Node]]]:
+    """
+    Return the template and the dependencies of each value to be rendered.
+
+    Raises TemplateError when a reference is not defined.
+    """
+    graph: Dict[Node, Tuple[Template, List[Node]]] = {}
+    for file_path, variables in files.items():
+        for name, value in variables.items():
+            template = (
+                compile_template(value) if isinstance(value, str) else None
+            )
+            if template is None:
+                continue
+            dependencies = []
+            for part in template:
+                if isinstance(part, str):
+                    continue
+                dependency = (part[0] or file_path, part[1])
+                if dependency[1] not in files.get(dependency[0], {}):
+                    raise TemplateError(
+                        f"{file_path}:{name} references "
+                        f"{dependency[0]}:{dependency[1]}, which is not "
+                        "defined."
+                    )
+                dependencies.append(dependency)
+            graph[(file_path, name)] = (template, dependencies)
+    return graph
+
+
+def _sort_graph(graph: Dict[Node, Tuple[Template, List[Node]]]) -> List[Node]:
+    """
+    Return the nodes of the graph in topological order.
+
+    It is a depth-first search in post-order, without recursion so long
+    chains of references do not hit the recursion limit. Raises
+    TemplateError when the references make a cycle.
+    """
+    order: List[Node] = []
+    done = set()
+    for root in graph:
+        if root in done:
+            continue
+        stack = [(root, iter(graph[root][1]))]
+        visiting = {root}
+        while stack:
+            node, dependencies = stack[-1]
+            for dependency in dependencies:
+                if dependency in done or dependency not in graph:
+                    continue
+                if dependency in visiting:
+                    _raise_cycle([item[0] for item in stack], dependency)
+                visiting.add(dependency)
+                stack.append((dependency, iter(graph[dependency][1])))
+                break
+            else:
+                stack.pop()
+                visiting.discard(node)
+                done.add(node)
+                order.append(node)
+    return order
+
+
+def _raise_cycle(path: List[Node], node: Node) -> None:
+    cycle = [*path[path.index(node) :], node]
+    raise TemplateError(
+        "The references make a cycle: "
+        + " -> ".join(f"{file_path}:{name}" for file_path, name in cycle)
+    )
+
+
+def _render(
+    node: Node,
+    template: Template,
+    files: Mapping[str, Mapping[str, Any]],
+    rendered: Mapping[Node, str],
+) -> str:
+    """Render a value whose dependencies are already rendered."""
+    text = []
+    for part in template:
+        if isinstance(part, str):
+            text.append(part)
+            continue
+        dependency = (part[0] or node[0], part[1])
+        if dependency in rendered:
+            text.append(rendered[dependency])
+        else:
+            text.append(_format(files[dependency[0]][dependency[1]]))
+    return "".join(text)
+
+
+def render_files(
+    files: Mapping[str, Mapping[str, Any]],
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Resolve the references of the variables of a profile.
+
+    Parameters
+    ----------
+    files : Mapping[str, Mapping[str, Any]]
+        The variables of each file of the profile.
+
+    Returns
+    -------
+    Dict[str, Dict[str, Any]]
+        The variables of each file, where the values with references (or
+        escaped tags) are rendered as strings, and the others are kept.
+
+    Raises
+    ------
+    TemplateError
+        When a reference is not defined, or the references make a cycle.
+    """
+    graph = _build_graph(files)
+
+    rendered: Dict[Node, str] = {}
+    for node in _sort_graph(graph):
+        rendered[node] = _render(node, graph[node][0], files, rendered)
+
+    return {
+        file_path: {
+            name: rendered.get((file_path, name), value)
+            for name, value in variables.items()
+        }
+        for file_path, variables in files.items()
+    }
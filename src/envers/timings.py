@@ -0,0 +1,195 @@
+"""
+Timing of the phases of a command, for `--timings` and ENVERS_PROFILE.
+
+The hot paths are wrapped in named spans (`kdf`, `decrypt`, `encrypt`,
+`parse`, `dump`, `build`, `render`, `validate` and `write`). The spans cost
+almost nothing until the timings are enabled, then their time is added up
+by name and, optionally, each span is written to a trace file as a JSON
+line.
+
+ENVERS_PROFILE=<path> profiles a CLI run: a `.json` or `.jsonl` path gets
+the JSON trace records, any other path gets a cProfile dump (to be read
+with `python -m pstats <path>` or snakeviz). The spans run in the worker
+processes of `load-all` are not recorded.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+PROFILE_ENV = "ENVERS_PROFILE"
+TRACE_SUFFIXES = (".json", ".jsonl")
+
+# name -> [total seconds, count]
+_totals: Dict[str, List[float]] = {}
+_totals_lock = threading.Lock()
+_enabled = False
+_trace: Optional[IO[str]] = None
+_origin = 0.0
+# the spans open in the current thread, a span nested in another one with
+# the same name (e.g. `parse` in `parse`) is only counted once
+_local = threading.local()
+
+
+class _Span:
+    """Context manager that records the time of one span."""
+
+    __slots__ = ("name", "nested", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = 0.0
+        self.nested = False
+
+    def __enter__(self) -> None:
+        active = _local.__dict__.setdefault("active", set())
+        self.nested = self.name in active
+        if not self.nested:
+            active.add(self.name)
+            self.start = time.perf_counter()
+
+    def __exit__(self, *args: Any) -> None:
+        if self.nested:
+            return
+        elapsed = time.perf_counter() - self.start
+        _local.active.discard(self.name)
+        _record(self.name, self.start, elapsed)
+
+
+class _NoSpan:
+    """Context manager used while the timings are disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str) -> Any:
+    """Return a context manager that times the block as the given span."""
+    return _Span(name) if _enabled else _NO_SPAN
+
+
+def _record(name: str, start: float, elapsed: float) -> None:
+    with _totals_lock:
+        total = _totals.setdefault(name, [0.0, 0])
+        total[0] += elapsed
+        total[1] += 1
+        if _trace is not None:
+            record = {
+                "name": name,
+                "start": round(start - _origin, 6),
+                "duration": round(elapsed, 6),
+                "pid": os.getpid(),
+                "thread": threading.current_thread().name,
+            }
+            _trace.write(json.dumps(record) + "\n")
+
+
+def enable(trace: Optional[IO[str]] = None) -> None:
+    """Start recording the spans, and writing them to `trace` if given."""
+    global _enabled, _trace, _origin
+    with _totals_lock:
+        _totals.clear()
+        _trace = trace
+        _origin = time.perf_counter()
+        _enabled = True
+
+
+def disable() -> None:
+    """Stop recording the spans."""
+    global _enabled, _trace
+    with _totals_lock:
+        _enabled = False
+        _trace = None
+
+
+def get_totals() -> Dict[str, Tuple[float, int]]:
+    """Return the total time (in seconds) and the count of each span."""
+    with _totals_lock:
+        return {
+            name: (total[0], int(total[1])) for name, total in _totals.items()
+        }
+
+
+def format_report(
+    totals: Dict[str, Tuple[float, int]], elapsed: float
+) -> List[str]:
+    """
+    Return the lines of the breakdown of the run, the slowest span first.
+
+    The spans of different names can be nested (e.g. `parse` in
+    `decrypt`) or run in parallel threads, so their sum can exceed the
+    total time.
+    """
+    lines = [f"{'total':<10}{elapsed * 1000:>10.1f} ms"]
+    for name, (seconds, count) in sorted(
+        totals.items(), key=lambda item: -item[1][0]
+    ):
+        share = seconds / elapsed * 100 if elapsed else 0.0
+        lines.append(
+            f"{name:<10}{seconds * 1000:>10.1f} ms {share:>5.1f}%  x{count}"
+        )
+    return lines
+
+
+@contextmanager
+def run(
+    show_timings: bool = False,
+    echo: Callable[[str], Any] = print,
+    profile_path: Optional[str] = None,
+) -> Iterator[None]:
+    """
+    Time or profile the block, e.g. a CLI command.
+
+    With `show_timings`, the breakdown of the spans is passed to `echo`
+    at the end. `profile_path` defaults to ENVERS_PROFILE.
+    """
+    profile_path = (
+        os.getenv(PROFILE_ENV, "") if profile_path is None else profile_path
+    )
+    is_trace = Path(profile_path).suffix in TRACE_SUFFIXES
+
+    if not (show_timings or profile_path):
+        yield
+        return
+
+    trace: Optional[IO[str]] = None
+    profiler: Any = None
+    if profile_path and is_trace:
+        trace = open(profile_path, "w", encoding="utf-8")
+    elif profile_path:
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+    enable(trace)
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        elapsed = time.perf_counter() - start
+        disable()
+        if trace is not None:
+            trace.close()
+        if show_timings:
+            for line in format_report(get_totals(), elapsed):
+                echo(line)
@@ -0,0 +1,358 @@
+"""
+Parsing and validation of the values set for the profile variables.
+
+The definition of each variable in the spec (`type`, `required`, `pattern`,
+`choices`, `min` and `max`) is compiled once into a validator, and the
+validators of a release are cached by the hash of its spec, so checking the
+values of all the profiles is a single pass over the values. A definition
+that cannot be compiled (e.g. an unknown `type`) raises InvalidSpecError.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import re
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+
+from dotenv import dotenv_values
+
+from envers import serialization
+from envers.errors import InvalidSpecError
+from envers.templates import has_references
+from envers.timings import span
+
+VALUE_FORMATS = ("dotenv", "json", "yaml")
+SCALAR_TYPES = (str, int, float, bool)
+VAR_TYPES = ("string", "int", "float", "bool", "path")
+BOOL_VALUES = ("true", "false", "1", "0", "yes", "no", "on", "off")
+VALIDATOR_CACHE_SIZE = 64
+
+# return the reason a value is not valid, or None
+Validator = Callable[[Any], Optional[str]]
+# a check of a set value, given the value and its stripped text
+Check = Callable[[Any, str], Optional[str]]
+# the validators of each variable, by file path and variable name
+SpecValidators = Dict[str, Dict[str, Validator]]
+
+# hash of the spec files of a release -> their validators
+_validators_cache: OrderedDict[str, SpecValidators] = OrderedDict()
+
+
+def detect_format(path: str) -> str:
+    """Return the format of a values file, from its extension."""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".json":
+        return "json"
+    if suffix in (".yaml", ".yml"):
+        return "yaml"
+    return "dotenv"
+
+
+def parse_values(content: str, value_format: str = "dotenv") -> dict[str, Any]:
+    """
+    Parse the values to set, in the dotenv, JSON or YAML format.
+
+    JSON and YAML documents are mappings of variable names to values, or of
+    file paths (as defined by the spec) to mappings of variable names to
+    values.
+    """
+    if value_format == "dotenv":
+        parsed = dotenv_values(stream=io.StringIO(content), interpolate=False)
+        return {name: value or "" for name, value in parsed.items()}
+
+    if value_format == "json":
+        data = json.loads(content) if content.strip() else {}
+    elif value_format == "yaml":
+        data = serialization.load_yaml(content) or {}
+    else:
+        raise ValueError(f"Unsupported values format: {value_format}.")
+
+    if not isinstance(data, dict):
+        raise ValueError("The values should be a mapping.")
+    return {str(name): value for name, value in data.items()}
+
+
+def parse_assignments(assignments: Iterable[str]) -> dict[str, str]:
+    """Parse `NAME=value` arguments."""
+    values = {}
+    for assignment in assignments:
+        name, separator, value = assignment.partition("=")
+        if not separator or not name:
+            raise ValueError(
+                f"Invalid assignment `{assignment}`, expected NAME=value."
+            )
+        values[name] = value
+    return values
+
+
+def _check_int(value: Any, text: str) -> Optional[str]:
+    if isinstance(value, bool) or not (
+        isinstance(value, int) or text.lstrip("+-").isdigit()
+    ):
+        return f"expected an int, got `{value}`"
+    return None
+
+
+def _check_float(value: Any, text: str) -> Optional[str]:
+    if isinstance(value, bool):
+        return f"expected a float, got `{value}`"
+    try:
+        float(text)
+    except ValueError:
+        return f"expected a float, got `{value}`"
+    return None
+
+
+def _check_bool(value: Any, text: str) -> Optional[str]:
+    if not isinstance(value, bool) and text.lower() not in BOOL_VALUES:
+        return f"expected a bool, got `{value}`"
+    return None
+
+
+# the types without a check (e.g. `string` and `path`) accept any value
+_TYPE_CHECKS: Dict[str, Check] = {
+    "int": _check_int,
+    "float": _check_float,
+    "bool": _check_bool,
+}
+
+
+def _compile_pattern(pattern: Any) -> Check:
+    try:
+        regex = re.compile(str(pattern))
+    except re.error as e:
+        raise ValueError(f"the pattern `{pattern}` is not valid ({e})")
+
+    def check(value: Any, text: str) -> Optional[str]:
+        if regex.fullmatch(str(value)) is None:
+            return f"`{value}` does not match `{pattern}`"
+        return None
+
+    return check
+
+
+def _compile_choices(choices: Any) -> Check:
+    if not isinstance(choices, list):
+        raise ValueError("`choices` should be a list")
+    allowed = {str(choice) for choice in choices}
+    shown = ", ".join(str(choice) for choice in choices)
+
+    def check(value: Any, text: str) -> Optional[str]:
+        if text not in allowed:
+            return f"expected one of {shown}, got `{value}`"
+        return None
+
+    return check
+
+
+def _compile_range(var_type: str, minimum: Any, maximum: Any) -> Check:
+    try:
+        low = None if minimum is None else float(minimum)
+        high = None if maximum is None else float(maximum)
+    except (TypeError, ValueError):
+        raise ValueError("`min` and `max` should be numbers")
+
+    numeric = var_type in ("int", "float")
+    unit = "" if numeric else " characters"
+
+    def check(value: Any, text: str) -> Optional[str]:
+        # the numeric values are already checked by their type
+        size = float(text) if numeric else len(str(value))
+        if low is not None and size < low:
+            return f"expected at least {minimum}{unit}, got `{value}`"
+        if high is not None and size > high:
+            return f"expected at most {maximum}{unit}, got `{value}`"
+        return None
+
+    return check
+
+
+def _compile_checks(var_spec: Mapping[str, Any]) -> List[Check]:
+    """Return the checks of a set value, raising ValueError if invalid."""
+    var_type = str(var_spec.get("type") or "string")
+    if var_type not in VAR_TYPES:
+        raise ValueError(
+            f"the type `{var_type}` is not known, use one of: "
+            + ", ".join(VAR_TYPES)
+        )
+
+    checks: List[Check] = []
+    if var_type in _TYPE_CHECKS:
+        checks.append(_TYPE_CHECKS[var_type])
+    if var_spec.get("pattern") is not None:
+        checks.append(_compile_pattern(var_spec["pattern"]))
+    if var_spec.get("choices") is not None:
+        checks.append(_compile_choices(var_spec["choices"]))
+    if var_spec.get("min") is not None or var_spec.get("max") is not None:
+        checks.append(
+            _compile_range(var_type, var_spec.get("min"), var_spec.get("max"))
+        )
+    return checks
+
+
+def compile_validator(
+    var_spec: Mapping[str, Any], name: str = ""
+) -> Validator:
+    """
+    Compile the definition of a variable into a validator of its values.
+
+    Parameters
+    ----------
+    var_spec : Mapping[str, Any]
+        The definition of the variable in the spec: its `type` (string,
+        int, float, bool or path), if it is `required`, the regular
+        expression its values should fully match (`pattern`), the allowed
+        values (`choices`), and the range (`min` and `max`) of an int or
+        float value, or of the length of the other values.
+    name : str
+        The name of the variable, used in the errors.
+
+    Returns
+    -------
+    Validator
+        A function that returns the reason a value is not valid, or None
+        when it is valid. An empty value is only invalid when the variable
+        is required, and the values with references are not checked, as
+        they are only known once rendered.
+
+    Raises
+    ------
+    InvalidSpecError
+        If the definition is not valid, e.g. an unknown `type`.
+    """
+    try:
+        checks = _compile_checks(var_spec)
+    except ValueError as e:
+        raise InvalidSpecError(
+            f"The spec of the variable `{name}` is not valid: {e}."
+            if name
+            else f"The spec of the variable is not valid: {e}."
+        )
+    required = bool(var_spec.get("required", False))
+
+    def validate(value: Any) -> Optional[str]:
+        if value is not None and not isinstance(value, SCALAR_TYPES):
+            return f"expected a single value, got {type(value).__name__}"
+        if has_references(value):
+            return None
+
+        text = "" if value is None else str(value).strip()
+        if not text:
+            return "a value is required" if required else None
+
+        for check in checks:
+            error = check(value, text)
+            if error:
+                return error
+        return None
+
+    return validate
+
+
+def validate_value(value: Any, var_spec: dict[str, Any]) -> Optional[str]:
+    """
+    Check a value against the definition of its variable in the spec.
+
+    Returns
+    -------
+    Optional[str]
+        The reason the value is not valid, None when it is valid.
+    """
+    return compile_validator(var_spec)(value)
+
+
+def compile_spec(spec_files: Mapping[str, Any]) -> SpecValidators:
+    """
+    Return the validators of the variables of a release.
+
+    The validators are compiled once for each spec (`spec.files` of a
+    release), and cached by its hash. Raises InvalidSpecError if the
+    definition of a variable is not valid.
+    """
+    content = json.dumps(spec_files, sort_keys=True, default=str)
+    spec_hash = hashlib.sha256(content.encode()).hexdigest()
+
+    validators = _validators_cache.get(spec_hash)
+    if validators is not None:
+        _validators_cache.move_to_end(spec_hash)
+        return validators
+
+    validators = {
+        file_path: {
+            name: compile_validator(var_spec or {}, f"{file_path}:{name}")
+            for name, var_spec in ((file_spec or {}).get("vars") or {}).items()
+        }
+        for file_path, file_spec in spec_files.items()
+    }
+    _validators_cache[spec_hash] = validators
+    if len(_validators_cache) > VALIDATOR_CACHE_SIZE:
+        _validators_cache.popitem(last=False)
+    return validators
+
+
+def get_profile_vars(
+    profile_data: Mapping[str, Any],
+) -> dict[str, dict[str, Any]]:
+    """Return the variables of each file of a profile, as stored."""
+    return {
+        file_path: file_info.get("vars") or {}
+        for file_path, file_info in (profile_data.get("files") or {}).items()
+    }
+
+
+def validate_files(
+    validators: SpecValidators,
+    files: Mapping[str, Mapping[str, Any]],
+    prefix: str = "",
+) -> List[str]:
+    """
+    Check the variables of each file, as `{file: {name: value}}`.
+
+    Returns
+    -------
+    List[str]
+        Every violation, as `<prefix><file>: <name>: <reason>`. The
+        variables not defined by the spec are not checked.
+    """
+    errors = []
+    with span("validate"):
+        for file_path, variables in files.items():
+            file_validators = validators.get(file_path, {})
+            for name, value in variables.items():
+                validator = file_validators.get(name)
+                error = validator(value) if validator else None
+                if error:
+                    errors.append(f"{prefix}{file_path}: {name}: {error}")
+    return errors
+
+
+def validate_profiles(
+    spec_files: Mapping[str, Any], release_data: Mapping[str, Any]
+) -> List[str]:
+    """
+    Check the values of all the profiles of a release in one pass.
+
+    Parameters
+    ----------
+    spec_files : Mapping[str, Any]
+        The files of the spec of the release (`spec.files`).
+    release_data : Mapping[str, Any]
+        The data of each profile (`data` of the release).
+
+    Returns
+    -------
+    List[str]
+        Every violation, as `<profile>: <file>: <name>: <reason>`.
+    """
+    validators = compile_spec(spec_files)
+    errors = []
+    for profile, profile_data in release_data.items():
+        errors += validate_files(
+            validators, get_profile_vars(profile_data or {}), f"{profile}: "
+        )
+    return errors
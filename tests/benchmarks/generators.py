@@ -0,0 +1,133 @@
+"""Generators of synthetic data for the benchmarks."""
+
+from __future__ import annotations
+
+import os
+
+from pathlib import Path
+from typing import Any
+
+from envers import crypt, lockfile, serialization
+
+# multiply the size of the generated data, e.g. ENVERS_BENCHMARK_SCALE=10
+SCALE = int(os.getenv("ENVERS_BENCHMARK_SCALE", "1"))
+
+# a cheap key derivation, the benchmarks measure the data handling
+BENCHMARK_KDF = crypt.KDFParams(crypt.KDF_PBKDF2, 1000)
+
+
+def make_release(
+    files: int, variables: int, prefix: str = ""
+) -> dict[str, Any]:
+    """Return a release spec with the given number of files and vars."""
+    return {
+        "docs": "",
+        "status": "draft",
+        "profiles": ["base"],
+        "spec": {
+            "files": {
+                f"{prefix}service{file_idx}/.env": {
+                    "docs": "",
+                    "type": "dotenv",
+                    "vars": {
+                        f"VAR_{file_idx}_{var_idx}": {
+                            "docs": f"Variable {var_idx} of file {file_idx}",
+                            "type": "string",
+                            "default": f"value-{file_idx}-{var_idx}",
+                        }
+                        for var_idx in range(variables)
+                    },
+                }
+                for file_idx in range(files)
+            }
+        },
+    }
+
+
+def make_specs(releases: int, files: int, variables: int) -> dict[str, Any]:
+    """Return a specs document with releases x files x variables."""
+    return {
+        "version": "0.1",
+        "releases": {
+            f"{release_idx}.0": make_release(files, variables)
+            for release_idx in range(1, releases + 1)
+        },
+    }
+
+
+def make_profile_data(
+    release: dict[str, Any], suffix: str = ""
+) -> dict[str, Any]:
+    """Return the data of each profile of the release, with its defaults."""
+    files = release["spec"]["files"]
+    return {
+        profile: {
+            "files": {
+                file_path: {
+                    "type": file_info["type"],
+                    "vars": {
+                        name: f"{var_info['default']}{suffix}"
+                        for name, var_info in file_info["vars"].items()
+                    },
+                }
+                for file_path, file_info in files.items()
+            }
+        }
+        for profile in release["profiles"]
+    }
+
+
+def make_values(release: dict[str, Any], suffix: str) -> dict[str, Any]:
+    """Return new values for all the variables, by file, for profile_set."""
+    return {
+        file_path: {
+            name: f"{var_info['default']}{suffix}"
+            for name, var_info in file_info["vars"].items()
+        }
+        for file_path, file_info in release["spec"]["files"].items()
+    }
+
+
+def write_project(
+    root: Path,
+    specs: dict[str, Any],
+    password: str,
+    deployed: int = 0,
+) -> None:
+    """
+    Write the `.envers` directory of a project with the given specs.
+
+    The first `deployed` releases are written to the encrypted data lock
+    of each of their profiles, with their default values, as `deploy`
+    does (but without deploying them one by one).
+    """
+    envers_dir = root / ".envers"
+    (envers_dir / "data").mkdir(parents=True, exist_ok=True)
+
+    releases = list(specs["releases"].items())
+    for _, release in releases[:deployed]:
+        release["status"] = "deployed"
+    (envers_dir / "specs.yaml").write_text(serialization.dumps_yaml(specs))
+
+    profiles = {
+        profile
+        for _, release in releases[:deployed]
+        for profile in release["profiles"]
+    }
+    for profile in sorted(profiles):
+        data_lock = lockfile.DataLock.create(BENCHMARK_KDF)
+        key = crypt.create_fernet_key(
+            password, data_lock.header.salt, data_lock.header.kdf
+        )
+        data_lock.meta = {"version": specs["version"]}
+        for name, release in releases[:deployed]:
+            if profile not in release["profiles"]:
+                continue
+            spec = {k: v for k, v in release.items() if k != "status"}
+            data_lock.set_release(
+                name, {"spec": spec, "data": make_profile_data(release)}
+            )
+        data_lock.generation = 1
+        (envers_dir / "data" / f"{profile}.lock").write_text(
+            data_lock.dumps(key)
+        )
@@ -0,0 +1,58 @@
+"""Benchmark merge_dicts against the previous implementation."""
+
+from __future__ import annotations
+
+import copy
+import time
+
+from typing import Any
+
+from envers.core import merge_dicts
+
+from .generators import SCALE, make_release
+
+
+def deepcopy_merge_dicts(
+    dict_lhs: dict[str, Any], dict_rhs: dict[str, Any]
+) -> dict[str, Any]:
+    """Merge the dicts as the previous, deepcopy based, implementation."""
+    dict_lhs = copy.deepcopy(dict_lhs)
+
+    for key in dict_rhs:
+        if key in dict_lhs:
+            if isinstance(dict_lhs[key], dict) and isinstance(
+                dict_rhs[key], dict
+            ):
+                deepcopy_merge_dicts(dict_lhs[key], dict_rhs[key])
+            else:
+                dict_lhs[key] = dict_rhs[key]
+        else:
+            dict_lhs[key] = dict_rhs[key]
+    return dict_lhs
+
+
+def test_merge_dicts_is_faster() -> None:
+    """Compare the merge used by `draft --from-spec` on a large release."""
+    release = make_release(files=30 * SCALE, variables=100)
+    draft = {
+        "docs": "",
+        "status": "draft",
+        "profiles": ["base"],
+        "spec": {"files": {}},
+    }
+
+    timings = {}
+    for merge in (deepcopy_merge_dicts, merge_dicts):
+        start = time.perf_counter()
+        for _ in range(5):
+            merged = merge(release, draft)
+        timings[merge.__name__] = time.perf_counter() - start
+        assert merged["spec"] == release["spec"]
+
+    print(
+        "\nmerge_dicts x5 (s): "
+        f"deepcopy={timings['deepcopy_merge_dicts']:.4f} "
+        f"copy-on-write={timings['merge_dicts']:.4f}"
+    )
+
+    assert timings["merge_dicts"] < timings["deepcopy_merge_dicts"]
@@ -0,0 +1,193 @@
+"""
+Benchmark how the main operations scale with the size of the projects.
+
+Each operation is timed on a small project, and on a larger one along each
+axis in turn (more releases in the history, more files per release and
+more variables per file). The growth of its time along each axis is
+compared with the baseline in `baselines.json`, as the exponent `e` of
+`time ~ size ** e` (1 for a linear operation, 0 when the size does not
+matter, e.g. the releases not read). The absolute times depend on the
+machine, the exponents do not, so a regression (e.g. a loop over the whole
+history) fails on any machine.
+
+These benchmarks are not run by default, use `pytest -m benchmark`.
+ENVERS_BENCHMARK_UPDATE=1 stores the measured exponents as the new
+baselines, and ENVERS_BENCHMARK_TOLERANCE changes the allowed growth.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import time
+
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import pytest
+
+from envers import crypt, lockfile
+from envers.core import Envers, merge_dicts
+
+from .generators import (
+    BENCHMARK_KDF,
+    SCALE,
+    make_release,
+    make_specs,
+    make_values,
+    write_project,
+)
+
+pytestmark = pytest.mark.benchmark
+
+BASELINES_PATH = Path(__file__).parent / "baselines.json"
+UPDATE_BASELINES = os.getenv("ENVERS_BENCHMARK_UPDATE", "") == "1"
+# how much the exponent can exceed its baseline
+TOLERANCE = float(os.getenv("ENVERS_BENCHMARK_TOLERANCE", "0.5"))
+
+PASSWORD = "Envers everywhere!"
+AXES = ("releases", "files", "variables")
+# the size of the small project, each axis is multiplied by GROWTH in turn
+BASE_SIZE = {"releases": 3, "files": 5, "variables": 20 * SCALE}
+GROWTH = 4
+REPEATS = 5
+
+# the number of releases, files per release and variables per file
+Size = Dict[str, int]
+# prepare a project of the given size in the given directory and return the
+# operation to be timed
+Setup = Callable[[Path, Size], Callable[[], Any]]
+
+
+def get_specs(size: Size) -> dict[str, Any]:
+    """Return a specs document of the given size."""
+    return make_specs(size["releases"], size["files"], size["variables"])
+
+
+def setup_draft(root: Path, size: Size) -> Callable[[], Any]:
+    """Create a draft from the last release."""
+    write_project(root, get_specs(size), PASSWORD)
+    return lambda: Envers().draft("new", from_spec=f"{size['releases']}.0")
+
+
+def setup_deploy(root: Path, size: Size) -> Callable[[], Any]:
+    """Deploy a new release to a data lock with the previous releases."""
+    write_project(root, get_specs(size), PASSWORD, size["releases"] - 1)
+    return lambda: Envers().deploy("base", f"{size['releases']}.0", PASSWORD)
+
+
+def setup_profile_set(root: Path, size: Size) -> Callable[[], Any]:
+    """Set new values for all the variables of a release."""
+    specs = get_specs(size)
+    write_project(root, specs, PASSWORD, size["releases"])
+    values = make_values(specs["releases"]["1.0"], "-new")
+    return lambda: Envers().profile_set("base", "1.0", PASSWORD, values)
+
+
+def setup_profile_load(root: Path, size: Size) -> Callable[[], Any]:
+    """Write the files of a release."""
+    write_project(root, get_specs(size), PASSWORD, size["releases"])
+    return lambda: Envers().profile_load("base", "1.0", PASSWORD)
+
+
+def setup_merge_dicts(root: Path, size: Size) -> Callable[[], Any]:
+    """Merge a release into an empty draft, as `draft --from-spec`."""
+    release = make_release(size["files"], size["variables"])
+    draft = {"docs": "", "status": "draft", "spec": {"files": {}}}
+    # repeated, as a single merge is too fast to be timed
+    return lambda: [merge_dicts(release, draft) for _ in range(100)]
+
+
+def setup_crypt(root: Path, size: Size) -> Callable[[], Any]:
+    """Read a release of a data lock with a history and change it."""
+    header = lockfile.DataLock.create(BENCHMARK_KDF).header
+    key = crypt.create_fernet_key(PASSWORD, header.salt, header.kdf)
+    data_lock = lockfile.DataLock(header)
+    for release_idx in range(1, size["releases"] + 1):
+        data_lock.set_release(
+            f"{release_idx}.0",
+            make_release(size["files"], size["variables"], f"{release_idx}-"),
+        )
+    content = data_lock.dumps(key)
+
+    def round_trip() -> None:
+        loaded = lockfile.DataLock.loads(content)
+        release = loaded.get_release("1.0", key)
+        release["docs"] = "changed"
+        loaded.set_release("1.0", release)
+        loaded.dumps(key)
+
+    return round_trip
+
+
+OPERATIONS: Dict[str, Setup] = {
+    "draft": setup_draft,
+    "deploy": setup_deploy,
+    "profile_set": setup_profile_set,
+    "profile_load": setup_profile_load,
+    "merge_dicts": setup_merge_dicts,
+    "crypt": setup_crypt,
+}
+
+
+def measure(
+    setup: Setup, root: Path, size: Size, monkeypatch: pytest.MonkeyPatch
+) -> float:
+    """Return the best time of the operation, on a new project each time."""
+    timings = []
+    for run in range(REPEATS):
+        run_root = root / str(run)
+        run_root.mkdir(parents=True)
+        monkeypatch.chdir(run_root)
+        operation = setup(run_root, size)
+
+        start = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+@pytest.mark.parametrize("name", list(OPERATIONS))
+def test_scaling(
+    name: str,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test the time of the operation grows as its baseline on each axis."""
+    monkeypatch.delenv("ENVERS_AGENT_SOCK", raising=False)
+    monkeypatch.delenv("ENVERS_PASSWORD", raising=False)
+
+    setup = OPERATIONS[name]
+    small = measure(setup, tmp_path / "base", BASE_SIZE, monkeypatch)
+    exponents = {}
+    for axis in AXES:
+        size = {**BASE_SIZE, axis: BASE_SIZE[axis] * GROWTH}
+        large = measure(setup, tmp_path / axis, size, monkeypatch)
+        exponents[axis] = math.log(large / small) / math.log(GROWTH)
+
+    baselines = json.loads(BASELINES_PATH.read_text())
+    if UPDATE_BASELINES:
+        # a negative exponent is only noise around a constant time
+        baselines[name] = {
+            axis: round(max(exponent, 0.0), 2)
+            for axis, exponent in exponents.items()
+        }
+        BASELINES_PATH.write_text(
+            json.dumps(baselines, indent=2, sort_keys=True) + "\n"
+        )
+
+    print(
+        f"\n{name} ({small * 1000:.1f} ms): "
+        + ", ".join(
+            f"{axis} x{GROWTH} exponent={exponents[axis]:.2f} "
+            f"(baseline {baselines[name][axis]})"
+            for axis in AXES
+        )
+    )
+
+    assert {
+        axis: round(exponent, 2)
+        for axis, exponent in exponents.items()
+        if exponent > baselines[name][axis] + TOLERANCE
+    } == {}
@@ -0,0 +1,44 @@
+"""Benchmark the YAML serialization with and without libyaml."""
+
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from envers import serialization
+
+from .generators import SCALE, make_specs
+
+
+@pytest.mark.skipif(
+    not serialization.LIBYAML_AVAILABLE, reason="libyaml is not available"
+)
+def test_libyaml_is_faster() -> None:
+    """Compare the C and the pure Python paths on a large specs file."""
+    # 3000 variables per release, as a large real-world specs file
+    specs = make_specs(releases=SCALE, files=30, variables=100)
+
+    timings: dict[bool, tuple[float, float]] = {}
+    documents: dict[bool, str] = {}
+    for accelerated in (False, True):
+        start = time.perf_counter()
+        document = serialization.dumps_yaml(specs, accelerated=accelerated)
+        dump_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loaded = serialization.load_yaml(document, accelerated=accelerated)
+        load_time = time.perf_counter() - start
+
+        assert loaded == specs
+        timings[accelerated] = (dump_time, load_time)
+        documents[accelerated] = document
+
+    print(
+        "\nYAML dump/load (s): "
+        f"pure={timings[False][0]:.3f}/{timings[False][1]:.3f} "
+        f"libyaml={timings[True][0]:.3f}/{timings[True][1]:.3f}"
+    )
+
+    assert serialization.load_yaml(documents[False]) == specs
+    assert sum(timings[True]) < sum(timings[False])
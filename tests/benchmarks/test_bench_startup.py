@@ -0,0 +1,61 @@
+"""Benchmark the import time of the CLI with `python -X importtime`."""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+# budget (in ms) for importing the CLI, including typer, e.g. for a slow CI
+# runner use ENVERS_IMPORT_BUDGET_MS=1000. The budget is only checked with
+# `pytest -m benchmark`, the modules imported are checked by default
+IMPORT_BUDGET_MS = int(os.getenv("ENVERS_IMPORT_BUDGET_MS", "400"))
+
+# modules only needed by the commands, never by `--help` or `--version`
+LAZY_MODULES = (
+    "cryptography",
+    "yaml",
+    "dotenv",
+    "envers.core",
+    "envers.crypt",
+    "importlib.metadata",
+)
+
+
+def get_import_times(module: str) -> dict[str, int]:
+    """Return the cumulative import time (in us) of each imported module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            import_times[name.strip()] = int(cumulative)
+    return import_times
+
+
+@pytest.mark.parametrize("module", LAZY_MODULES)
+def test_cli_imports_lazily(module: str) -> None:
+    """Test the heavy dependencies are not imported by the CLI module."""
+    assert module not in get_import_times("envers.cli")
+
+
+@pytest.mark.benchmark
+def test_cli_import_budget() -> None:
+    """Test the CLI module is imported within the import time budget."""
+    # the best of a few runs, to ignore the cold caches
+    elapsed = min(
+        get_import_times("envers.cli")["envers.cli"] for _ in range(3)
+    )
+
+    print(f"\nimport envers.cli: {elapsed / 1000:.1f} ms")
+
+    assert elapsed / 1000 < IMPORT_BUDGET_MS
@@ -0,0 +1,123 @@
+"""Tests for the envers session agent."""
+
+from __future__ import annotations
+
+import os
+import stat
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+import yaml
+
+from envers import agent, crypt
+from envers.core import Envers
+
+
+@pytest.fixture
+def agent_server(
+    monkeypatch: pytest.MonkeyPatch,
+) -> Iterator[agent.AgentServer]:
+    """Run an agent in a background thread."""
+    # keep the socket path short, it is limited to ~100 characters
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = Path(tmp_dir) / "agent" / "agent.sock"
+        server = agent.AgentServer(socket_path, ttl=60)
+        thread = threading.Thread(
+            target=server.serve_forever, kwargs={"poll_interval": 0.05}
+        )
+        thread.start()
+        monkeypatch.setenv(agent.AGENT_SOCKET_ENV, str(socket_path))
+
+        yield server
+
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_socket_permissions(agent_server: agent.AgentServer) -> None:
+    """Test the socket is only accessible by the current user."""
+    socket_mode = stat.S_IMODE(os.stat(agent_server.socket_path).st_mode)
+    dir_mode = stat.S_IMODE(os.stat(agent_server.socket_path.parent).st_mode)
+
+    assert socket_mode == 0o600
+    assert dir_mode == 0o700
+
+
+def test_add_and_get_key(agent_server: agent.AgentServer) -> None:
+    """Test the agent serves the keys added by the clients."""
+    header = crypt.LockHeader(crypt.LEGACY_KDF, crypt.generate_salt())
+    other_header = crypt.LockHeader(crypt.LEGACY_KDF, crypt.generate_salt())
+    key = b"a" * 44
+
+    assert agent.get_key(header) is None
+    assert agent.add_key(header, key)
+    assert agent.get_key(header) == key
+    assert agent.get_key(other_header) is None
+
+    assert agent.request({"op": "clear"}) == {"ok": True}
+    assert agent.get_key(header) is None
+
+
+def test_key_ttl(agent_server: agent.AgentServer) -> None:
+    """Test the keys are removed when they expire."""
+    header = crypt.LockHeader(crypt.LEGACY_KDF, crypt.generate_salt())
+
+    assert agent.add_key(header, b"a" * 44, ttl=0)
+    assert agent.get_key(header) is None
+
+    assert agent.add_key(header, b"a" * 44, ttl=0)
+    time.sleep(0.2)
+    assert len(agent_server.store) == 0
+
+
+def test_no_agent(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the clients work without an agent."""
+    monkeypatch.delenv(agent.AGENT_SOCKET_ENV, raising=False)
+    header = crypt.LockHeader(crypt.LEGACY_KDF, crypt.generate_salt())
+
+    assert not agent.add_key(header, b"a" * 44)
+    assert agent.get_key(header) is None
+
+
+def test_envers_uses_agent(
+    agent_server: agent.AgentServer,
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+) -> None:
+    """Test Envers does not ask the password for keys in the agent."""
+    monkeypatch.chdir(tmp_path)
+    Envers().init(Path("."))
+
+    spec = {
+        "docs": "",
+        "status": "draft",
+        "profiles": ["base"],
+        "spec": {
+            "files": {
+                ".env": {
+                    "type": "dotenv",
+                    "vars": {"var": {"type": "string", "default": "hello"}},
+                }
+            }
+        },
+    }
+    with open(".envers/specs.yaml", "w") as f:
+        yaml.safe_dump({"version": "0.1", "releases": {"1.0": spec}}, f)
+
+    Envers().deploy(profile="base", spec="1.0", password="Envers!")
+
+    def get_password(message: str = "") -> str:
+        raise AssertionError("The password should not be requested.")
+
+    monkeypatch.setattr(crypt, "get_password", get_password)
+    crypt.clear_key_cache()
+
+    Envers().profile_load(profile="base", spec="1.0")
+
+    assert Path(".env").read_text() == "var=hello\n"
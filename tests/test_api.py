@@ -0,0 +1,148 @@
+"""Tests for the library API."""
+
+from __future__ import annotations
+
+import copy
+import subprocess
+import sys
+
+from pathlib import Path
+from typing import Any
+
+import envers
+import pytest
+import yaml
+
+from envers import agent
+from envers.api import get_profile_key
+from envers.core import Envers
+
+PASSWORD = "Envers everywhere!"
+
+
+@pytest.fixture
+def envers_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Return a directory with the release 1.0 deployed for `base`."""
+    release: dict[str, Any] = {
+        "docs": "",
+        "status": "draft",
+        "profiles": ["base"],
+        "spec": {
+            "files": {
+                ".env": {
+                    "type": "dotenv",
+                    "vars": {
+                        "HOST": {"type": "string", "default": "localhost"},
+                        "PORT": {"type": "int", "default": 8080},
+                    },
+                },
+                "worker/.env": {
+                    "type": "dotenv",
+                    "vars": {"PORT": {"type": "int", "default": 9090}},
+                },
+            }
+        },
+    }
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("ENVERS_AGENT_SOCK", raising=False)
+    monkeypatch.delenv("ENVERS_PASSWORD", raising=False)
+    monkeypatch.delenv("ENVERS_PASSWORD_BASE", raising=False)
+
+    Envers().init(Path("."))
+    with open(".envers/specs.yaml", "w") as f:
+        yaml.safe_dump(
+            {"version": "0.1", "releases": {"1.0": copy.deepcopy(release)}},
+            f,
+        )
+    Envers().deploy(profile="base", spec="1.0", password=PASSWORD)
+    return tmp_path
+
+
+def test_load_files(envers_dir: Path) -> None:
+    """Test the variables are returned by file, as strings."""
+    assert envers.load_files("base", "1.0", PASSWORD, root=envers_dir) == {
+        ".env": {"HOST": "localhost", "PORT": "8080"},
+        "worker/.env": {"PORT": "9090"},
+    }
+
+
+def test_load_into_environ(
+    envers_dir: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test the variables are set in the given mapping, without files."""
+    monkeypatch.setenv("ENVERS_PASSWORD_BASE", PASSWORD)
+    environ = {"HOST": "example.com"}
+
+    variables = envers.load(
+        "base", "1.0", files=[".env"], environ=environ, override=False
+    )
+
+    assert variables == {"HOST": "localhost", "PORT": "8080"}
+    assert environ == {"HOST": "example.com", "PORT": "8080"}
+    assert not (envers_dir / ".env").exists()
+
+    # the files given later take precedence
+    assert envers.load("base", "1.0")["PORT"] == "9090"
+
+
+@pytest.mark.parametrize(
+    "kwargs,error",
+    [
+        ({"profile": "prod"}, envers.DataLockNotFoundError),
+        ({"spec": "2.0"}, envers.ReleaseNotFoundError),
+        ({"password": None}, envers.PasswordRequiredError),
+        ({"password": "wrong"}, envers.InvalidPasswordError),
+        ({"files": ["missing/.env"]}, envers.ProfileNotFoundError),
+    ],
+)
+def test_load_errors(
+    envers_dir: Path, kwargs: dict[str, Any], error: type[Exception]
+) -> None:
+    """Test the failures raise typed exceptions instead of exiting."""
+    arguments = {"profile": "base", "spec": "1.0", "password": PASSWORD}
+    arguments.update(kwargs)
+
+    with pytest.raises(error):
+        envers.load(**arguments)
+
+    assert issubclass(error, envers.EnversError)
+
+
+def test_wrong_password_is_not_added_to_agent(
+    envers_dir: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test only the verified keys are added to the session agent."""
+    keys: dict[str, bytes] = {}
+    monkeypatch.setattr(
+        agent, "get_key", lambda header: keys.get(header.salt.hex())
+    )
+    monkeypatch.setattr(
+        agent,
+        "add_key",
+        lambda header, key: keys.update({header.salt.hex(): key}),
+    )
+
+    with pytest.raises(envers.InvalidPasswordError):
+        envers.load("base", "1.0", "wrong")
+    with pytest.raises(envers.InvalidPasswordError):
+        envers.load_releases("base", "wrong")
+    with pytest.raises(envers.InvalidPasswordError):
+        get_profile_key("base", "wrong")
+    assert keys == {}
+
+    monkeypatch.setenv("ENVERS_PASSWORD", PASSWORD)
+    assert envers.load("base", "1.0")["HOST"] == "localhost"
+    assert list(keys.values()) == [get_profile_key("base")]
+
+
+def test_api_does_not_import_typer() -> None:
+    """Test the library API can be used without typer."""
+    code = "import sys, envers.api; print('typer' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "False"
@@ -10,9 +10,13 @@ from pathlib import Path
 from typing import Any
 
 import pytest
+import typer
 import yaml
 
-from envers.core import Envers
+from envers import agent, crypt, lockfile
+from envers.core import Envers, check_output_dir, merge_dicts
+from envers.errors import InvalidOptionError
+from envers.specs import SpecFile
 
 
 def rmdir(directory: Path) -> None:
@@ -51,6 +55,57 @@ def spec_v1() -> dict[str, Any]:
     }
 
 
+def test_merge_dicts() -> None:
+    """Test merge_dicts merges nested dicts without changing the inputs."""
+    lhs = {
+        "status": "deployed",
+        "spec": {"files": {".env": {"vars": {"a": 1}}}},
+        "profiles": ["base"],
+    }
+    rhs = {"status": "draft", "spec": {"files": {".env2": {"vars": {}}}}}
+    lhs_copy = copy.deepcopy(lhs)
+    rhs_copy = copy.deepcopy(rhs)
+
+    merged = merge_dicts(lhs, rhs)
+
+    assert merged == {
+        "status": "draft",
+        "spec": {"files": {".env": {"vars": {"a": 1}}, ".env2": {"vars": {}}}},
+        "profiles": ["base"],
+    }
+    assert lhs == lhs_copy
+    assert rhs == rhs_copy
+    # the untouched subtrees are shared instead of copied
+    assert merged["profiles"] is lhs["profiles"]
+    assert merged["spec"]["files"][".env"] is lhs["spec"]["files"][".env"]
+
+
+def test_check_options() -> None:
+    """Test the invalid output directories raise a typed error."""
+    check_output_dir("out/{profile}/{{literal}}")
+
+    for output_dir in ("{nope}", "{profile", "{0}", "{profile.name}"):
+        with pytest.raises(InvalidOptionError, match="output directory"):
+            check_output_dir(output_dir)
+
+
+def test_merge_dicts_deeply_nested() -> None:
+    """Test merge_dicts does not depend on the recursion limit."""
+    depth = 5000
+    lhs: dict[str, Any] = {}
+    rhs: dict[str, Any] = {}
+    lhs_node, rhs_node = lhs, rhs
+    for _ in range(depth):
+        lhs_node["a"], rhs_node["a"] = {"lhs": 1}, {"rhs": 2}
+        lhs_node, rhs_node = lhs_node["a"], rhs_node["a"]
+
+    node = merge_dicts(lhs, rhs)
+    for _ in range(depth):
+        node = node["a"]
+        assert node["lhs"] == 1
+        assert node["rhs"] == 2
+
+
 class TestEnvers:
     """Tests for Envers class."""
 
@@ -125,6 +180,11 @@ class TestEnvers:
 
         assert expected_data == result_data
 
+        # the releases share their subtrees, but they are dumped again
+        # instead of using YAML aliases
+        with open(".envers/specs.yaml", "r") as f:
+            assert "&id" not in f.read()
+
     def test_draft_from_env(self, spec_v1) -> None:
         """Test draft method with from_env."""
         v1 = "1.0"
@@ -235,6 +295,11 @@ class TestEnvers:
         assert data_dir.exists()
         assert (data_dir / f"{profile}.lock").exists()
 
+        with open(".envers/specs.yaml", "r") as f:
+            result_data = yaml.safe_load(f)
+
+        assert result_data["releases"][spec_version]["status"] == "deployed"
+
     def test_profile_load(self, spec_v1) -> None:
         """Test draft method."""
         spec_version = "1.0"
@@ -260,3 +325,556 @@ class TestEnvers:
             dotenv_content = f.read()
 
         assert dotenv_content == "var=hello\n"
+
+    def test_rekey(self, spec_v1) -> None:
+        """Test rekey method."""
+        spec_version = "1.0"
+        password = "Envers everywhere!"
+        new_password = "Envers everywhere again!"
+        profile = "base"
+        kdf_params = crypt.KDFParams(crypt.KDF_SCRYPT, 2**10)
+
+        initial_specs = {"version": "0.1", "releases": {spec_version: spec_v1}}
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump(initial_specs, f)
+
+        self.envers.deploy(
+            profile=profile, spec=spec_version, password=password
+        )
+        Envers().rekey(profile, password, new_password, kdf_params)
+
+        with open(f".envers/data/{profile}.lock", "r") as f:
+            header, _ = crypt.parse_header(f.read())
+
+        assert header.kdf == kdf_params
+
+        Envers().profile_load(
+            profile=profile, spec=spec_version, password=new_password
+        )
+
+        with open(".env", "r") as f:
+            assert f.read() == "var=hello\n"
+
+    def test_deploy_keeps_other_releases(self, spec_v1) -> None:
+        """Test deploy does not re-encrypt the other releases."""
+        password = "Envers everywhere!"
+        profile = "base"
+
+        initial_specs = {
+            "version": "0.1",
+            "releases": {"1.0": spec_v1, "2.0": copy.deepcopy(spec_v1)},
+        }
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump(initial_specs, f)
+
+        lock_path = Path(".envers") / "data" / f"{profile}.lock"
+
+        self.envers.deploy(profile=profile, spec="1.0", password=password)
+        segments_v1 = lockfile.DataLock.loads(lock_path.read_text())._segments
+
+        Envers().deploy(profile=profile, spec="2.0", password=password)
+        segments_v2 = lockfile.DataLock.loads(lock_path.read_text())._segments
+
+        assert list(segments_v2) == ["1.0", "2.0"]
+        assert segments_v2["1.0"] == segments_v1["1.0"]
+
+        Envers().profile_load(profile=profile, spec="1.0", password=password)
+
+        with open(".env", "r") as f:
+            assert f.read() == "var=hello\n"
+
+    def test_load_all(self, spec_v1) -> None:
+        """Test load_all loads several profiles with a process pool."""
+        spec_v1["profiles"] = ["base", "prod"]
+        passwords = {"base": "base password", "prod": "prod password"}
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump({"version": "0.1", "releases": {"1.0": spec_v1}}, f)
+
+        for profile, password in passwords.items():
+            Envers().deploy(profile=profile, spec="1.0", password=password)
+
+        # without an output directory, both profiles write the same file
+        with pytest.raises(typer.Exit):
+            Envers().load_all(["base", "prod"], "1.0", passwords, jobs=2)
+        assert not Path(".env").exists()
+
+        self.envers.load_all(
+            ["base", "prod"], "1.0", passwords, jobs=2, output_dir="{profile}"
+        )
+
+        for profile in passwords:
+            with open(Path(profile) / ".env", "r") as f:
+                assert f.read() == "var=hello\n"
+
+        with pytest.raises(typer.Exit):
+            Envers().load_all(
+                ["base", "prod"],
+                "1.0",
+                {"base": "base password", "prod": "wrong"},
+                output_dir="{profile}",
+            )
+
+        for output_dir, jobs in (("{nope}", 0), ("{profile", 0), ("", -1)):
+            with pytest.raises(typer.Exit):
+                Envers().load_all(
+                    ["base"], "1.0", passwords, jobs, output_dir=output_dir
+                )
+
+    def test_concurrent_writers_conflict(self, spec_v1) -> None:
+        """Test a write based on a stale data lock fails, losing nothing."""
+        password = "Envers everywhere!"
+        profile = "base"
+        lock_path = Path(".envers") / "data" / f"{profile}.lock"
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump({"version": "0.1", "releases": {"1.0": spec_v1}}, f)
+
+        self.envers.deploy(profile=profile, spec="1.0", password=password)
+        generation = lockfile.DataLock.loads(lock_path.read_text()).generation
+
+        # both writers read the same generation
+        first, second = Envers(), Envers()
+        data = first._read_data_file(profile, password)
+        second_data = second._read_data_file(profile, password)
+
+        data["releases"]["1.0"]["data"][profile]["files"][".env"]["vars"][
+            "var"
+        ] = "first"
+        first._write_data_file(profile, data)
+
+        second_data["releases"]["1.0"]["data"][profile]["files"][".env"][
+            "vars"
+        ]["var"] = "second"
+        with pytest.raises(typer.Exit):
+            second._write_data_file(profile, second_data)
+
+        data_lock = lockfile.DataLock.loads(lock_path.read_text())
+        assert data_lock.generation == generation + 1
+
+        Envers().profile_load(profile=profile, spec="1.0", password=password)
+        with open(".env", "r") as f:
+            assert f.read() == "var=first\n"
+
+    def test_profile_set_bulk(self, spec_v1) -> None:
+        """Test profile_set applies the given values in one pass."""
+        password = "Envers everywhere!"
+        profile = "base"
+        spec_v1["spec"]["files"][".env"]["vars"]["port"] = {
+            "type": "int",
+            "default": 80,
+        }
+        lock_path = Path(".envers") / "data" / f"{profile}.lock"
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump({"version": "0.1", "releases": {"1.0": spec_v1}}, f)
+
+        self.envers.deploy(profile=profile, spec="1.0", password=password)
+
+        with pytest.raises(typer.Exit):
+            Envers().profile_set(profile, "1.0", password, {"port": "http"})
+
+        with pytest.raises(typer.Exit):
+            Envers().profile_set(
+                profile, "1.0", password, {"other": "x"}, strict=True
+            )
+
+        generation = lockfile.DataLock.loads(lock_path.read_text()).generation
+
+        Envers().profile_set(
+            profile,
+            "1.0",
+            password,
+            {"var": "hello", "port": "8080", "other": "x"},
+        )
+        assert (
+            lockfile.DataLock.loads(lock_path.read_text()).generation
+            == generation + 1
+        )
+
+        # nothing changed, so the data lock is not written again
+        Envers().profile_set(
+            profile, "1.0", password, {".env": {"var": "hello"}}
+        )
+        assert (
+            lockfile.DataLock.loads(lock_path.read_text()).generation
+            == generation + 1
+        )
+
+        Envers().profile_load(profile=profile, spec="1.0", password=password)
+        with open(".env", "r") as f:
+            assert f.read() == "port=8080\nvar=hello\n"
+
+    def test_redeploy_keeps_values(self, spec_v1, capsys) -> None:
+        """Test deploying again only changes the added or removed vars."""
+        password = "Envers everywhere!"
+        profile = "base"
+        spec_v2 = copy.deepcopy(spec_v1)
+        spec_v2["spec"]["files"][".env"]["vars"]["port"] = {
+            "type": "int",
+            "default": 80,
+        }
+
+        def write_specs(releases: dict[str, Any]) -> None:
+            with open(".envers/specs.yaml", "w") as f:
+                yaml.safe_dump(
+                    {"version": "0.1", "releases": copy.deepcopy(releases)}, f
+                )
+
+        write_specs({"1.0": spec_v1})
+        self.envers.deploy(profile=profile, spec="1.0", password=password)
+        output = capsys.readouterr().out
+        assert "1.0 deployed: 1 added (0 seeded), 0 removed, 0 kept." in output
+        assert "  + base:.env:var" in output
+        Envers().profile_set(profile, "1.0", password, {"var": "first"})
+
+        # the release 1.0 is edited: `port` is added and `var` is kept
+        write_specs({"1.0": spec_v2})
+        capsys.readouterr()
+        Envers().deploy(profile=profile, spec="1.0", password=password)
+        assert "  + base:.env:port" in capsys.readouterr().out
+
+        Envers().profile_load(profile=profile, spec="1.0", password=password)
+        with open(".env", "r") as f:
+            assert f.read() == "port=80\nvar=first\n"
+
+        # deploying the same spec again does not write the data lock
+        lock_path = Path(".envers") / "data" / f"{profile}.lock"
+        content = lock_path.read_text()
+        Envers().deploy(profile=profile, spec="1.0", password=password)
+        assert lock_path.read_text() == content
+
+        # a new release with `var` removed, `port` is seeded from 1.0
+        spec_v3 = copy.deepcopy(spec_v2)
+        del spec_v3["spec"]["files"][".env"]["vars"]["var"]
+        Envers().profile_set(profile, "1.0", password, {"port": "8080"})
+        write_specs({"1.0": spec_v2, "2.0": spec_v3})
+        segments = lockfile.DataLock.loads(lock_path.read_text())._segments
+        capsys.readouterr()
+        Envers().deploy(
+            profile=profile, spec="2.0", password=password, seed_from="1.0"
+        )
+        assert "2.0 deployed: 1 added (1 seeded), 0 removed, 0 kept." in (
+            capsys.readouterr().out
+        )
+
+        # the seed release is read, but not encrypted again
+        new_segments = lockfile.DataLock.loads(lock_path.read_text())._segments
+        assert new_segments["1.0"] == segments["1.0"]
+
+        Envers().profile_load(profile=profile, spec="2.0", password=password)
+        with open(".env", "r") as f:
+            assert f.read() == "port=8080\n"
+
+    def test_diff(self, spec_v1, capsys, monkeypatch) -> None:
+        """Test the diff between releases and between profiles."""
+        password = "Envers everywhere!"
+        spec_v1["profiles"] = ["base", "prod"]
+        spec_v2 = copy.deepcopy(spec_v1)
+        spec_v2["spec"]["files"][".env"]["vars"]["port"] = {"type": "int"}
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump(
+                {
+                    "version": "0.1",
+                    "releases": {"1.0": spec_v1, "2.0": spec_v2},
+                },
+                f,
+            )
+
+        for profile in ("base", "prod"):
+            self.envers.deploy(profile=profile, spec="2.0", password=password)
+        Envers().profile_set("prod", "2.0", password, {"var": "secret"})
+
+        capsys.readouterr()
+        assert Envers().diff("1.0", "2.0") == 1
+        assert capsys.readouterr().out.startswith("+ .env:port\n")
+
+        passwords = {"base": password, "prod": password}
+        assert Envers().diff("base@2.0", "prod@2.0", passwords) == 1
+        output = capsys.readouterr().out
+        assert "~ .env:var (value changed)" in output
+        assert "secret" not in output
+
+        assert Envers().diff("prod@2.0", "prod@2.0", passwords) == 0
+
+        with pytest.raises(typer.Exit):
+            Envers().diff("1.0", "prod@2.0", passwords)
+
+        # the deployed releases are compared with the spec in the data lock
+        # files, and the password prompts name the profile
+        os.remove(".envers/specs.yaml")
+        prompts = []
+
+        def get_password(message: str = "") -> str:
+            prompts.append(message)
+            return password
+
+        monkeypatch.setattr(crypt, "get_password", get_password)
+        monkeypatch.setattr(agent, "get_key", lambda header: None)
+        assert Envers().diff("base@2.0", "prod@2.0") == 1
+        assert prompts == [
+            "Enter the password for profile 'base'",
+            "Enter the password for profile 'prod'",
+        ]
+
+    def test_gc(self, spec_v1) -> None:
+        """Test the values replaced in all the releases are collected."""
+        password = "Envers everywhere!"
+        profile = "base"
+        spec_vars = spec_v1["spec"]["files"][".env"]["vars"]
+        spec_vars["other"] = {"docs": "", "type": "string", "default": "x"}
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump(
+                {
+                    "version": "0.1",
+                    "releases": {"1.0": spec_v1, "2.0": spec_v1},
+                },
+                f,
+            )
+
+        self.envers.deploy(profile=profile, spec="1.0", password=password)
+        Envers().profile_set(profile, "1.0", password, {"var": "first"})
+        Envers().profile_set(profile, "1.0", password, {"var": "second"})
+
+        # the values only used by the replaced release are dropped on write
+        assert Envers().gc(profile, password) == 0
+
+        Envers().deploy(
+            profile=profile, spec="2.0", password=password, seed_from="1.0"
+        )
+        Envers().profile_set(profile, "1.0", password, {"var": "third"})
+        Envers().profile_set(profile, "2.0", password, {"var": "fourth"})
+
+        # `second` stays in the value batch shared by both releases
+        assert Envers().gc(profile, password) == 1
+        assert Envers().gc(profile, password) == 0
+
+        for version, value in (("1.0", "third"), ("2.0", "fourth")):
+            Envers().profile_load(
+                profile=profile, spec=version, password=password
+            )
+            with open(".env", "r") as f:
+                assert f.read() == f"other=x\nvar={value}\n"
+
+    def test_draft_from_env_globs(self, monkeypatch, capsys) -> None:
+        """Test several .env files are imported with one specs write."""
+        for idx in range(3):
+            os.makedirs(f"services/app{idx}", exist_ok=True)
+            with open(f"services/app{idx}/.env", "w") as f:
+                f.write(f"var{idx}=value{idx}\n")
+        with open(".env", "w") as f:
+            f.write("var=hello\n")
+
+        saves = []
+        save = SpecFile.save
+        monkeypatch.setattr(
+            SpecFile,
+            "save",
+            lambda spec_file, specs: saves.append(1) or save(spec_file, specs),
+        )
+
+        self.envers.draft(
+            "1.0", from_env=[".env", "services/*/.env", ".env"], jobs=2
+        )
+
+        assert len(saves) == 1
+        with open(".envers/specs.yaml", "r") as f:
+            spec_files = yaml.safe_load(f)["releases"]["1.0"]["spec"]["files"]
+        assert list(spec_files) == [
+            ".env",
+            "services/app0/.env",
+            "services/app1/.env",
+            "services/app2/.env",
+        ]
+        assert spec_files["services/app2/.env"]["vars"]["var2"] == {
+            "docs": "",
+            "type": "string",
+            "default": "value2",
+        }
+
+        with pytest.raises(typer.Exit):
+            self.envers.draft("2.0", from_env=["missing/*.env"])
+
+        capsys.readouterr()
+        self.envers.draft("1.0")
+        assert "version 1.0 is already defined" in capsys.readouterr().out
+
+    def test_profile_load_renders_references(self, spec_v1) -> None:
+        """Test the values referencing other variables are rendered."""
+        password = "Envers everywhere!"
+        profile = "base"
+        spec_v1["spec"]["files"]["app/.env"] = {
+            "type": "dotenv",
+            "vars": {"url": {"type": "string", "default": ""}},
+        }
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump({"version": "0.1", "releases": {"1.0": spec_v1}}, f)
+
+        self.envers.deploy(profile=profile, spec="1.0", password=password)
+        Envers().profile_set(
+            profile,
+            "1.0",
+            password,
+            {"app/.env": {"url": "http://{{ .env:var }}:8080"}},
+        )
+
+        Envers().profile_load(profile=profile, spec="1.0", password=password)
+        with open("app/.env", "r") as f:
+            assert f.read() == "url=http://hello:8080\n"
+
+        Envers().profile_set(
+            profile, "1.0", password, {".env": {"var": "{{ var }}"}}
+        )
+        with pytest.raises(typer.Exit):
+            Envers().profile_load(
+                profile=profile, spec="1.0", password=password
+            )
+
+    def test_profile_values_are_validated(
+        self, spec_v1, capsys, monkeypatch
+    ) -> None:
+        """Test every value that does not match the spec is reported."""
+        password = "Envers everywhere!"
+        profile = "base"
+        spec_v1["spec"]["files"][".env"]["vars"].update(
+            {
+                "port": {"type": "int", "default": 80, "max": 65535},
+                "mode": {"type": "string", "choices": ["dev", "prod"]},
+                "token": {"type": "string", "required": True},
+            }
+        )
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump({"version": "0.1", "releases": {"1.0": spec_v1}}, f)
+
+        # the new variables still need a value, so it is only reported
+        self.envers.deploy(profile=profile, spec="1.0", password=password)
+        assert "base: .env: token: a value is required" in (
+            capsys.readouterr().out
+        )
+
+        with pytest.raises(typer.Exit):
+            Envers().profile_set(
+                profile, "1.0", password, {"port": "70000", "mode": "test"}
+            )
+        output = capsys.readouterr().err
+        assert ".env: port: expected at most 65535" in output
+        assert ".env: mode: expected one of dev, prod" in output
+
+        Envers().profile_set(profile, "1.0", password, {"mode": "prod"})
+        assert ".env: token: a value is required" in capsys.readouterr().out
+
+        with pytest.raises(typer.Exit):
+            Envers().profile_load(
+                profile=profile, spec="1.0", password=password
+            )
+        assert not Path(".env").exists()
+
+        Envers().profile_set(profile, "1.0", password, {"token": "secret"})
+        Envers().profile_load(profile=profile, spec="1.0", password=password)
+        assert Path(".env").exists()
+
+        # each prompted value is entered again until it is valid
+        answers = {"port": ["http", "8080"], "mode": ["test", "dev"]}
+        prompts = []
+
+        def prompt(text: str, default: Any = None) -> Any:
+            name = text.split("`")[1]
+            prompts.append(name)
+            return answers[name].pop(0) if name in answers else default
+
+        monkeypatch.setattr(typer, "prompt", prompt)
+        capsys.readouterr()
+        Envers().profile_set(profile, "1.0", password)
+        assert sorted(prompts) == [
+            "mode",
+            "mode",
+            "port",
+            "port",
+            "token",
+            "var",
+        ]
+        assert "not valid: expected an int, got `http`" in (
+            capsys.readouterr().err
+        )
+
+        Envers().profile_load(profile=profile, spec="1.0", password=password)
+        with open(".env", "r") as f:
+            assert f.read() == (
+                "mode=dev\nport=8080\ntoken=secret\nvar=hello\n"
+            )
+
+    def test_agent_keeps_verified_keys(
+        self, spec_v1, capsys, monkeypatch
+    ) -> None:
+        """Test a wrong password (or an aborted prompt) is not kept."""
+        password = "Envers everywhere!"
+        keys: dict[str, bytes] = {}
+        monkeypatch.setattr(
+            agent, "get_key", lambda header: keys.get(header.salt.hex())
+        )
+        monkeypatch.setattr(
+            agent,
+            "add_key",
+            lambda header, key: keys.update({header.salt.hex(): key}),
+        )
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump({"version": "0.1", "releases": {"1.0": spec_v1}}, f)
+
+        self.envers.deploy(profile="base", spec="1.0", password=password)
+        added_keys = dict(keys)
+        assert len(added_keys) == 1
+
+        keys.clear()
+        with pytest.raises(typer.Exit):
+            Envers().profile_load(profile="base", spec="1.0", password="wrong")
+        assert keys == {}
+
+        def abort(message: str = "") -> str:
+            raise typer.Abort()
+
+        monkeypatch.setattr(crypt, "get_password", abort)
+        capsys.readouterr()
+        with pytest.raises(typer.Abort):
+            Envers().profile_load(profile="base", spec="1.0")
+        assert "not valid" not in capsys.readouterr().err
+
+        Envers().profile_load(profile="base", spec="1.0", password=password)
+        assert keys == added_keys
+
+        # the key of the agent is used without prompting
+        Envers().profile_load(profile="base", spec="1.0")
+
+    def test_deploy_invalid_kdf(self, spec_v1, capsys, monkeypatch) -> None:
+        """Test an invalid KDF variable is reported, without a traceback."""
+        monkeypatch.setenv("ENVERS_KDF_COST", "many")
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump({"version": "0.1", "releases": {"1.0": spec_v1}}, f)
+
+        with pytest.raises(typer.Exit):
+            self.envers.deploy(profile="base", spec="1.0", password="pass")
+        assert "`many` set by ENVERS_KDF_COST" in capsys.readouterr().err
+        assert not (Path(".envers") / "data" / "base.lock").exists()
+
+    def test_deploy_invalid_spec(self, spec_v1, capsys) -> None:
+        """Test a spec with an unknown type is not deployed."""
+        password = "Envers everywhere!"
+        spec_v1["spec"]["files"][".env"]["vars"]["port"] = {"type": "intger"}
+
+        with open(".envers/specs.yaml", "w") as f:
+            yaml.safe_dump({"version": "0.1", "releases": {"1.0": spec_v1}}, f)
+
+        with pytest.raises(typer.Exit):
+            self.envers.deploy(profile="base", spec="1.0", password=password)
+        assert (
+            "The spec of the variable `.env:port` is not valid: the type "
+            "`intger` is not known"
+        ) in capsys.readouterr().err
+        assert not (Path(".envers") / "data" / "base.lock").exists()
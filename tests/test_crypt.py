@@ -0,0 +1,194 @@
+"""Tests for the envers.crypt module."""
+
+from __future__ import annotations
+
+import os
+
+from typing import Iterator
+
+import pytest
+
+from cryptography.fernet import Fernet
+from envers import crypt, lockfile
+from envers.errors import InvalidOptionError
+
+
+@pytest.fixture(autouse=True)
+def clean_key_cache() -> Iterator[None]:
+    """Start and finish each test with an empty key cache."""
+    crypt.clear_key_cache()
+    yield
+    crypt.clear_key_cache()
+
+
+@pytest.fixture
+def derive_calls(monkeypatch: pytest.MonkeyPatch) -> list[bytes]:
+    """Record the salt of every real key derivation."""
+    calls: list[bytes] = []
+    derive_key = crypt._derive_key
+
+    def _derive_key(
+        password: str, salt: bytes, kdf_params: crypt.KDFParams
+    ) -> bytes:
+        calls.append(salt)
+        return derive_key(password, salt, kdf_params)
+
+    monkeypatch.setattr(crypt, "_derive_key", _derive_key)
+    return calls
+
+
+def test_roundtrip_reusing_salt(derive_calls: list[bytes]) -> None:
+    """Test a read-modify-write cycle derives the key only once."""
+    password = "Envers everywhere!"
+    encrypted = crypt.encrypt_data("hello", password)
+    salt = crypt.get_salt(encrypted)
+
+    assert crypt.decrypt_data(encrypted, password) == "hello"
+
+    reencrypted = crypt.encrypt_data("world", password, salt=salt)
+
+    assert crypt.get_salt(reencrypted) == salt
+    assert crypt.decrypt_data(reencrypted, password) == "world"
+    assert derive_calls == [salt]
+
+
+def test_key_cache_depends_on_password(derive_calls: list[bytes]) -> None:
+    """Test the cached key is not used for a different password."""
+    salt = crypt.generate_salt()
+
+    key = crypt.create_fernet_key("password1", salt)
+
+    assert crypt.create_fernet_key("password2", salt) != key
+    assert crypt.create_fernet_key("password1", salt) == key
+    assert len(derive_calls) == 2
+
+
+def test_key_cache_is_bounded(
+    monkeypatch: pytest.MonkeyPatch, derive_calls: list[bytes]
+) -> None:
+    """Test the least recently used keys are wiped and evicted."""
+    monkeypatch.setattr(crypt, "KEY_CACHE_SIZE", 2)
+    salts = [crypt.generate_salt() for _ in range(3)]
+
+    crypt.create_fernet_key("password", salts[0])
+    evicted_key = next(iter(crypt._key_cache.values()))
+
+    for salt in salts[1:]:
+        crypt.create_fernet_key("password", salt)
+
+    assert len(crypt._key_cache) == 2
+    assert evicted_key == bytearray(len(evicted_key))
+
+    crypt.create_fernet_key("password", salts[0])
+    assert derive_calls == [*salts, salts[0]]
+
+
+def test_clear_key_cache(derive_calls: list[bytes]) -> None:
+    """Test clear_key_cache forces a new key derivation."""
+    salt = crypt.generate_salt()
+
+    crypt.create_fernet_key("password", salt)
+    crypt.clear_key_cache()
+    crypt.create_fernet_key("password", salt)
+
+    assert len(crypt._key_cache) == 1
+    assert derive_calls == [salt, salt]
+
+
+def test_legacy_layout_is_readable() -> None:
+    """Test data without header is decrypted with the legacy KDF."""
+    password = "Envers everywhere!"
+    salt = crypt.generate_salt()
+    key = crypt.create_fernet_key(password, salt, crypt.LEGACY_KDF)
+    token = Fernet(key).encrypt(b"hello").decode("utf-8")
+
+    legacy_data = salt.hex() + token
+    header, _ = crypt.parse_header(legacy_data)
+
+    assert header.version == 0
+    assert header.kdf == crypt.LEGACY_KDF
+    assert crypt.decrypt_data(legacy_data, password) == "hello"
+
+
+@pytest.mark.parametrize(
+    "kdf_params",
+    [
+        crypt.KDFParams(crypt.KDF_PBKDF2, 1000),
+        crypt.KDFParams(crypt.KDF_SCRYPT, 2**10),
+    ],
+)
+def test_header_roundtrip(kdf_params: crypt.KDFParams) -> None:
+    """Test the header records the KDF used to encrypt the data."""
+    password = "Envers everywhere!"
+    encrypted = crypt.encrypt_data("hello", password, kdf_params=kdf_params)
+
+    assert encrypted.startswith(crypt.HEADER_PREFIX)
+
+    header, _ = crypt.parse_header(encrypted)
+
+    assert header.version == crypt.LOCK_FORMAT_VERSION
+    assert header.kdf == kdf_params
+    assert crypt.decrypt_data(encrypted, password) == "hello"
+
+
+def test_get_kdf_params_from_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the KDF parameters can be configured by the environment."""
+    monkeypatch.setenv("ENVERS_KDF", crypt.KDF_SCRYPT)
+    monkeypatch.setenv("ENVERS_KDF_COST", "1024")
+
+    assert crypt.get_kdf_params() == crypt.KDFParams(crypt.KDF_SCRYPT, 1024)
+
+    with pytest.raises(ValueError):
+        crypt.get_kdf_params(cost=1000)
+
+
+@pytest.mark.parametrize(
+    "name,value",
+    [
+        ("ENVERS_KDF", "argon2"),
+        ("ENVERS_KDF_COST", "many"),
+        ("ENVERS_KDF_COST", "0"),
+        ("ENVERS_KDF_COST", "1000"),
+    ],
+)
+def test_invalid_kdf_env(
+    monkeypatch: pytest.MonkeyPatch, name: str, value: str
+) -> None:
+    """Test an invalid KDF variable raises an error that names it."""
+    monkeypatch.setenv("ENVERS_KDF", crypt.KDF_SCRYPT)
+    monkeypatch.setenv(name, value)
+
+    with pytest.raises(InvalidOptionError, match=f"`{value}` set by {name}"):
+        lockfile.DataLock.create()
+
+
+def test_invalid_header() -> None:
+    """Test a corrupted header is rejected."""
+    with pytest.raises(ValueError):
+        crypt.parse_header(f"{crypt.HEADER_PREFIX}1$kdf=scrypt$token")
+
+    with pytest.raises(ValueError):
+        crypt.parse_header(f"{crypt.HEADER_PREFIX}9$kdf=x,salt=00$token")
+
+
+def test_get_profile_passwords(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the passwords are read from a file descriptor and the env."""
+    monkeypatch.setenv("ENVERS_PASSWORD", "default")
+    monkeypatch.setenv("ENVERS_PASSWORD_DEV_US", "dev")
+    monkeypatch.setenv("ENVERS_PASSWORD_PROD", "prod from env")
+
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"# comment\n\nprod=prod=from fd\n")
+    os.close(write_fd)
+    try:
+        passwords = crypt.get_profile_passwords(
+            ["dev-us", "prod", "staging"], read_fd
+        )
+    finally:
+        os.close(read_fd)
+
+    assert passwords == {
+        "dev-us": "dev",
+        "prod": "prod=from fd",
+        "staging": "default",
+    }
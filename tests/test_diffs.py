@@ -0,0 +1,66 @@
+"""Tests for the comparison of releases and profiles."""
+
+from __future__ import annotations
+
+import pytest
+
+from envers import diffs
+
+
+def test_parse_target() -> None:
+    """Test the targets with and without a profile."""
+    assert diffs.parse_target("1.4") == ("1.4", "")
+    assert diffs.parse_target("prod@1.4") == ("1.4", "prod")
+
+    with pytest.raises(ValueError):
+        diffs.parse_target("prod@")
+    with pytest.raises(ValueError):
+        diffs.parse_target("@1.4")
+
+
+def test_diff_specs() -> None:
+    """Test the added, removed and changed files and variables."""
+    old = {
+        ".env": {
+            "type": "dotenv",
+            "vars": {
+                "HOST": {"type": "string", "default": "localhost"},
+                "PORT": {"type": "string", "default": "80"},
+                "USER": {"type": "string"},
+            },
+        },
+        "old/.env": {"type": "dotenv", "vars": {}},
+    }
+    new = {
+        ".env": {
+            "type": "dotenv",
+            "vars": {
+                "HOST": {"type": "string", "default": "example.com"},
+                "PORT": {"type": "int", "default": "80"},
+                "PASSWORD": {"type": "string"},
+            },
+        },
+        "new/.env": {"type": "dotenv", "vars": {}},
+    }
+
+    assert [str(change) for change in diffs.diff_specs(old, new)] == [
+        "~ .env:HOST (default changed)",
+        "~ .env:PORT (type: string -> int)",
+        "- .env:USER",
+        "+ .env:PASSWORD",
+        "- old/.env",
+        "+ new/.env",
+    ]
+    assert list(diffs.diff_specs(old, old)) == []
+
+
+def test_diff_values_are_masked() -> None:
+    """Test the values are compared without being shown."""
+    old = {".env": {"vars": {"HOST": "localhost", "SECRET": "s3cret"}}}
+    new = {".env": {"vars": {"HOST": "localhost", "SECRET": "other"}}}
+
+    changes = list(diffs.diff_values(old, new))
+
+    assert changes == [diffs.Change("~", ".env:SECRET", "value changed")]
+    assert "s3cret" not in str(changes[0])
+    assert "other" not in str(changes[0])
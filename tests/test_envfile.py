@@ -0,0 +1,173 @@
+"""Tests for the envers.envfile module."""
+
+from __future__ import annotations
+
+import os
+
+from pathlib import Path
+
+import pytest
+
+from dotenv import dotenv_values
+from envers import envfile
+from envers.errors import InvalidOptionError
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("hello", "hello"),
+        ("", ""),
+        (None, ""),
+        (True, "True"),
+        (8080, "8080"),
+        ("postgres://user@host:5432/db", "postgres://user@host:5432/db"),
+        ("hello world", "'hello world'"),
+        ("pa$$word#1", "'pa$$word#1'"),
+        ("it's", '"it\'s"'),
+        ('C:\\path "x"', '"C:\\\\path \\"x\\""'),
+        ("line1\nline2", '"line1\\nline2"'),
+        ("${HOME}/x", "'${HOME}/x'"),
+        ("it's $HOME", "'it\\'s $HOME'"),
+        ("$a\\b\\", "'$a\\b\\\\'"),
+        ("$x\nline", "'$x\nline'"),
+    ],
+)
+def test_format_value(value: object, expected: str) -> None:
+    """Test the values are quoted only when needed."""
+    assert envfile.format_value(value) == expected
+
+
+def test_values_are_read_back(tmp_path: Path) -> None:
+    """Test python-dotenv reads back the values that were written."""
+    variables = {
+        "PLAIN": "hello",
+        "SPACES": " spaced value ",
+        "DOLLAR": "pa$$word#1",
+        "QUOTES": 'it\'s "quoted"',
+        "BACKSLASH": "C:\\path\\to",
+        "MULTILINE": "line1\nline2",
+        "UNICODE": "ção",
+    }
+    path = tmp_path / ".env"
+
+    envfile.write_dotenv(path, variables)
+
+    assert dotenv_values(path) == variables
+
+    # the values with `$` are read back by python-dotenv only without
+    # interpolation, which expands `${VAR}` even in single quotes
+    variables = {
+        "EXPANSION": "${HOME}/x",
+        "QUOTES": 'it\'s "${HOME}"',
+        "BACKSLASH": "$HOME\\",
+        "ESCAPES": "\\'$\\\\",
+        "MULTILINE": "$A\n${B}",
+    }
+
+    envfile.write_dotenv(path, variables)
+
+    assert dotenv_values(path, interpolate=False) == variables
+    assert dotenv_values(path)["EXPANSION"] != variables["EXPANSION"]
+
+
+def test_unchanged_file_is_not_written(tmp_path: Path) -> None:
+    """Test the file is not replaced when its content does not change."""
+    path = tmp_path / "nested" / ".env"
+
+    size = envfile.write_dotenv(path, {"A": "1", "B": "2"})
+
+    assert size == len("A=1\nB=2\n")
+    assert path.read_text() == "A=1\nB=2\n"
+
+    os.chmod(path, 0o640)
+    inode = path.stat().st_ino
+
+    assert envfile.write_dotenv(path, {"A": "1", "B": "2"}) == 0
+    assert path.stat().st_ino == inode
+
+    assert envfile.write_dotenv(path, {"A": "1", "B": "3"}) > 0
+    assert path.read_text() == "A=1\nB=3\n"
+    assert path.stat().st_ino != inode
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert os.listdir(path.parent) == [".env"]
+
+
+@pytest.mark.parametrize("jobs", [0, 1, 4])
+def test_write_files(tmp_path: Path, jobs: int) -> None:
+    """Test the results keep the files order, including the errors."""
+    (tmp_path / "dir.env").mkdir()
+    files = {
+        str(tmp_path / f"{idx}.env"): {"VAR": str(idx)} for idx in range(10)
+    }
+    files[str(tmp_path / "dir.env")] = {"VAR": "x"}
+    files[str(tmp_path / "last.env")] = {"VAR": "last"}
+
+    results = envfile.write_files(files, jobs)
+
+    assert [result.path for result in results] == list(files)
+    assert [bool(result.error) for result in results] == [False] * 10 + [
+        True,
+        False,
+    ]
+    assert (tmp_path / "9.env").read_text() == "VAR=9\n"
+    assert (tmp_path / "last.env").read_text() == "VAR=last\n"
+
+
+def test_write_files_created(tmp_path: Path) -> None:
+    """Test a new file is reported as created, even when it is empty."""
+    files = {str(tmp_path / "empty.env"): {}, str(tmp_path / ".env"): {"A": 1}}
+
+    results = envfile.write_files(files)
+    assert [(result.created, result.size) for result in results] == [
+        (True, 0),
+        (True, 4),
+    ]
+
+    results = envfile.write_files(files)
+    assert [(result.created, result.size) for result in results] == [
+        (False, 0),
+        (False, 0),
+    ]
+
+
+def test_expand_paths(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the paths and glob patterns are expanded once each."""
+    monkeypatch.chdir(tmp_path)
+    for path in ("b/.env", "a/.env", "a/deep/.env", ".env"):
+        os.makedirs(Path(path).parent, exist_ok=True)
+        Path(path).write_text("VAR=1\n")
+
+    assert envfile.expand_paths([".env", "*/.env", "a/.env"]) == [
+        ".env",
+        "a/.env",
+        "b/.env",
+    ]
+    assert envfile.expand_paths(["**/deep/.env"]) == ["a/deep/.env"]
+
+    with pytest.raises(FileNotFoundError, match="not found"):
+        envfile.expand_paths(["missing/.env"])
+    with pytest.raises(FileNotFoundError, match=r"No \.env file"):
+        envfile.expand_paths(["missing/*.env"])
+
+
+@pytest.mark.parametrize("jobs", [0, 1])
+def test_read_files(tmp_path: Path, jobs: int) -> None:
+    """Test the files are read in the order of the given paths."""
+    paths = []
+    for idx in range(5):
+        path = tmp_path / f"{idx}.env"
+        path.write_text(f"VAR={idx}\nQUOTED='multi\nline'\n")
+        paths.append(str(path))
+
+    assert envfile.read_files(paths, jobs) == [
+        {"VAR": str(idx), "QUOTED": "multi\nline"} for idx in range(5)
+    ]
+
+
+def test_negative_jobs(tmp_path: Path) -> None:
+    """Test a negative number of jobs raises a typed error."""
+    with pytest.raises(InvalidOptionError, match="jobs"):
+        envfile.write_files({str(tmp_path / ".env"): {"A": "1"}}, -1)
+    with pytest.raises(InvalidOptionError, match="jobs"):
+        envfile.read_files([], -2)
@@ -0,0 +1,58 @@
+"""Tests for the safe file writing functions."""
+
+from __future__ import annotations
+
+import threading
+import time
+
+from pathlib import Path
+
+import pytest
+
+from envers import files
+from envers.errors import ConflictError
+
+
+def test_atomic_write_keeps_mode(tmp_path: Path) -> None:
+    """Test the file is replaced, keeping the permissions of the target."""
+    path = tmp_path / "data.lock"
+    path.write_text("old")
+    path.chmod(0o600)
+
+    files.atomic_write(path, b"new")
+
+    assert path.read_bytes() == b"new"
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_file_lock_times_out(tmp_path: Path) -> None:
+    """Test a lock held by another writer raises a conflict."""
+    with files.file_lock(tmp_path):
+        with pytest.raises(ConflictError):
+            # another open file description, as in another process
+            with files.file_lock(tmp_path, timeout=0.1):
+                pass
+
+
+def test_file_lock_serializes_writers(tmp_path: Path) -> None:
+    """Test the writers wait for the lock instead of failing."""
+    events = []
+
+    def writer(name: str) -> None:
+        with files.file_lock(tmp_path, timeout=5):
+            events.append(f"{name} start")
+            time.sleep(0.05)
+            events.append(f"{name} end")
+
+    threads = [
+        threading.Thread(target=writer, args=(str(idx),)) for idx in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(events) == 6
+    for idx in range(0, 6, 2):
+        assert events[idx].split()[0] == events[idx + 1].split()[0]
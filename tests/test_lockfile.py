@@ -0,0 +1,288 @@
+"""Tests for the envers.lockfile module."""
+
+from __future__ import annotations
+
+import json
+
+from typing import Any
+
+import pytest
+import yaml
+
+from cryptography.fernet import InvalidToken
+from envers import crypt, lockfile, serialization
+
+
+@pytest.fixture
+def header() -> crypt.LockHeader:
+    """Return a header with a cheap KDF."""
+    return crypt.LockHeader(
+        crypt.KDFParams(crypt.KDF_PBKDF2, 1000), crypt.generate_salt()
+    )
+
+
+@pytest.fixture
+def key(header: crypt.LockHeader) -> bytes:
+    """Return the key for the header."""
+    return crypt.create_fernet_key("Envers!", header.salt, header.kdf)
+
+
+def test_roundtrip(header: crypt.LockHeader, key: bytes) -> None:
+    """Test the releases are stored in their own segments."""
+    data_lock = lockfile.DataLock(header)
+    data_lock.meta = {"version": "0.1"}
+    data_lock.set_release("1.0", {"data": {"var": "1"}})
+    data_lock.set_release("2.0", {"data": {"var": "2"}})
+
+    raw_data = data_lock.dumps(key)
+    header_line, index_line, body = raw_data.split("\n", 2)
+    index = json.loads(index_line)
+
+    assert header_line.startswith(f"{crypt.HEADER_PREFIX}2$")
+    assert list(index["releases"]) == ["1.0", "2.0"]
+
+    offset, length = index["releases"]["2.0"]
+    segment = body[offset : offset + length]
+    assert yaml.safe_load(crypt.decrypt_with_key(segment, key)) == {
+        "data": {"var": "2"}
+    }
+
+    loaded = lockfile.DataLock.loads(raw_data)
+    assert loaded.to_dict(key) == {
+        "version": "0.1",
+        "releases": {
+            "1.0": {"data": {"var": "1"}},
+            "2.0": {"data": {"var": "2"}},
+        },
+    }
+
+
+def test_only_requested_releases_are_decrypted(
+    header: crypt.LockHeader, key: bytes, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test reading or changing one release keeps the others encrypted."""
+    data_lock = lockfile.DataLock(header)
+    for version in ("1.0", "2.0", "3.0"):
+        data_lock.set_release(version, {"data": {"var": version}})
+    raw_data = data_lock.dumps(key)
+
+    decrypted: list[str] = []
+    decrypt_bytes = crypt.decrypt_bytes
+
+    def _decrypt_bytes(token: str, key: bytes) -> bytes:
+        decrypted.append(token)
+        return decrypt_bytes(token, key)
+
+    monkeypatch.setattr(crypt, "decrypt_bytes", _decrypt_bytes)
+
+    loaded = lockfile.DataLock.loads(raw_data)
+    assert loaded.to_dict(key, ["2.0"])["releases"] == {
+        "2.0": {"data": {"var": "2.0"}}
+    }
+    assert len(decrypted) == 1
+
+    loaded.set_release("2.0", {"data": {"var": "new"}})
+    new_raw_data = loaded.dumps(key)
+
+    old_segments = lockfile.DataLock.loads(raw_data)._segments
+    new_segments = lockfile.DataLock.loads(new_raw_data)._segments
+    assert old_segments["1.0"] == new_segments["1.0"]
+    assert old_segments["3.0"] == new_segments["3.0"]
+    assert old_segments["2.0"] != new_segments["2.0"]
+    assert len(decrypted) == 1
+
+
+def test_wrong_key(header: crypt.LockHeader, key: bytes) -> None:
+    """Test a wrong key is rejected before touching any segment."""
+    data_lock = lockfile.DataLock(header)
+    data_lock.set_release("1.0", {"data": {}})
+    loaded = lockfile.DataLock.loads(data_lock.dumps(key))
+
+    wrong_key = crypt.create_fernet_key("wrong", header.salt, header.kdf)
+
+    with pytest.raises(InvalidToken):
+        loaded.to_dict(wrong_key, releases=())
+
+    with pytest.raises(InvalidToken):
+        loaded.dumps(wrong_key)
+
+
+@pytest.mark.parametrize(
+    "version", [0, crypt.LOCK_FORMAT_VERSION], ids=["legacy", "single-token"]
+)
+def test_previous_layouts(version: int) -> None:
+    """Test the single token layouts are read and converted on write."""
+    header = crypt.LockHeader(crypt.LEGACY_KDF, crypt.generate_salt(), version)
+    key = crypt.create_fernet_key("Envers!", header.salt, header.kdf)
+
+    data = {"version": "0.1", "releases": {"1.0": {"data": {"var": "1"}}}}
+    token = crypt.encrypt_token(yaml.dump(data), key)
+    if version:
+        raw_data = header.dumps() + token
+    else:
+        raw_data = header.salt.hex() + token
+
+    data_lock = lockfile.DataLock.loads(raw_data)
+
+    assert data_lock.to_dict(key) == data
+
+    converted = lockfile.DataLock.loads(data_lock.dumps(key))
+
+    assert converted.header.version == crypt.LOCK_FORMAT_SEGMENTED
+    assert converted.to_dict(key) == data
+
+
+def test_payload_format_in_header(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the segments are decoded with the format in the header."""
+    monkeypatch.setenv("ENVERS_LOCK_COMPRESSION", "zlib")
+    data_lock = lockfile.DataLock.create(
+        crypt.KDFParams(crypt.KDF_PBKDF2, 1000), encoding="json"
+    )
+    key = crypt.create_fernet_key(
+        "Envers!", data_lock.header.salt, data_lock.header.kdf
+    )
+    data_lock.set_release("1.0", {"data": {"var": "1"}})
+
+    loaded = lockfile.DataLock.loads(data_lock.dumps(key))
+
+    assert loaded.header.encoding == "json"
+    assert loaded.header.compression == "zlib"
+    assert loaded.to_dict(key)["releases"] == {"1.0": {"data": {"var": "1"}}}
+
+
+def test_value_table(header: crypt.LockHeader, key: bytes) -> None:
+    """Test the values are stored once and the unused ones collected."""
+
+    def make_release(value: str) -> dict[str, Any]:
+        return {
+            "spec": {},
+            "data": {
+                "base": {
+                    "files": {
+                        ".env": {
+                            "type": "dotenv",
+                            "vars": {"CERT": "x" * 10_000, "VAR": value},
+                        }
+                    }
+                }
+            },
+        }
+
+    data_lock = lockfile.DataLock(header)
+    data_lock.set_release("1.0", make_release("1"))
+    data_lock.set_release("2.0", make_release("1"))
+    raw_data = data_lock.dumps(key)
+
+    loaded = lockfile.DataLock.loads(raw_data)
+    assert loaded.to_dict(key)["releases"] == {
+        "1.0": make_release("1"),
+        "2.0": make_release("1"),
+    }
+
+    # the releases store the hashes, and each value is stored once
+    segment = yaml.safe_load(
+        crypt.decrypt_with_key(loaded._segments["1.0"], key)
+    )
+    stored_vars = segment["data"]["base"]["files"][".env"]["vars"]
+    assert stored_vars == {
+        "CERT": serialization.hash_value(
+            "x" * 10_000, lockfile.VALUE_HASH_LENGTH
+        ),
+        "VAR": serialization.hash_value("1", lockfile.VALUE_HASH_LENGTH),
+    }
+    assert list(loaded._batches) == ["0"]
+    assert len(loaded._load_batch("0", key)) == 2
+    assert len(raw_data) < 2 * 10_000
+
+    loaded.set_release("2.0", make_release("2"))
+    loaded = lockfile.DataLock.loads(loaded.dumps(key))
+    assert loaded.collect_garbage(key) == 0
+
+    loaded.set_release("1.0", make_release("2"))
+    loaded = lockfile.DataLock.loads(loaded.dumps(key))
+    assert loaded.collect_garbage(key) == 1
+
+    loaded = lockfile.DataLock.loads(loaded.dumps(key))
+    assert (
+        sum(
+            len(loaded._load_batch(batch_id, key))
+            for batch_id in loaded._batches
+        )
+        == 2
+    )
+    assert loaded.get_release("1.0", key) == make_release("2")
+
+
+def test_value_batches(
+    header: crypt.LockHeader, key: bytes, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test a read decrypts only its batches and replaced ones are dropped."""
+
+    def make_release(value: str) -> dict[str, Any]:
+        return {
+            "data": {
+                "base": {
+                    "files": {".env": {"type": "dotenv", "vars": {"V": value}}}
+                }
+            }
+        }
+
+    data_lock = lockfile.DataLock(header)
+    data_lock.set_release("1.0", make_release("a"))
+    data_lock = lockfile.DataLock.loads(data_lock.dumps(key))
+    data_lock.set_release("2.0", make_release("b"))
+    raw_data = data_lock.dumps(key)
+
+    decrypted: list[str] = []
+    decrypt_bytes = crypt.decrypt_bytes
+
+    def _decrypt_bytes(token: str, key: bytes) -> bytes:
+        decrypted.append(token)
+        return decrypt_bytes(token, key)
+
+    monkeypatch.setattr(crypt, "decrypt_bytes", _decrypt_bytes)
+
+    loaded = lockfile.DataLock.loads(raw_data)
+    assert loaded._refs == {"1.0": ["0"], "2.0": ["1"]}
+    assert loaded.get_release("2.0", key) == make_release("b")
+    assert decrypted == [loaded._segments["2.0"], loaded._batches["1"]]
+
+    # the batch only used by the replaced release is dropped on write
+    replaced_batch = loaded._batches["1"]
+    loaded.set_release("2.0", make_release("c"))
+    new_raw_data = loaded.dumps(key)
+    assert replaced_batch not in new_raw_data
+
+    loaded = lockfile.DataLock.loads(new_raw_data)
+    assert loaded._refs == {"1.0": ["0"], "2.0": ["2"]}
+    assert loaded._load_batch("2", key) == {
+        serialization.hash_value("c", lockfile.VALUE_HASH_LENGTH): "c"
+    }
+    assert loaded.to_dict(key)["releases"] == {
+        "1.0": make_release("a"),
+        "2.0": make_release("c"),
+    }
+    assert loaded.collect_garbage(key) == 0
+
+
+def test_values_shared_across_releases(
+    header: crypt.LockHeader, key: bytes
+) -> None:
+    """Test a value of another release is reused by a later write."""
+    release = {
+        "data": {
+            "base": {
+                "files": {".env": {"type": "dotenv", "vars": {"E": "dev"}}}
+            }
+        }
+    }
+
+    data_lock = lockfile.DataLock(header)
+    data_lock.set_release("1.0", release)
+    data_lock = lockfile.DataLock.loads(data_lock.dumps(key))
+    data_lock.set_release("2.0", release)
+    data_lock = lockfile.DataLock.loads(data_lock.dumps(key))
+
+    assert data_lock._refs == {"1.0": ["0"], "2.0": ["0"]}
+    assert list(data_lock._batches) == ["0"]
+    assert data_lock.get_release("2.0", key) == release
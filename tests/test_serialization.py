@@ -0,0 +1,62 @@
+"""Tests for the envers.serialization module."""
+
+from __future__ import annotations
+
+import io
+
+import pytest
+
+from envers import serialization
+
+
+@pytest.mark.parametrize("accelerated", [True, False])
+def test_yaml_roundtrip(accelerated: bool) -> None:
+    """Test both YAML paths keep the keys order and the values."""
+    data = {"version": "0.1", "releases": {"2.0": {"b": 1, "a": [True]}}}
+
+    document = serialization.dumps_yaml(data, accelerated=accelerated)
+
+    assert document.index("2.0") < document.index("b:") < document.index("a:")
+    assert serialization.load_yaml(document, accelerated=accelerated) == data
+
+    stream = io.StringIO()
+    serialization.dump_yaml(data, stream, accelerated=accelerated)
+
+    assert stream.getvalue() == document
+
+
+def test_yaml_loader_is_safe() -> None:
+    """Test arbitrary Python objects are not constructed."""
+    with pytest.raises(Exception):
+        serialization.load_yaml("!!python/object/apply:os.system ['true']")
+
+
+@pytest.mark.parametrize("compression", serialization.PAYLOAD_COMPRESSIONS)
+@pytest.mark.parametrize("encoding", serialization.PAYLOAD_ENCODINGS)
+def test_payload_roundtrip(encoding: str, compression: str) -> None:
+    """Test all the payload formats restore the original data."""
+    optional_modules = {"msgpack": "msgpack", "zstd": "zstandard"}
+    for name in (encoding, compression):
+        if name in optional_modules:
+            pytest.importorskip(optional_modules[name])
+
+    data = {"spec": {"files": {".env": {"vars": {"B": 1, "A": "á"}}}}}
+
+    payload = serialization.encode_payload(data, encoding, compression)
+    decoded = serialization.decode_payload(payload, encoding, compression)
+
+    assert decoded == data
+    assert list(decoded["spec"]["files"][".env"]["vars"]) == ["B", "A"]
+
+
+def test_get_payload_format(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the payload format can be configured by the environment."""
+    assert serialization.get_payload_format() == ("json", "none")
+
+    monkeypatch.setenv("ENVERS_LOCK_ENCODING", "yaml")
+    monkeypatch.setenv("ENVERS_LOCK_COMPRESSION", "zlib")
+
+    assert serialization.get_payload_format() == ("yaml", "zlib")
+
+    with pytest.raises(ValueError):
+        serialization.get_payload_format(encoding="xml")
@@ -0,0 +1,206 @@
+"""Tests for the in-memory config server."""
+
+from __future__ import annotations
+
+import copy
+import json
+import socket
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import pytest
+import yaml
+
+from envers import server
+from envers.core import Envers
+
+PASSWORD = "Envers everywhere!"
+TOKEN = "secret-token"
+
+
+def make_release(value: str) -> dict[str, Any]:
+    """Return a release with one file and one variable."""
+    return {
+        "docs": "",
+        "status": "draft",
+        "profiles": ["base"],
+        "spec": {
+            "files": {
+                "app/.env": {
+                    "type": "dotenv",
+                    "vars": {"HOST": {"type": "string", "default": value}},
+                }
+            }
+        },
+    }
+
+
+def deploy(releases: dict[str, Any]) -> None:
+    """Write the specs with the given releases and deploy the last one."""
+    with open(".envers/specs.yaml", "w") as f:
+        yaml.safe_dump(
+            {"version": "0.1", "releases": copy.deepcopy(releases)}, f
+        )
+    Envers().deploy(profile="base", spec=list(releases)[-1], password=PASSWORD)
+
+
+@pytest.fixture
+def store(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> server.ConfigStore:
+    """Return a store serving the profile `base` with the release 1.0."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("ENVERS_AGENT_SOCK", raising=False)
+    Envers().init(Path("."))
+    deploy({"1.0": make_release("localhost")})
+
+    config_store = server.ConfigStore(tmp_path)
+    config_store.add("base", PASSWORD)
+    return config_store
+
+
+@pytest.fixture
+def http_server(store: server.ConfigStore) -> Iterator[str]:
+    """Run the server on a free port and return its URL."""
+    config_server = server.ConfigServer(store, TOKEN, interval=0.05)
+    thread = threading.Thread(
+        target=config_server.serve_forever, kwargs={"poll_interval": 0.05}
+    )
+    thread.start()
+
+    yield f"http://127.0.0.1:{config_server.server_address[1]}"
+
+    config_server.shutdown()
+    config_server.server_close()
+    thread.join()
+
+
+def get(
+    url: str, token: str = TOKEN, headers: Optional[dict[str, str]] = None
+) -> tuple[int, bytes]:
+    """Return the status and the content of a GET request."""
+    request = urllib.request.Request(
+        url, headers={"Authorization": f"Bearer {token}", **(headers or {})}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, b""
+
+
+def test_serve_files(http_server: str) -> None:
+    """Test the files are served as dotenv and as JSON."""
+    assert get(f"{http_server}/1.0/base/app/.env") == (
+        200,
+        b"HOST=localhost\n",
+    )
+    assert get(f"{http_server}/1.0/base/app/.env?format=json") == (
+        200,
+        b'{"HOST": "localhost"}',
+    )
+
+    status, content = get(f"{http_server}/1.0/base")
+    assert status == 200
+    assert json.loads(content) == {"app/.env": {"HOST": "localhost"}}
+
+    assert get(f"{http_server}/2.0/base/app/.env")[0] == 404
+    assert get(f"{http_server}/1.0/prod/app/.env")[0] == 404
+    assert get(f"{http_server}/1.0/base/missing/.env")[0] == 404
+
+
+def test_serve_requires_token_and_host(http_server: str) -> None:
+    """Test the requests without the token or from another host fail."""
+    url = f"{http_server}/1.0/base/app/.env"
+    port = http_server.rsplit(":", 1)[1]
+
+    assert get(url, token="")[0] == 401
+    assert get(url, token="wrong")[0] == 401
+    assert get(url, headers={"Host": f"evil.example:{port}"})[0] == 421
+    assert get(url, headers={"Host": f"localhost:{port}"})[0] == 200
+
+    with pytest.raises(ValueError):
+        server.ConfigServer(server.ConfigStore(), "")
+
+
+def test_store_keeps_only_the_key(store: server.ConfigStore) -> None:
+    """Test the password is not kept, and the keys are wiped on clear."""
+    served = store._profiles["base"]
+    assert not hasattr(served, "password")
+    key = served.key
+
+    store.clear()
+
+    assert store.profiles() == []
+    assert key == bytes(len(key))
+
+
+def test_reload_changed(store: server.ConfigStore) -> None:
+    """Test a profile is decrypted again when its data lock changes."""
+    assert store.reload_changed() == []
+
+    deploy(
+        {"1.0": make_release("localhost"), "2.0": make_release("example.com")}
+    )
+
+    assert store.reload_changed() == ["base"]
+    assert store.get_file("2.0", "base", "app/.env") == (
+        b"HOST=example.com\n",
+        b'{"HOST": "example.com"}',
+    )
+    assert store.reload_changed() == []
+
+
+def test_reload_keeps_content_on_error(
+    store: server.ConfigStore, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Test an unreadable data lock does not drop the served content."""
+    Path(".envers/data/base.lock").write_text("not a lock file")
+
+    assert store.reload_changed() == []
+    assert store.get_file("1.0", "base", "app/.env") is not None
+
+    # the error is only reported once for each change of the file
+    assert store.reload_changed() == []
+    assert len(caplog.records) == 1
+    assert "base not reloaded" in caplog.records[0].getMessage()
+
+    Path(".envers/data/base.lock").write_text("still not a lock file")
+    assert store.reload_changed() == []
+    assert len(caplog.records) == 2
+
+
+def test_unix_socket(store: server.ConfigStore) -> None:
+    """Test the server can listen on a Unix socket."""
+    # keep the socket path short, it is limited to ~100 characters
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = Path(tmp_dir) / "envers.sock"
+        config_server = server.UnixConfigServer(store, socket_path)
+        thread = threading.Thread(
+            target=config_server.serve_forever, kwargs={"poll_interval": 0.05}
+        )
+        thread.start()
+
+        try:
+            assert oct(socket_path.stat().st_mode & 0o777) == oct(0o600)
+
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(5)
+                client.connect(str(socket_path))
+                client.sendall(b"GET /1.0/base/app/.env HTTP/1.0\r\n\r\n")
+                response = b""
+                while chunk := client.recv(4096):
+                    response += chunk
+        finally:
+            config_server.shutdown()
+            config_server.server_close()
+            thread.join()
+
+        assert response.startswith(b"HTTP/1.0 200")
+        assert response.endswith(b"\r\n\r\nHOST=localhost\n")
+        assert not socket_path.exists()
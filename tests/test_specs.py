@@ -0,0 +1,218 @@
+"""Tests for the envers.specs module."""
+
+from __future__ import annotations
+
+import os
+
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from envers import serialization, specs
+from envers.errors import ConflictError
+
+
+@pytest.fixture
+def parse_calls(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """Record every YAML parsing done by the specs module."""
+    calls: list[str] = []
+    load_yaml = serialization.load_yaml
+
+    def _load_yaml(stream: str, accelerated: bool = True) -> Any:
+        calls.append(stream)
+        return load_yaml(stream, accelerated)
+
+    monkeypatch.setattr(serialization, "load_yaml", _load_yaml)
+    return calls
+
+
+def make_old(path: Path) -> None:
+    """Move the mtime of the file out of the racy window."""
+    mtime = path.stat().st_mtime - 10
+    os.utime(path, (mtime, mtime))
+
+
+def test_cache_is_used(tmp_path: Path, parse_calls: list[str]) -> None:
+    """Test the specs file is parsed only once while it does not change."""
+    path = tmp_path / "specs.yaml"
+    path.write_text("version: '0.1'\nreleases:\n  '1.0': {status: draft}\n")
+    make_old(path)
+
+    expected = {"version": "0.1", "releases": {"1.0": {"status": "draft"}}}
+
+    assert specs.SpecFile(path).load() == expected
+    assert specs.SpecFile(path).load() == expected
+    assert len(parse_calls) == 1
+    assert (tmp_path / "cache" / "specs.yaml.data").exists()
+    assert (tmp_path / "cache" / ".gitignore").read_text() == "*\n"
+
+
+def test_cache_is_invalidated(tmp_path: Path, parse_calls: list[str]) -> None:
+    """Test the cache is rebuilt when the content changes."""
+    path = tmp_path / "specs.yaml"
+    path.write_text("version: '0.1'\n")
+
+    assert specs.SpecFile(path).load() == {"version": "0.1"}
+
+    # same size and, possibly, the same mtime tick
+    path.write_text("version: '0.2'\n")
+
+    assert specs.SpecFile(path).load() == {"version": "0.2"}
+    assert len(parse_calls) == 2
+
+    # touching the file keeps the cache, since the hash does not change
+    os.utime(path)
+
+    assert specs.SpecFile(path).load() == {"version": "0.2"}
+    assert len(parse_calls) == 2
+
+
+def test_save_refreshes_cache(tmp_path: Path, parse_calls: list[str]) -> None:
+    """Test the data saved by envers does not need to be parsed again."""
+    path = tmp_path / "specs.yaml"
+    data = {"version": "0.1", "releases": {"1.0": {"status": "deployed"}}}
+
+    specs.SpecFile(path).save(data)
+
+    assert specs.SpecFile(path).load() == data
+    assert parse_calls == []
+
+
+def test_unsupported_values_are_not_cached(
+    tmp_path: Path, parse_calls: list[str]
+) -> None:
+    """Test specs with values not supported by marshal still work."""
+    path = tmp_path / "specs.yaml"
+    path.write_text("version: 2024-01-01\n")
+
+    spec_file = specs.SpecFile(path)
+
+    assert str(spec_file.load()["version"]) == "2024-01-01"
+    assert not spec_file._cache_path("data").exists()
+
+
+def test_cache_can_be_disabled(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test ENVERS_SPEC_CACHE=0 disables the cache."""
+    monkeypatch.setenv("ENVERS_SPEC_CACHE", "0")
+    path = tmp_path / "specs.yaml"
+    path.write_text("version: '0.1'\n")
+
+    assert specs.SpecFile(path).load() == {"version": "0.1"}
+    assert not (tmp_path / "cache").exists()
+
+
+def test_release_index(tmp_path: Path) -> None:
+    """Test each release is parsed alone from its byte range."""
+    path = tmp_path / "specs.yaml"
+    content = (Path(__file__).parent / "data" / "specs.yaml").read_text()
+    # a non-ASCII character shifts the byte offsets of the next releases
+    path.write_text(content.replace('docs: ""', 'docs: "çà"', 1))
+
+    spec_file = specs.SpecFile(path)
+    full_specs = serialization.load_yaml(path.read_text())
+
+    assert list(spec_file.release_index()["releases"]) == ["1.0", "2.0"]
+    assert spec_file.get_meta("version") == 0.1
+    assert spec_file.release_status("2.0") == "deployed"
+    assert spec_file.release_status("3.0") is None
+    assert spec_file.load_release("3.0") is None
+
+    for version in ("1.0", "2.0"):
+        release = full_specs["releases"][version]
+        assert spec_file.load_release(version) == release
+
+
+def test_load_release_with_aliases(tmp_path: Path) -> None:
+    """Test a release using an anchor of another release is still read."""
+    path = tmp_path / "specs.yaml"
+    path.write_text(
+        "version: '0.1'\n"
+        "releases:\n"
+        "  '1.0':\n"
+        "    status: deployed\n"
+        "    profiles: &profiles [base, prod]\n"
+        "    spec: &spec\n"
+        "      files:\n"
+        "        .env:\n"
+        "          vars:\n"
+        "            ENV: {type: string, default: dev}\n"
+        "  '2.0':\n"
+        "    status: draft\n"
+        "    profiles: *profiles\n"
+        "    spec: *spec\n"
+    )
+
+    spec_file = specs.SpecFile(path)
+    full_specs = serialization.load_yaml(path.read_text())
+
+    for version in ("1.0", "2.0"):
+        release = full_specs["releases"][version]
+        assert spec_file.load_release(version) == release
+    assert spec_file.release_status("2.0") == "draft"
+
+
+def test_set_status_in_place(tmp_path: Path) -> None:
+    """Test the status is patched without dumping the document again."""
+    path = tmp_path / "specs.yaml"
+    path.write_text(
+        "# comments are kept\n"
+        "version: '0.1'\n"
+        "releases:\n"
+        "  '1.0':\n"
+        "    status: draft  # é\n"
+        "    profiles: [base]\n"
+        "  '2.0':\n"
+        "    status: 'draft'\n"
+        "    profiles: [base]\n"
+        "  '3.0':\n"
+        "    profiles: [base]\n"
+    )
+
+    spec_file = specs.SpecFile(path)
+    spec_file.set_status("1.0", "deployed")
+    spec_file.set_status("2.0", "cancelled")
+
+    content = path.read_text()
+
+    assert content.startswith("# comments are kept\n")
+    assert "    status: deployed  # é\n" in content
+    assert "    status: cancelled\n" in content
+    assert spec_file.release_status("1.0") == "deployed"
+    assert spec_file.load_release("2.0") == {
+        "status": "cancelled",
+        "profiles": ["base"],
+    }
+
+    assert spec_file.release_index() == specs.build_release_index(content)
+
+    # without a status the document is dumped again
+    spec_file.set_status("3.0", "deployed")
+
+    assert spec_file.load()["releases"] == {
+        "1.0": {"status": "deployed", "profiles": ["base"]},
+        "2.0": {"status": "cancelled", "profiles": ["base"]},
+        "3.0": {"profiles": ["base"], "status": "deployed"},
+    }
+    assert spec_file.release_index() == specs.build_release_index(
+        path.read_text()
+    )
+
+
+def test_save_detects_conflicts(tmp_path: Path) -> None:
+    """Test a specs file changed since it was loaded is not overwritten."""
+    path = tmp_path / "specs.yaml"
+    path.write_text("version: '0.1'\nreleases: {}\n")
+
+    spec_file = specs.SpecFile(path)
+    data = spec_file.load()
+
+    other = specs.SpecFile(path)
+    other.save({**other.load(), "releases": {"1.0": {"status": "draft"}}})
+
+    with pytest.raises(ConflictError):
+        spec_file.save(data)
+
+    assert "1.0" in specs.SpecFile(path).load()["releases"]
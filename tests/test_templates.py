@@ -0,0 +1,81 @@
+"""Tests for the interpolation of the variable values."""
+
+from __future__ import annotations
+
+import pytest
+
+from envers import templates
+from envers.errors import TemplateError
+
+
+def test_render_files() -> None:
+    """Test the references in the same file and across files."""
+    files = {
+        "db/.env": {"HOST": "db.local", "PORT": 5432, "DEBUG": True},
+        "app/.env": {
+            "DB_URL": "postgres://{{ db/.env:HOST }}:{{db/.env:PORT}}/app",
+            "NAME": "app",
+            "TITLE": "{{ NAME }} ({{ DB_URL }})",
+            "RAW": r"\{\{ NAME \}\}",
+            "BRACES": "{{ not a reference }}",
+        },
+    }
+
+    assert templates.render_files(files) == {
+        "db/.env": {"HOST": "db.local", "PORT": 5432, "DEBUG": True},
+        "app/.env": {
+            "DB_URL": "postgres://db.local:5432/app",
+            "NAME": "app",
+            "TITLE": "app (postgres://db.local:5432/app)",
+            "RAW": "{{ NAME }}",
+            "BRACES": "{{ not a reference }}",
+        },
+    }
+
+
+def test_undefined_reference() -> None:
+    """Test a reference to an undefined variable is an error."""
+    with pytest.raises(TemplateError, match=r"\.env:A references \.env:B"):
+        templates.render_files({".env": {"A": "{{ B }}"}})
+
+    with pytest.raises(TemplateError, match=r"other/\.env:A, which is not"):
+        templates.render_files({".env": {"A": "{{ other/.env:A }}"}})
+
+
+def test_cycle() -> None:
+    """Test the references making a cycle are reported."""
+    files = {
+        ".env": {"A": "{{ B }}", "B": "x{{ b/.env:C }}", "D": "{{ A }}"},
+        "b/.env": {"C": "{{ .env:A }}"},
+    }
+
+    with pytest.raises(TemplateError) as error:
+        templates.render_files(files)
+
+    assert str(error.value) == (
+        "The references make a cycle: .env:A -> .env:B -> b/.env:C -> .env:A"
+    )
+
+
+def test_long_chain() -> None:
+    """Test a long chain of references is rendered without recursion."""
+    size = 5000
+    variables = {f"V{idx}": f"{{{{ V{idx + 1} }}}}" for idx in range(size)}
+    variables[f"V{size}"] = "end"
+
+    rendered = templates.render_files({".env": variables})
+
+    assert set(rendered[".env"].values()) == {"end"}
+
+
+def test_compiled_templates_are_cached() -> None:
+    """Test each value is compiled once."""
+    templates.compile_template.cache_clear()
+
+    for _ in range(3):
+        templates.render_files({".env": {"A": "a", "B": "{{ A }}"}})
+
+    info = templates.compile_template.cache_info()
+    assert (info.misses, info.hits) == (2, 4)
+    assert templates.has_references("{{ A }}")
+    assert not templates.has_references(r"\{\{ A \}\}")
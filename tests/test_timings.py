@@ -0,0 +1,68 @@
+"""Tests for the timing of the command phases."""
+
+from __future__ import annotations
+
+import json
+import pstats
+
+from pathlib import Path
+
+from envers import crypt, timings
+
+
+def test_spans_are_only_recorded_when_enabled() -> None:
+    """Test the spans are added up by name while the timings run."""
+    totals = timings.get_totals()
+    with timings.span("parse"):
+        pass
+    assert timings.get_totals() == totals
+
+    lines: list[str] = []
+    with timings.run(True, lines.append, profile_path=""):
+        with timings.span("parse"):
+            # a nested span with the same name is counted once
+            with timings.span("parse"):
+                pass
+        with timings.span("parse"):
+            pass
+        crypt.create_fernet_key("Envers!", crypt.generate_salt())
+
+    totals = timings.get_totals()
+    assert totals["parse"][1] == 2
+    assert totals["kdf"][1] == 1
+    assert lines[0].startswith("total")
+    assert {line.split()[0] for line in lines} == {"total", "parse", "kdf"}
+
+    with timings.span("dump"):
+        pass
+    assert timings.get_totals() == totals
+
+
+def test_trace_records(tmp_path: Path) -> None:
+    """Test a JSON line is written for each span."""
+    trace_path = tmp_path / "trace.jsonl"
+
+    with timings.run(profile_path=str(trace_path)):
+        with timings.span("decrypt"):
+            pass
+        with timings.span("write"):
+            pass
+
+    records = [
+        json.loads(line) for line in trace_path.read_text().splitlines()
+    ]
+    assert [record["name"] for record in records] == ["decrypt", "write"]
+    assert all(record["duration"] >= 0 for record in records)
+
+
+def test_cprofile_dump(tmp_path: Path) -> None:
+    """Test the run is profiled with cProfile for the other paths."""
+    profile_path = tmp_path / "envers.prof"
+
+    with timings.run(profile_path=str(profile_path)):
+        crypt.encrypt_token("data", crypt.create_fernet_key("x", b"0" * 16))
+
+    stats = pstats.Stats(str(profile_path))
+    assert any(
+        function_name == "encrypt_bytes" for _, _, function_name in stats.stats
+    )
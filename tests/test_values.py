@@ -0,0 +1,155 @@
+"""Tests for the parsing and validation of the profile values."""
+
+from __future__ import annotations
+
+import copy
+
+from typing import Any
+
+import pytest
+
+from envers import values
+from envers.errors import InvalidSpecError
+
+
+@pytest.mark.parametrize(
+    "content,value_format",
+    [
+        ("HOST=localhost\nPORT='8080'\n# comment\n", "dotenv"),
+        ('{"HOST": "localhost", "PORT": "8080"}', "json"),
+        ("HOST: localhost\nPORT: '8080'\n", "yaml"),
+    ],
+)
+def test_parse_values(content: str, value_format: str) -> None:
+    """Test the values are parsed from the supported formats."""
+    assert values.parse_values(content, value_format) == {
+        "HOST": "localhost",
+        "PORT": "8080",
+    }
+
+
+def test_parse_values_errors() -> None:
+    """Test the documents that are not mappings are rejected."""
+    with pytest.raises(ValueError):
+        values.parse_values("[1, 2]", "json")
+
+    with pytest.raises(ValueError):
+        values.parse_values("a: 1", "toml")
+
+
+def test_parse_assignments() -> None:
+    """Test NAME=value arguments, where the value can have `=`."""
+    assert values.parse_assignments(["A=1", "B=x=y", "C="]) == {
+        "A": "1",
+        "B": "x=y",
+        "C": "",
+    }
+
+    with pytest.raises(ValueError):
+        values.parse_assignments(["A"])
+
+
+def test_detect_format() -> None:
+    """Test the format is detected by the file extension."""
+    assert values.detect_format("values.json") == "json"
+    assert values.detect_format("values.YML") == "yaml"
+    assert values.detect_format(".env.prod") == "dotenv"
+
+
+@pytest.mark.parametrize(
+    "value,var_type,valid",
+    [
+        ("abc", "string", True),
+        (8080, "int", True),
+        ("-1", "int", True),
+        ("8080a", "int", False),
+        (True, "int", False),
+        ("yes", "bool", True),
+        (False, "bool", True),
+        ("maybe", "bool", False),
+        (["a"], "string", False),
+    ],
+)
+def test_validate_value(value: Any, var_type: str, valid: bool) -> None:
+    """Test the values are checked against the type of the variable."""
+    error = values.validate_value(value, {"type": var_type})
+    assert (error is None) == valid
+
+
+@pytest.mark.parametrize(
+    "value,var_spec,valid",
+    [
+        ("", {"type": "int"}, True),
+        ("", {"type": "string", "required": True}, False),
+        ("x", {"type": "string", "required": True}, True),
+        ("1.5", {"type": "float"}, True),
+        ("1.5.0", {"type": "float"}, False),
+        ("ab-12", {"pattern": r"[a-z]+-\d+"}, True),
+        ("ab-12x", {"pattern": r"[a-z]+-\d+"}, False),
+        ("prod", {"choices": ["dev", "prod"]}, True),
+        ("test", {"choices": ["dev", "prod"]}, False),
+        ("8080", {"type": "int", "min": 1, "max": 65535}, True),
+        ("0", {"type": "int", "min": 1, "max": 65535}, False),
+        ("abc", {"type": "string", "min": 4}, False),
+        ("{{ OTHER }}", {"type": "int", "choices": [1]}, True),
+    ],
+)
+def test_compile_validator(
+    value: Any, var_spec: dict[str, Any], valid: bool
+) -> None:
+    """Test the values are checked against every rule of the variable."""
+    error = values.compile_validator(var_spec)(value)
+    assert (error is None) == valid
+
+
+@pytest.mark.parametrize(
+    "var_spec,reason",
+    [
+        ({"type": "intger"}, "the type `intger` is not known"),
+        ({"pattern": "["}, "the pattern `[` is not valid"),
+        ({"choices": "dev"}, "`choices` should be a list"),
+        ({"type": "int", "min": "one"}, "`min` and `max` should be numbers"),
+    ],
+)
+def test_compile_validator_invalid_spec(
+    var_spec: dict[str, Any], reason: str
+) -> None:
+    """Test a definition that cannot be compiled names the variable."""
+    with pytest.raises(InvalidSpecError) as exc_info:
+        values.compile_validator(var_spec, ".env:PORT")
+    assert str(exc_info.value).startswith(
+        f"The spec of the variable `.env:PORT` is not valid: {reason}"
+    )
+
+    with pytest.raises(InvalidSpecError, match=r"`\.env:PORT`"):
+        values.compile_spec({".env": {"vars": {"PORT": var_spec}}})
+
+
+def test_validate_profiles() -> None:
+    """Test all the violations of all the profiles are reported."""
+    spec_files = {
+        ".env": {
+            "vars": {
+                "PORT": {"type": "int"},
+                "MODE": {"choices": ["dev", "prod"]},
+            }
+        }
+    }
+    release_data = {
+        profile: {"files": {".env": {"vars": {"PORT": port, "MODE": mode}}}}
+        for profile, port, mode in [
+            ("base", "80", "dev"),
+            ("prod", "http", "test"),
+            ("dev", "x", "dev"),
+        ]
+    }
+
+    assert values.validate_profiles(spec_files, release_data) == [
+        "prod: .env: PORT: expected an int, got `http`",
+        "prod: .env: MODE: expected one of dev, prod, got `test`",
+        "dev: .env: PORT: expected an int, got `x`",
+    ]
+    # the validators are compiled once for the same spec
+    assert values.compile_spec(spec_files) is values.compile_spec(
+        copy.deepcopy(spec_files)
+    )